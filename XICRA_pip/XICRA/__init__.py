@@ -7,6 +7,8 @@
 ## version will be retrieve from setup.py
 
 
+import importlib
+
 __all__ = [
 	'modules',
 	'scripts',
@@ -14,5 +16,10 @@ __all__ = [
 	'other_tools'
 ]
 
-from XICRA import *
+## subpackages are imported when first used (e.g. XICRA.scripts): importing
+## the package does not load every module and its dependencies
+def __getattr__(name):
+	if name in __all__:
+		return importlib.import_module(__name__ + '.' + name)
+	raise AttributeError("module %r has no attribute %r" %(__name__, name))
 
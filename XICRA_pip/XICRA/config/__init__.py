@@ -1,7 +1,14 @@
+import importlib
+
 __all__ = [
 	'extern_progs',
 	'set_config'	
 ]
 
-from XICRA.config import *
+## modules are imported when first used (e.g. XICRA.config.module): importing
+## the package does not load every module and its dependencies
+def __getattr__(name):
+	if name in __all__:
+		return importlib.import_module(__name__ + '.' + name)
+	raise AttributeError("module %r has no attribute %r" %(__name__, name))
 
@@ -11,7 +11,11 @@ import os
 import io
 import sys
 import re
+import json
+import time
 import shutil
+import signal
+import concurrent.futures
 from io import open
 from sys import argv
 import subprocess
@@ -27,12 +31,141 @@ from XICRA.config import extern_progs
 ## Software
 ################
 
+## executables and versions resolved within this run (in memory) and
+## persisted within the project folder for later runs
+tools_cache_name = '.XICRA_tools.json'
+_tools = {}
+_versions = {}
+_stored = {'tools': {}, 'versions': {}}
+_tools_file = None
+
+## software and packages checked at the same time by XICRA config
+probe_threads = 8
+
+##################
+def _stat_key(path):
+	"""Returns modification time and inode for the path given or None if not available."""
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return (None)
+	return ([stat.st_mtime, stat.st_ino])
+
+##################
+def _candidates(exe):
+	"""Returns list of candidates (path, mtime and inode) for the executable given in ``$PATH``."""
+	paths = my_which(exe) or []
+	if isinstance(paths, str):
+		paths = [paths]
+	return ([ [path] + (_stat_key(path) or [None, None]) for path in paths ])
+
+##################
+def _exe_name(prog):
+	"""Returns executable name for the program: environment variable or default."""
+	if prog in os.environ:
+		return (os.environ[prog]) ## python environent variables
+	return (extern_progs.return_defatult_soft(prog)) ## install in the system
+
+##################
+def init_tools(folder, progs=(), refresh=False, Debug=False):
+	"""
+	Sets the project folder to store executables resolved and retrieves the programs given.
+
+	Executables (and versions) resolved in previous runs or checked by ``XICRA config`` (see
+	:func:`read_manifest`) are reused if ``$PATH`` and the
+	modification time and inode of each candidate executable did not change. Programs given
+	not resolved previously are resolved in parallel. Later calls to :func:`get_exe` use
+	results in memory.
+
+	:param folder: Project folder.
+	:param progs: Programs required (e.g. cutadapt, multiqc).
+	:param refresh: True/False to discard executables resolved in previous runs.
+	:param Debug: True/False for debugging messages.
+	"""
+	global _tools_file
+	_tools_file = os.path.join(folder, tools_cache_name)
+	_tools.clear()
+	_versions.clear()
+	_stored['tools'] = {}
+	_stored['versions'] = {}
+
+	## software checked by XICRA config and then by previous runs for the project
+	if not refresh:
+		manifest = read_manifest()
+		_stored['tools'] = dict([ (prog, entry) for prog, entry in manifest.get('software', {}).items() if entry.get('status') == 'OK' ])
+		_versions.update(manifest.get('versions', {}))
+
+	if not refresh and os.path.isfile(_tools_file):
+		try:
+			with open(_tools_file) as in_handle:
+				stored = json.load(in_handle)
+			_stored['tools'].update(stored.get('tools', {}))
+			_versions.update(stored.get('versions', {}))
+		except ValueError:
+			pass
+
+	## resolve programs at the same time: version commands might take long (e.g. java)
+	pending = [ prog for prog in dict.fromkeys(progs) if not _lookup(prog) ]
+	if pending:
+		if Debug:
+			print (colored("** Debug: resolve software: %s" %", ".join(pending), 'yellow'))
+		with concurrent.futures.ThreadPoolExecutor(max_workers=len(pending)) as executor:
+			resolved = list(executor.map(lambda prog: resolve_exe(prog, Debug), pending))
+		for prog, result in zip(pending, resolved):
+			## errors are reported when the program is requested
+			if not result[2]:
+				_tools[prog] = result
+	_save_tools()
+
+##################
+def _lookup(prog):
+	"""Returns executable resolved for the program (path, version, error) or None if not available or changed."""
+	if prog in _tools:
+		return (_tools[prog])
+
+	stored = _stored['tools'].get(prog)
+	if not stored:
+		return (None)
+	exe = _exe_name(prog)
+	if stored['PATH'] != os.environ.get('PATH') or stored['exe'] != exe or stored['candidates'] != _candidates(exe):
+		return (None)
+
+	_tools[prog] = (stored['path'], stored['version'], None)
+	return (_tools[prog])
+
+##################
+def _tool_entry(prog, path, version):
+	"""Returns dictionary to store the executable resolved: validated using ``$PATH`` and candidates."""
+	exe = _exe_name(prog)
+	return ({'PATH': os.environ.get('PATH'), 'exe': exe, 'candidates': _candidates(exe), 
+			 'path': path, 'version': version})
+
+##################
+def _save_tools():
+	"""Writes executables resolved and versions within the project folder, if set."""
+	if not _tools_file or not os.path.isdir(os.path.dirname(_tools_file)):
+		return
+	tools = dict(_stored['tools'])
+	for prog, (path, version, error) in list(_tools.items()):
+		tools[prog] = _tool_entry(prog, path, version)
+	_stored['tools'] = tools
+
+	tmp_file = '%s.%s.tmp' %(_tools_file, os.getpid())
+	try:
+		with open(tmp_file, 'w') as out_handle:
+			json.dump({'tools': tools, 'versions': dict(_versions)}, out_handle, indent=1)
+		os.replace(tmp_file, _tools_file)
+	except OSError:
+		pass
+
 ##################
 def get_exe(prog, Debug=False, Return_Version=False):
 	"""Return absolute path of the executable program requested.
 
 	Given a program name it returns its executable to be called. It has to fulfilled a minimum version specified.
 
+	Executables are resolved once for each run (see :func:`XICRA.config.set_config.init_tools`).
+
 	:param prog: Software name
 	:type prog: string
 	:returns: Absolute path for the executable requested
@@ -45,14 +178,36 @@ def get_exe(prog, Debug=False, Return_Version=False):
 		Give them credit accordingly.
 
 	"""
-	exe = ""
-	if prog in os.environ: 
-		exe = os.environ[env_var] ## python environent variables
+	resolved = _lookup(prog)
+	if not resolved:
+		resolved = resolve_exe(prog, Debug)
+		if not resolved[2]:
+			_tools[prog] = resolved
+			_save_tools()
+
+	(exe_path, prog_ver, error) = resolved
+	if error:
+		print(colored(error,'red'))
+		exit()
+
+	if (Return_Version):
+		return (exe_path, prog_ver)
 	else:
-		exe = extern_progs.return_defatult_soft(prog) ## install in the system
+		return (exe_path)
+
+##################
+def resolve_exe(prog, Debug=False, timeout=None):
+	"""
+	Resolves the executable for the program requested within ``$PATH`` fulfilling the minimum version.
+
+	:param prog: Software name
+	:param timeout: Seconds to wait for each version command (see :func:`get_version`).
+	:returns: Tuple containing absolute path, version and error message (None if resolved).
+	"""
+	exe = _exe_name(prog)
 
 	## get paths
-	exe_path_tmp = my_which(exe)
+	exe_path_tmp = [ candidate[0] for candidate in _candidates(exe) ]
 
 	## debug message
 	if (Debug):
@@ -66,30 +221,17 @@ def get_exe(prog, Debug=False, Return_Version=False):
 	if (Debug):
 		print(colored("** Debug: min_version: %s" %min_version,'yellow'))
 
-	## return if not available
+	## not installed in path
+	if len(exe_path_tmp) == 0:
+		return ('ERROR', 'n.a.', "\n**ERROR: Software %s could not be found." % prog)
+
 	## no min version available
 	if min_version == 'na':
-		if exe_path_tmp:
-			if (Return_Version):
-				return (exe_path_tmp[0], '') ## return first item
-			else:
-				return (exe_path_tmp[0]) ## return first item
-	
-	## not installed in path
-	if exe_path_tmp is None or len(exe_path_tmp) == 0:
-		if (Return_Version):
-			print(colored("\n**ERROR: Software %s could not be found." % prog,'red'))
-			exit()
-			return('ERROR', 'n.a.')
-		else:
-			print(colored("\n**ERROR: Software %s could not be found." % prog,'red'))
-			exit()
-			return('ERROR')
-		
+		return (exe_path_tmp[0], '', None) ## return first item
 
 	## Loop for all possibilities
 	for p in exe_path_tmp:
-		prog_ver = get_version(prog, p, Debug=Debug)
+		prog_ver = get_version(prog, p, Debug=Debug, timeout=timeout)
 
 		if (Debug):
 			print (colored("** Debug: Software: %s\nPath: %s\nVersion: %s" %(prog, p, prog_ver), 'yellow'))
@@ -98,14 +240,9 @@ def get_exe(prog, Debug=False, Return_Version=False):
 			continue
 
 		if LooseVersion(prog_ver) >= LooseVersion(min_version):
-			if (Return_Version):
-				return (p, prog_ver)
-			else:
-				return (p)
-
+			return (p, prog_ver, None)
 
-	print(colored("\n**ERROR: Software %s version smaller than minimum version expected %s." %(prog,min_version),'red'))
-	exit()
+	return ('ERROR', 'n.a.', "\n**ERROR: Software %s version smaller than minimum version expected %s." %(prog,min_version))
 
 ################
 def access_check(fn, mode=os.F_OK | os.X_OK):
@@ -224,7 +361,7 @@ def my_which(cmd):
 		return None
 
 ##################
-def get_version(prog, path, Debug=False):
+def get_version(prog, path, Debug=False, timeout=None):
 	"""Get version of software
 
 	Given a program name and expected path, tries to determine its version.
@@ -232,10 +369,12 @@ def get_version(prog, path, Debug=False):
 	:param prog: Program name
 	:param path: Absolute path
 	:param Debug: True/False
+	:param timeout: Seconds to wait for the version command (raises subprocess.TimeoutExpired).
 
 	:type prog: string
 	:type path: string 
 	:type Debug: bool
+	:type timeout: int
 
 	:returns: String containing version. Returns NA message if no found and raises attention error message.
 
@@ -246,6 +385,12 @@ def get_version(prog, path, Debug=False):
 		Give them credit accordingly.
 	"""
 
+	## version retrieved previously for the same executable
+	stat_key = _stat_key(path)
+	version_key = '%s\t%s\t%s' %(prog, path, stat_key)
+	if stat_key and version_key in _versions:
+		return (_versions[version_key])
+
 	## read dependencies information
 	dependencies_pd = extern_progs.read_dependencies()
 
@@ -261,10 +406,16 @@ def get_version(prog, path, Debug=False):
 
 	if prog == 'sRNAbench' or prog == "miraligner":
 		java_bin = get_exe('java', Debug=Debug)
-		java_jar = java_bin + ' -jar ' + path + ' ' + args
-		cmd_output = subprocess.Popen(java_jar, shell=True, stdout=subprocess.PIPE,stderr=subprocess.PIPE).communicate()
-	else:
-		cmd_output = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
+		cmd = java_bin + ' -jar ' + path + ' ' + args
+
+	## the whole process group is killed if it does not finish on time (e.g. JVM started by the shell)
+	process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+	try:
+		cmd_output = process.communicate(timeout=timeout)
+	except subprocess.TimeoutExpired:
+		os.killpg(process.pid, signal.SIGKILL)
+		process.communicate()
+		raise
 
 	## decode command
 	cmd_output = functions.main_functions.decode(cmd_output[0]).split('\n')[:-1] + functions.main_functions.decode(cmd_output[1]).split('\n')[:-1]
@@ -279,73 +430,193 @@ def get_version(prog, path, Debug=False):
 		if (Debug):
 			print (hits)
 		if hits:
-			return hits.group(1)
+			version = hits.group(1)
+			break
+	else:
+		if Debug:
+			print (colored('Attention: I tried to get the version of ' + prog + ' with: "' + cmd + '" and the output didn\'t match this regular expression: "' + regex.pattern + '"', 'red'))
+		version = "n.a."
 
-	if Debug:
-		print (colored('Attention: I tried to get the version of ' + prog + ' with: "' + cmd + '" and the output didn\'t match this regular expression: "' + regex.pattern + '"', 'red'))
+	if stat_key:
+		_versions[version_key] = version
+	return(version)
 
-	return("n.a.")
+##################
+def probe_software(prog, Debug=False, timeout=None):
+	"""
+	Checks whether the software given is installed fulfilling the minimum version.
 
-def check_dependencies(Debug):
+	:param prog: Software name
+	:param Debug: True/False for debugging messages
+	:param timeout: Seconds to wait for each version command.
+
+	:returns: Dictionary containing path, version, min_version and status (OK, FAILED, NOT FOUND or TIMEOUT). 
+	 Software installed also contains information to validate it later (see :func:`init_tools`).
+	"""
+	min_version = extern_progs.return_min_version_soft(prog)
+	result = {'path': None, 'version': 'n.a.', 'min_version': min_version}
+	try:
+		(path, version, error) = resolve_exe(prog, Debug, timeout)
+	except subprocess.TimeoutExpired:
+		result['status'] = 'TIMEOUT'
+		return (result)
+	except SystemExit:
+		## java not available for java software
+		result['status'] = 'NOT FOUND'
+		return (result)
+
+	if not error:
+		_tools[prog] = (path, version, None)
+		result.update(_tool_entry(prog, path, version))
+		result['status'] = 'OK'
+		return (result)
+
+	## version installed, if any
+	candidates = _candidates(_exe_name(prog))
+	if not candidates:
+		result['status'] = 'NOT FOUND'
+		return (result)
+	
+	result['path'] = candidates[0][0]
+	try:
+		result['version'] = get_version(prog, candidates[0][0], Debug, timeout)
+	except subprocess.TimeoutExpired:
+		result['status'] = 'TIMEOUT'
+		return (result)
+	result['status'] = 'FAILED' if result['version'] != 'n.a.' else 'NOT FOUND'
+	return (result)
+
+##################
+def _run_parallel(function, items, timeout, *args):
+	"""
+	Calls function for each item at the same time using threads.
+
+	:returns: Dictionary containing results for each item or None if not finished within the timeout given.
+	"""
+	results = dict([ (item, None) for item in items ])
+	if not results:
+		return (results)
+
+	executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(len(results), probe_threads))
+	futures = dict([ (executor.submit(function, item, *args), item) for item in results ])
+	## version commands have their own timeout: wait a little longer for them
+	(done, not_done) = concurrent.futures.wait(futures, timeout=(timeout * 2 if timeout else None))
+	for future in done:
+		results[futures[future]] = future.result()
+	executor.shutdown(wait=False)
+	return (results)
+
+##################
+def check_dependencies(Debug, timeout=None):
 	"""
 	Check if available the different software required for ``XICRA`` execution.
 	
 	Using the function :func:`XICRA.config.extern_progs.read_dependencies` the 
 	information for all the dependencies is retrieved from file :file:`XICRA/config/software/dependencies.csv`.
 	
-	For each software, the function :func:`XICRA.config.set_config.get_exe` retrieves
-	whether it is installed in the system or not and its version and it is check using 
-	:func:`XICRA.config.set_config.check_install`. 
+	Each software is checked at the same time using :func:`XICRA.config.set_config.probe_software`
+	and it is reported using :func:`XICRA.config.set_config.check_install_module`. 
 	
 	:param Debug: True/False for debugging messages 
+	:param timeout: Seconds to wait for each version command.
 	:type Debug: boolean
 	
-	:returns: Print messages and information	
+	:returns: Print messages and information. Returns dictionary containing results for each software.
 	"""
 	
 	## read dependencies information
 	dependencies_pd = extern_progs.read_dependencies()
 
+	## java is required to check java software
+	results = _run_parallel(probe_software, ['java'], timeout, Debug, timeout)
+	results.update(_run_parallel(probe_software, [ soft for soft in dependencies_pd.index if soft != 'java' ], 
+								 timeout, Debug, timeout))
+
 	for soft, row in dependencies_pd.iterrows():
 		soft_name = row['soft_name']
-		min_version = row['min_version']
+		result = results[soft] or {'path': None, 'version': 'n.a.', 'min_version': row['min_version'], 'status': 'TIMEOUT'}
+		results[soft] = result
 		
 		## debug messages
 		if (Debug):
 			print ("Software:", soft)
 			print ("Soft name:", soft_name)
-			print ("Min_Version:", min_version)
-		
-		## get executable
-		(soft_path, installed) = get_exe(soft, Debug=Debug, Return_Version=True)
-		
-		## debug messages
-		if (Debug):
-			print ("Soft Path: ", soft_path)
-			print ("Version installed:", installed)
+			print ("Min_Version:", row['min_version'])
+			print ("Soft Path: ", result['path'])
+			print ("Version installed:", result['version'])
 			
 		## check if installed
-		if (min_version == 'na'):
-			message = check_install_module('ok', soft_name, min_version, 'Software')
+		if (result['status'] == 'TIMEOUT'):
+			print_module_comparison(soft_name, 'TIMEOUT', 'red', 'Software')
+			message = 'TIMEOUT'
+		elif (result['status'] == 'NOT FOUND'):
+			message = check_install_module('n.a.', soft_name, row['min_version'], 'Software')
+		elif (row['min_version'] == 'na'):
+			message = check_install_module('ok', soft_name, row['min_version'], 'Software')
 		else:
-			message = check_install_module(installed, soft_name, min_version, 'Software')
+			message = check_install_module(result['version'], soft_name, row['min_version'], 'Software')
 
 		if (message == 'OK'):
 			continue
 		else:
 			print ("+ Please install manually software: ", soft_name, " to continue with XICRA\n\n")
+
+	return (results)
 	
+##################
+def manifest_file():
+	"""Returns file to store dependencies checked by ``XICRA config``: ``$XICRA_MANIFEST`` or ``~/.XICRA/dependencies.json``."""
+	if os.environ.get('XICRA_MANIFEST'):
+		return (os.environ['XICRA_MANIFEST'])
+	return (os.path.join(os.path.expanduser('~'), '.XICRA', 'dependencies.json'))
+
+##################
+def write_manifest(software, python_packages, R_packages, manifest=None):
+	"""
+	Writes dependencies checked as a JSON manifest (see :func:`manifest_file`).
+
+	Software installed is stored together with ``$PATH`` and the modification time and inode of the
+	executables, so other modules reuse them if not changed (see :func:`init_tools`).
+
+	:returns: Manifest file.
+	"""
+	manifest = manifest or manifest_file()
+	folder = os.path.dirname(manifest)
+	if folder and not os.path.isdir(folder):
+		os.makedirs(folder)
+
+	data = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': sys.version.split()[0], 
+			'software': software, 'python_packages': python_packages, 'R_packages': R_packages,
+			'versions': dict(_versions)}
+	tmp_file = '%s.%s.tmp' %(manifest, os.getpid())
+	with open(tmp_file, 'w') as out_handle:
+		json.dump(data, out_handle, indent=1, default=str)
+	os.replace(tmp_file, manifest)
+	return (manifest)
+
+##################
+def read_manifest(manifest=None):
+	"""Returns dependencies checked by ``XICRA config`` (empty dictionary if not available)."""
+	manifest = manifest or manifest_file()
+	if not os.path.isfile(manifest):
+		return ({})
+	try:
+		with open(manifest) as in_handle:
+			return (json.load(in_handle))
+	except (OSError, ValueError):
+		return ({})
+
 ################
 ## Python
 ################
-def get_python_packages(Debug):
+def get_python_packages(Debug, timeout=None):
 	"""
 	Retrieves the version of the python packages installed in the system.
 
 	It retrieves the dependencies name conversion from file :file:`XICRA/config/python/module_dependencies.csv`
 	using function :func:`XICRA.config.extern_progs.file_list` and :func:`XICRA.scripts.functions.main_functions.get_data`.
 	For each module it retrieves the package version installed in the system using 
-	:func:`XICRA.config.set_config.check_package_version`.	
+	:func:`XICRA.config.set_config.check_package_version`. Packages are checked at the same time.	
 
 	:returns: Dictionary containing for each python module (key) the installed version (value).
 	"""
@@ -355,16 +626,12 @@ def get_python_packages(Debug):
 	file_module_dependecies = extern_progs.file_list("python_requirements")
 	module_dependencies = functions.main_functions.file2dictionary(file_module_dependecies, ',')
 
-	my_packages_installed = {}
-	for each in module_dependencies:
-		module_name = module_dependencies[each]
-		installed = check_package_version(each, Debug) ## check version installed in system
-		my_packages_installed[each] = installed
-
+	## check version installed in system
+	my_packages_installed = _run_parallel(check_package_version, list(module_dependencies), timeout, Debug)
 	return (my_packages_installed)
 
 ##################
-def check_python_packages(Debug):
+def check_python_packages(Debug, timeout=None):
 	"""
 	This functions checks whether the packages installed in the system fulfilled the 
 	minimum version specified in the configuration folder. 
@@ -375,12 +642,14 @@ def check_python_packages(Debug):
 	version specified. It compares them using function :func:`XICRA.config.set_config.check_install_module`.
 
 	:param Debug: True/False for debugging messages
+	:param timeout: Seconds to wait for each package.
 	:type Debug: boolean
 
-	:returns: Print messages if packages are installed.
+	:returns: Print messages if packages are installed. Returns dictionary containing installed 
+	 version, min_version and status for each package.
 	"""
 	## get python packages installed
-	my_packages_installed = get_python_packages(Debug)
+	my_packages_installed = get_python_packages(Debug, timeout)
 
 	## debug messages
 	if (Debug):
@@ -396,12 +665,17 @@ def check_python_packages(Debug):
 		print (my_packages_requirements)
 
 	## check each package
+	results = {}
 	for each in my_packages_requirements:
 		## get min version
 		min_version = my_packages_requirements[each]
 
 		## get version installed in system
-		installed = my_packages_installed[each] 
+		installed = my_packages_installed.get(each)
+		if installed is None:
+			print_module_comparison(each, 'TIMEOUT', 'red', 'Module')
+			results[each] = {'installed': 'n.a.', 'min_version': min_version, 'status': 'TIMEOUT'}
+			continue
 
 		## debug messages
 		if (Debug):
@@ -411,6 +685,7 @@ def check_python_packages(Debug):
 			
 		## check if installed
 		message = check_install_module(installed, each, min_version, 'Module')
+		results[each] = {'installed': str(installed), 'min_version': min_version, 'status': message}
 
 		if (message == 'OK'):
 			continue
@@ -418,6 +693,8 @@ def check_python_packages(Debug):
 			print ("+ Please install manually package: ", each, " to continue with XICRA\n\n")
 			#print ("pip install %s" %each)
 
+	return (results)
+
 ################
 def check_package_version(package, Debug):
 	"""
@@ -474,35 +751,54 @@ def get_R_packages():
 	return (dep_file_data)
 
 ################
-def check_R_packages(Debug):
-	
+def _check_R_package(package, R_script_exe, check_install_system, timeout):
+	"""Returns OK, NOT FOUND or TIMEOUT for the R package given."""
+	try:
+		process = subprocess.run([R_script_exe, check_install_system, '-l', package], stdout=subprocess.DEVNULL, 
+								 stderr=subprocess.DEVNULL, timeout=timeout)
+	except subprocess.TimeoutExpired:
+		return ('TIMEOUT')
+	return ('OK' if process.returncode == 0 else 'NOT FOUND')
+
+################
+def check_R_packages(Debug, timeout=None):
+	"""
+	Checks whether the R packages required are installed. Packages are checked at the same time.
+
+	:param Debug: True/False for debugging messages
+	:param timeout: Seconds to wait for each package.
+
+	:returns: Print messages. Returns dictionary containing status for each package.
+	"""
 	packages = get_R_packages()
 	check_install_system = os.path.abspath(os.path.join(os.path.dirname( __file__ ), 'R', 'check_install_system.R'))
-	R_script_exe = get_exe('Rscript')
+	try:
+		(R_script_exe, version, error) = resolve_exe('Rscript', Debug, timeout)
+	except subprocess.TimeoutExpired:
+		error = "\n**ERROR: Software Rscript did not report its version within %s seconds." %timeout
+	if error:
+		print (colored(error, 'red'))
+		return (dict([ (index, {'status': 'NOT CHECKED'}) for index in packages.index ]))
 	
+	status = _run_parallel(_check_R_package, list(packages.index), timeout, R_script_exe, check_install_system, timeout)
+	results = {}
 	for index,row in packages.iterrows():
 		## debugging messages
 		if Debug:
 			print ('\n+ Check package: ', index)
 			print('+ Source: ', row['source'])
 		
-		cmd_check = R_script_exe + ' ' + check_install_system + ' -l ' + index
-		code = functions.system_call_functions.system_call(cmd_check, message=False, returned=False)
+		code = status[index] or 'TIMEOUT'
+		results[index] = {'source': row['source'], 'status': code}
 		if (code=='OK'):
 			check_install_module('1', index, '0', 'package')
+		elif (code=='TIMEOUT'):
+			print_module_comparison(index, 'TIMEOUT', 'red', 'package')
 		else:
 			check_install_module('0', index, '1', 'System package')
+			print ("Please install module %s manually to continue with XICRA" %index)
 
-			## check if installed in path
-			cmd_check_path = R_script_exe + ' ' + check_install_path + ' -l ' + index + ' -p ' + install_path
-			code2 = functions.system_call_functions.system_call(cmd_check_path, message=False, returned=False)
-
-			if (code2):
-				check_install_module('1', index, '0', 'Install path package')
-			else:
-				check_install_module('0', index, '1', 'Install path package')
-				print ("Please install module %s manually to continue with XICRA" %index)
-				
+	return (results)
 		
 ################
 ## Miscellaneous
@@ -1,3 +1,5 @@
+import importlib
+
 __all__ = [
 	'biotype',
 	'config',
@@ -7,8 +9,14 @@ __all__ = [
 	'miRNA',
 	'prep',
 	'qc',
+	'smallRNA',
 	'trimm'	
 ]
 
-from XICRA.modules import *
+## modules are imported when first used (e.g. XICRA.modules.module): importing
+## the package does not load every module and its dependencies
+def __getattr__(name):
+	if name in __all__:
+		return importlib.import_module(__name__ + '.' + name)
+	raise AttributeError("module %r has no attribute %r" %(__name__, name))
 
@@ -13,7 +13,6 @@ import re
 import time
 from io import open
 import shutil
-import concurrent.futures
 import pandas as pd
 from termcolor import colored
 
@@ -23,6 +22,9 @@ from XICRA.modules import help_XICRA
 from XICRA.scripts import RNAbiotype
 from XICRA.scripts import mapReads
 from XICRA.scripts import multiQC_report
+from XICRA.scripts import generate_DE
+from XICRA.scripts import scheduler
+from XICRA.scripts import step_cache
 from XICRA.other_tools import tools
 
 from HCGB import sampleParser
@@ -66,6 +68,9 @@ def run_biotype(options):
         options.pair = False
     else:
         options.pair = True
+
+    ## python modules required for output format
+    generate_DE.check_output_format(options.output_format)
     
     aesthetics_functions.pipeline_header('XICRA')
     aesthetics_functions.boxymcboxface("RNA biotype analysis")
@@ -114,6 +119,14 @@ def run_biotype(options):
     ## for samples
     mapping_outdir_dict = files_functions.outdir_project(outdir, options.project, pd_samples_retrieved, "map", options.debug)
     
+    ## software required: resolved once for all samples
+    software = ['STAR']
+    if options.counting_engine == 'featureCounts':
+        software.append('featureCounts')
+    if not options.skip_report:
+        software.extend(['multiqc', 'Rscript'])
+    set_config.init_tools(outdir, software, options.refresh_tools, Debug)
+    
     ## debug message
     if (Debug):
         print (colored("**DEBUG: mapping_outdir_dict **", 'yellow'))
@@ -122,22 +135,15 @@ def run_biotype(options):
     # time stamp
     start_time_partial = time_functions.timestamp(start_time_total)
 
-    ## optimize threads
-    name_list = set(pd_samples_retrieved["new_name"].tolist())
-    threads_job = main_functions.optimize_threads(options.threads, len(name_list)) ## threads optimization
-    max_workers_int = int(options.threads/threads_job)
-    
     ## debug message
     if (Debug):
         print (colored("**DEBUG: options.threads " +  str(options.threads) + " **", 'yellow'))
-        print (colored("**DEBUG: max_workers " +  str(max_workers_int) + " **", 'yellow'))
-        print (colored("**DEBUG: cpu_here " +  str(threads_job) + " **", 'yellow'))
         
     ##############################################
     ## map Reads
     ##############################################
     start_time_partial = mapReads_module(options, pd_samples_retrieved, mapping_outdir_dict, 
-                    options.debug, max_workers_int, threads_job, start_time_partial, outdir)
+                    options.debug, start_time_partial, outdir)
 
     ## debug message
     if (Debug):
@@ -163,7 +169,8 @@ def run_biotype(options):
     
     ## get RNAbiotype information
     RNAbiotype.RNAbiotype_module_call(mapping_results, biotype_outdir_dict, options.annotation, 
-                                      options.debug, max_workers_int, threads_job, multimapping, options.stranded)
+                                      options.debug, options.threads, multimapping, options.stranded, outdir, 
+                                      options.counting_engine)
 
     # time stamp
     start_time_partial = time_functions.timestamp(start_time_partial)
@@ -209,7 +216,7 @@ def run_biotype(options):
                 shutil.copy(pdf_plot[0], single_files_biotype)
         
         ## collapse all information
-        all_data = RNAbiotype.generate_matrix(dict_files)
+        all_data = RNAbiotype.generate_matrix(dict_files, options.threads)
     
         ## print into excel/csv
         print ('+ Table contains: ', len(all_data), ' entries\n')
@@ -223,6 +230,10 @@ def run_biotype(options):
         ## copy or link files for each sample analyzed
         abs_csv_outfile = os.path.join(biotype_report, "summary.csv")
         all_data.to_csv(abs_csv_outfile)
+        
+        ## columnar format, if desired. csv file is still required for the plot
+        if options.output_format != 'csv':
+            generate_DE.write_matrix(all_data.rename_axis('RNAbiotypes'), os.path.join(biotype_report, "summary"), options.output_format)
        
         ## create plot: call R [TODO: implement in python]
         outfile_pdf = os.path.join(biotype_report, "RNAbiotypes_summary.pdf")
@@ -243,7 +254,7 @@ def run_biotype(options):
 
 #########################################
 def mapReads_module(options, pd_samples_retrieved, outdir_dict, Debug, 
-                    max_workers_int, threads_job, start_time_partial, outdir):
+                    start_time_partial, outdir):
     
     # Group dataframe by sample name
     sample_frame = pd_samples_retrieved.groupby(["new_name"])
@@ -259,6 +270,8 @@ def mapReads_module(options, pd_samples_retrieved, outdir_dict, Debug,
         ## in loop
         ## Use option LoadAndKeep, set shared memory > 30 Gb
     ## when finished loop Remove memory        
+    ## Genome in memory is shared with other XICRA runs in the same node using the
+    ## same genomeDir: see mapReads.attach_Genome and mapReads.release_Genome
     
     ## check reference
     if (options.fasta):
@@ -273,40 +286,35 @@ def mapReads_module(options, pd_samples_retrieved, outdir_dict, Debug,
         print ("+ genomeDir provided.")
         options.genomeDir = os.path.abspath(options.genomeDir)
         
-    ## remove previous reference genome from memory
-    print ("+ Remove genome in memory from previous call... (if any)")
-    mapReads.remove_Genome(STAR_exe, options.genomeDir, folder, options.threads)
-    
-    ## load reference genome
-    mapReads.load_Genome(folder, STAR_exe, options.genomeDir, options.threads)
+    ## load reference genome or attach to genome loaded by another process
+    print ("+ Load genome in memory (if not loaded by other process)")
+    if not mapReads.attach_Genome(folder, STAR_exe, options.genomeDir, options.threads, Debug):
+        exit()
 
     ## functions.time_functions.timestamp
     start_time_partial = time_functions.timestamp(start_time_partial)
     
     print ("+ Mapping sequencing reads for each sample retrieved...")
 
-    ## send for each sample
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_int) as executor:
-        commandsSent = { executor.submit(mapReads_caller, sorted(cluster["sample"].tolist()), 
-                                         outdir_dict[name], name, threads_job, STAR_exe, 
-                                         options.genomeDir, options.limitRAM, Debug): name for name, cluster in sample_frame }
-
-        for cmd2 in concurrent.futures.as_completed(commandsSent):
-            details = commandsSent[cmd2]
-            try:
-                data = cmd2.result()
-            except Exception as exc:
-                print ('***ERROR:')
-                print (cmd2)
-                print('%r generated an exception: %s' % (details, exc))
-
-    print ("\n\n+ Mapping reads has finished...")
+    ## send for each sample: larger samples first and using more threads
+    ## each sample requires limitRAM for sorting: memory available (genome already loaded) is shared 
+    ## genome is released even if mapping is interrupted
+    try:
+        jobs = [ scheduler.Job(name, mapReads_caller, sorted(cluster["sample"].tolist()), 
+                               outdir_dict[name], name, scheduler.THREADS, STAR_exe, 
+                               options.genomeDir, options.limitRAM, Debug, 
+                               files=cluster["sample"].tolist(), memory=options.limitRAM) for name, cluster in sample_frame ]
+        scheduler.run_jobs(jobs, options.threads, Debug, scheduler.history_file(outdir), "map", 
+                           memory_budget=scheduler.available_memory())
     
-    ## functions.time_functions.timestamp
-    start_time_partial = time_functions.timestamp(start_time_partial)
-
-    ## remove reference genome from memory
-    mapReads.remove_Genome(STAR_exe, options.genomeDir, folder, options.threads)
+        print ("\n\n+ Mapping reads has finished...")
+        
+        ## functions.time_functions.timestamp
+        start_time_partial = time_functions.timestamp(start_time_partial)
+    
+    finally:
+        ## remove reference genome from memory if no other process uses it
+        mapReads.release_Genome(folder, STAR_exe, options.genomeDir, options.threads, Debug)
     
     ## functions.time_functions.timestamp
     start_time_partial = time_functions.timestamp(start_time_partial)
@@ -339,12 +347,11 @@ def mapReads_module(options, pd_samples_retrieved, outdir_dict, Debug,
 
 #################################
 def mapReads_caller(files, folder, name, threads, STAR_exe, genomeDir, limitRAM_option, Debug):
-    ## check if previously joined and succeeded
+    ## check if previously mapped and succeeded with same reads, genomeDir and version
     filename_stamp = folder + '/.success'
-    if os.path.isfile(filename_stamp):
-        stamp = time_functions.read_time_stamp(filename_stamp)
-        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'STAR'), 'yellow'))
-    else:
+    (done, record) = step_cache.check_step(filename_stamp, name, 'STAR', files + [genomeDir], {}, 
+                                           step_cache.tool_version('STAR', STAR_exe), Debug)
+    if not done:
         ##
         if Debug:
             print ("\n** DEBUG: mapReads_caller options **\n")
@@ -361,7 +368,7 @@ def mapReads_caller(files, folder, name, threads, STAR_exe, genomeDir, limitRAM_
         code_returned = mapReads.mapReads("LoadAndKeep", files, folder, name, STAR_exe, genomeDir, limitRAM_option, threads, Debug)
         
         if (code_returned):
-            time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, record)
         else:
             print ("+ Mapping sample %s failed..." %name)
     
@@ -5,9 +5,6 @@ import time
 import io
 import os
 
-## import functions
-from HCGB import functions
-
 ################
 def run(options):
 	print()
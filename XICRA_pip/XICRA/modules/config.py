@@ -56,7 +56,7 @@ def run_config(options):
     print ('External dependencies:')
     HCGB_aes.print_sepLine("+", 20, False)
     
-    set_config.check_dependencies(Debug)
+    software = set_config.check_dependencies(Debug, options.timeout)
     print ('\n')    
 
     ## python packages
@@ -65,7 +65,7 @@ def run_config(options):
     print ('Python packages:')
     HCGB_aes.print_sepLine("+", 20, False)
 
-    set_config.check_python_packages(Debug)
+    python_packages = set_config.check_python_packages(Debug, options.timeout)
     HCGB_aes.print_sepLine("+", 20, False)
     print ('\n')
 
@@ -76,8 +76,12 @@ def run_config(options):
     print ('R packages:')
     HCGB_aes.print_sepLine("+", 20, False)
 
-    set_config.check_R_packages(Debug)
+    R_packages = set_config.check_R_packages(Debug, options.timeout)
     HCGB_aes.print_sepLine("+", 20, False)
     print ('\n')
 
-    
\ No newline at end of file
+    ## save results: other modules use software checked instead of checking it again
+    manifest = set_config.write_manifest(software, python_packages, R_packages)
+    print ("+ Dependencies checked are saved in: %s" %manifest)
+    print ("+ Set environment variable XICRA_MANIFEST to save them in a different file.")
+    HCGB_time.timestamp(start_time_total)
@@ -13,12 +13,15 @@ import re
 import time
 from io import open
 import shutil
-import concurrent.futures
 from termcolor import colored
 
 ## import my modules
 from XICRA.modules import help_XICRA
 from XICRA.config import set_config
+from XICRA.scripts import scheduler
+from XICRA.scripts import step_cache
+from XICRA.scripts import compression
+from XICRA.scripts import join_reads
 from HCGB import functions
 from HCGB import sampleParser
 
@@ -100,36 +103,24 @@ def run_join(options):
     ## for samples
     outdir_dict = functions.files_functions.outdir_project(outdir, options.project, pd_samples_retrieved, "join", options.debug)
     
-    ## optimize threads
-    name_list = set(pd_samples_retrieved["new_name"].tolist())
-    threads_job = functions.main_functions.optimize_threads(options.threads, len(name_list)) ## threads optimization
-    max_workers_int = int(options.threads/threads_job)
-
+    ## software required: resolved once for all samples
+    set_config.init_tools(outdir, ['fastqjoin'] if options.join_engine == 'fastqjoin' else [], options.refresh_tools, Debug)
+    
     ## debug message
     if (Debug):
         print (colored("**DEBUG: options.threads " +  str(options.threads) + " **", 'yellow'))
-        print (colored("**DEBUG: max_workers " +  str(max_workers_int) + " **", 'yellow'))
-        print (colored("**DEBUG: cpu_here " +  str(threads_job) + " **", 'yellow'))
 
     print ("+ Joining paired-end sequencing reads for each sample retrieved...")    
     
     # Group dataframe by sample name
     sample_frame = pd_samples_retrieved.groupby(["new_name"])
     
-    ## send for each sample
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_int) as executor:
-        commandsSent = { executor.submit(fastqjoin_caller, sorted(cluster["sample"].tolist()), 
-                                         outdir_dict[name], name, threads_job, options.perc_diff,
-                                         Debug): name for name, cluster in sample_frame }
-
-        for cmd2 in concurrent.futures.as_completed(commandsSent):
-            details = commandsSent[cmd2]
-            try:
-                data = cmd2.result()
-            except Exception as exc:
-                print ('***ERROR:')
-                print (cmd2)
-                print('%r generated an exception: %s' % (details, exc))
+    ## send for each sample: larger samples first and using more threads
+    jobs = [ scheduler.Job(name, fastqjoin_caller, sorted(cluster["sample"].tolist()), 
+                           outdir_dict[name], name, scheduler.THREADS, options.perc_diff,
+                           Debug, options.intermediate_compression, options.join_engine, 
+                           files=cluster["sample"].tolist()) for name, cluster in sample_frame ]
+    scheduler.run_jobs(jobs, options.threads, Debug, scheduler.history_file(outdir), "join")
 
     print ("\n\n+ Joining reads has finished...")
     
@@ -142,23 +133,32 @@ def run_join(options):
     return()
 
 #############################################
-def fastqjoin_caller(list_reads, sample_folder, name, threads, perc_diff, Debug):
-    ## check if previously joined and succeeded
+def fastqjoin_caller(list_reads, sample_folder, name, threads, perc_diff, Debug, compression_type='none', engine='fastqjoin'):
+    ## check if previously joined and succeeded with same reads, parameters, compression and version
     filename_stamp = sample_folder + '/.success'
-    if os.path.isfile(filename_stamp):
-        stamp = functions.time_functions.read_time_stamp(filename_stamp)
-        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'fastqjoin'), 'yellow'))
-    else:
-        # Call fastqjoin
+    params = {'perc_diff': perc_diff}
+    if compression_type != 'none':
+        params['compression'] = compression_type
+    if engine == 'fastqjoin':
         fastqjoin_exe = set_config.get_exe('fastqjoin')
-        code_returned = fastqjoin(fastqjoin_exe, list_reads, sample_folder, name, threads, perc_diff, Debug)
+        version = step_cache.tool_version('fastqjoin', fastqjoin_exe)
+    else:
+        fastqjoin_exe = None
+        version = step_cache.tool_version('XICRA')
+    (done, record) = step_cache.check_step(filename_stamp, name, 'join', list_reads, params, version, Debug)
+    if not done:
+        # Call fastqjoin or join reads within XICRA
+        if fastqjoin_exe:
+            code_returned = fastqjoin(fastqjoin_exe, list_reads, sample_folder, name, threads, perc_diff, Debug, compression_type)
+        else:
+            code_returned = join_reads_caller(list_reads, sample_folder, name, threads, perc_diff, Debug, compression_type)
         if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, record)
         else:
             print ('** Sample %s failed...' %name)
 
 #############################################
-def fastqjoin (fastqjoin_exe, reads, path, sample_name, num_threads, perc_diff, Debug):
+def fastqjoin (fastqjoin_exe, reads, path, sample_name, num_threads, perc_diff, Debug, compression_type='none'):
     """
     
     :param fastqjoin_exe:
@@ -167,6 +167,7 @@ def fastqjoin (fastqjoin_exe, reads, path, sample_name, num_threads, perc_diff,
     :param sample_name:
     :param num_threads: 
     :param Debug:
+    :param compression_type: Compression for joined and unjoined reads: none, gzip or zstd.
     
     :type fastqjoin_exe:
     :type reads:
@@ -174,21 +175,64 @@ def fastqjoin (fastqjoin_exe, reads, path, sample_name, num_threads, perc_diff,
     :type sample_name:
     :type num_threads: 
     :type Debug:
+    :type compression_type: string
     
     """
     logfile = os.path.join(path, sample_name + '.fastqjoin.log')
-    joined_reads = os.path.join(path, sample_name + '_trim_joined.fastq')
-    unjoined_1 = os.path.join(path, sample_name + '_trimmed_unjoin_R1.fastq')
-    unjoined_2 = os.path.join(path, sample_name + '_trimmed_unjoin_R2.fastq')
+    ext = compression.extension(compression_type)
+    joined_reads = os.path.join(path, sample_name + '_trim_joined.fastq' + ext)
+    unjoined_1 = os.path.join(path, sample_name + '_trimmed_unjoin_R1.fastq' + ext)
+    unjoined_2 = os.path.join(path, sample_name + '_trimmed_unjoin_R2.fastq' + ext)
     
     ## check paired-end file
-    if (len(reads) == 2):
-        cmd = fastqjoin_exe + ' -p %s %s %s -o %s -o %s -o %s > %s' %(perc_diff, reads[0], 
-                                                                  reads[1], unjoined_1, unjoined_2, 
-                                                                  joined_reads, logfile)
-    else:
+    if not (len(reads) == 2):
         print ('** Wrong number of files provided for sample: %s...' %sample_name)
         return(False)
 
-    return(functions.system_call_functions.system_call(cmd))
-    
\ No newline at end of file
+    ## fastqjoin writes plain files: compress on the fly, if desired
+    ## zstd reads are decompressed on the fly
+    try:
+        with compression.decompressed_inputs(reads, Debug=Debug) as reads_given:
+            with compression.compressed_outputs([joined_reads, unjoined_1, unjoined_2], num_threads, Debug) as outputs:
+                cmd = fastqjoin_exe + ' -p %s %s %s -o %s -o %s -o %s > %s' %(perc_diff, reads_given[0], 
+                                                                          reads_given[1], outputs[1], outputs[2], 
+                                                                          outputs[0], logfile)
+                code = functions.system_call_functions.system_call(cmd)
+    except OSError as exc:
+        print (colored("** ERROR: %s [%s]" %(exc, sample_name), 'red'))
+        return (False)
+
+    ## remove reads generated using a different compression
+    if code:
+        for outfile in [joined_reads, unjoined_1, unjoined_2]:
+            compression.remove_other_files(outfile)
+
+    return(code)
+    
+
+#############################################
+def join_reads_caller(reads, path, sample_name, num_threads, perc_diff, Debug, compression_type='none'):
+    """
+    Joins paired-end reads within XICRA using the same rules as fastq-join (see :func:`XICRA.scripts.join_reads.join`).
+    
+    Output files and report are named as for fastq-join.
+    """
+    logfile = os.path.join(path, sample_name + '.fastqjoin.log')
+    ext = compression.extension(compression_type)
+    joined_reads = os.path.join(path, sample_name + '_trim_joined.fastq' + ext)
+    unjoined_1 = os.path.join(path, sample_name + '_trimmed_unjoin_R1.fastq' + ext)
+    unjoined_2 = os.path.join(path, sample_name + '_trimmed_unjoin_R2.fastq' + ext)
+    
+    ## check paired-end file
+    if not (len(reads) == 2):
+        print ('** Wrong number of files provided for sample: %s...' %sample_name)
+        return(False)
+    
+    code = join_reads.join(reads, joined_reads, [unjoined_1, unjoined_2], logfile, perc_diff, num_threads, Debug)
+    
+    ## remove reads generated using a different compression
+    if code:
+        for outfile in [joined_reads, unjoined_1, unjoined_2]:
+            compression.remove_other_files(outfile)
+    
+    return(code)
@@ -13,7 +13,6 @@ import re
 import time
 from io import open
 import shutil
-import concurrent.futures
 import pandas as pd
 from termcolor import colored
 
@@ -23,7 +22,21 @@ from HCGB import functions
 from XICRA.config import set_config
 from XICRA.modules import help_XICRA
 from XICRA.scripts import generate_DE
-from HCGB.functions import fasta_functions
+from XICRA.scripts import isomiR_annotation
+from XICRA.scripts import miRBase_reference
+from XICRA.scripts import scheduler
+from XICRA.scripts import step_cache
+from XICRA.scripts import collapse_reads
+from XICRA.scripts import java_batch
+from XICRA.scripts import multiQC_report
+from XICRA.scripts import smallRNA_stream
+
+## maximum number of threads each software is able to use (None: no limit)
+## miraligner and OptimiR commands have no threads option (see miraligner and optimir), so
+## extra threads would stay idle; sRNAbench uses threads (p=) for bowtie mapping.
+## Caps are fixed: CPU time of each job can not be told apart from other jobs running
+## at the same time (child processes of XICRA), so it is not recorded in the jobs history.
+soft_max_threads = {'sRNAbench': None, 'optimir': 1, 'miraligner': 1}
 
 ##############################################
 def run_miRNA(options):
@@ -52,12 +65,19 @@ def run_miRNA(options):
         Debug = True
     else:
         Debug = False
+    
+    ## reads preprocessing within miRNA analysis: set by smallRNA module
+    if not hasattr(options, 'preprocess'):
+        options.preprocess = None
         
     ### set as default paired_end mode
     if (options.single_end):
         options.pair = False
     else:
         options.pair = True
+
+    ## python modules required for output format
+    generate_DE.check_output_format(options.output_format)
     
     functions.aesthetics_functions.pipeline_header('XICRA')
     functions.aesthetics_functions.boxymcboxface("miRNA analysis")
@@ -82,7 +102,12 @@ def run_miRNA(options):
     
     ## get files
     print ('+ Getting files from input folder... ')
-    if options.pair:
+    if options.preprocess:
+        ## raw reads are trimmed, joined and collapsed for each sample (see smallRNA module)
+        print ('+ Mode: fastq.\n+ Extension: ')
+        print ("[ fastq, fq, fastq.gz, fq.gz ]\n")
+        pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "fastq", ("fastq", "fq", "fastq.gz", "fq.gz"), options.debug)
+    elif options.pair:
         options.pair = False ## set paired-end to false for further prepocessing
         if options.noTrim:
             print ('+ Mode: fastq.\n+ Extension: ')
@@ -90,8 +115,8 @@ def run_miRNA(options):
             pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "fastq", ("fastq", "fq", "fastq.gz", "fq.gz"), options.debug)
         else:
             print ('+ Mode: join.\n+ Extension: ')
-            print ("[_joined.fastq]\n")
-            pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "join", ['_joined.fastq'], options.debug)
+            print ("[_joined.fastq, _joined.fastq.gz, _joined.fastq.zst]\n")
+            pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "join", ['_joined.fastq', '_joined.fastq.gz', '_joined.fastq.zst'], options.debug)
     else:
         if options.noTrim:
             print ('+ Mode: fastq.\n+ Extension: ')
@@ -124,41 +149,47 @@ def run_miRNA(options):
     print ("+ Create folder to store results: ", options.database)
     functions.files_functions.create_folder(options.database)
     
+    ## miRBase files not provided: retrieve them from the reference store
+    ## (download miRBase release if not available)
+    reference_folder = None
+    if not all([options.miRNA_gff, options.hairpinFasta, options.matureFasta, options.miRBase_str]):
+        print ("+ Retrieve miRBase files not provided (release: %s)" %options.miRBase_release)
+        (reference_folder, reference_files) = miRBase_reference.get_reference(options.database, options.species, 
+                                                                              options.miRBase_release, Debug)
+    
     ## miRNA_gff: can be set as automatic to download from miRBase
     if not options.miRNA_gff:
         print ("+ File miRNA gff3 annotation")
         if Debug:
             print (colored("\t** ATTENTION: No miRNA gff file provided", 'yellow'))     
-        print (colored("\t** Download it form miRBase", 'green'))
-        file_name = options.species + ".gff3"
-        ftp_site = "ftp://mirbase.org/pub/mirbase/CURRENT/genomes/" + file_name 
-        options.miRNA_gff = functions.main_functions.urllib_request(options.database, ftp_site, file_name, Debug)
+        print (colored("\t** Retrieve it from miRBase reference store", 'green'))
+        options.miRNA_gff = reference_files['miRNA_gff']
         
     else:
         print ("+ miRNA gff file provided")
         options.miRNA_gff = os.path.abspath(options.miRNA_gff)
+        reference_folder = None
 
     ## hairpin: can be set as automatic to download from miRBase
     if not options.hairpinFasta:
         print ("+ File hairpin fasta")
         if Debug:
             print (colored("\t** ATTENTION: No hairpin fasta file provided", 'yellow'))        
-        print (colored("\t** Download it form miRBase", 'green'))
-        ftp_site = "ftp://mirbase.org/pub/mirbase/CURRENT/hairpin.fa.gz"
-        options.hairpinFasta = functions.main_functions.urllib_request(options.database, ftp_site, "hairpin.fa.gz", Debug)
+        print (colored("\t** Retrieve it from miRBase reference store", 'green'))
+        options.hairpinFasta = reference_files['hairpinFasta']
         
     else:
         print ("+ hairpin fasta file provided")
         options.hairpinFasta = os.path.abspath(options.hairpinFasta)
+        reference_folder = None
    
     ## mature: can be set as automatic to download from miRBase
     if not options.matureFasta:
         print ("+ File mature fasta")
         if Debug:
             print (colored("\t** ATTENTION: No mature miRNA fasta file provided", 'yellow'))        
-        print (colored("\t** Download it form miRBase", 'green'))
-        ftp_site = "ftp://mirbase.org/pub/mirbase/CURRENT/mature.fa.gz"
-        options.matureFasta = functions.main_functions.urllib_request(options.database, ftp_site, "mature.fa.gz", Debug)
+        print (colored("\t** Retrieve it from miRBase reference store", 'green'))
+        options.matureFasta = reference_files['matureFasta']
 
     else:
         print ("+ mature fasta file provided")
@@ -169,14 +200,24 @@ def run_miRNA(options):
         print ("+ File miRBase str annotation")
         if Debug:
             print (colored("\t** ATTENTION: No miRBase_str file provided", 'yellow'))        
-        print (colored("\t** Download it form miRBase", 'green'))
-        ftp_site = "ftp://mirbase.org/pub/mirbase/CURRENT/miRNA.str.gz"
-        options.miRBase_str = functions.main_functions.urllib_request(options.database, ftp_site, "miRNA.str.gz", Debug)
-        ## extract
+        print (colored("\t** Retrieve it from miRBase reference store", 'green'))
+        options.miRBase_str = reference_files['miRBase_str']
         
     else:
         print ("+ miRBase_str file provided")
         options.miRBase_str = os.path.abspath(options.miRBase_str)
+    
+    ## miraligner expects hairpin.fa and miRNA.str within database folder
+    if os.path.dirname(options.hairpinFasta) == os.path.dirname(options.miRBase_str):
+        options.miraligner_db = os.path.dirname(options.hairpinFasta)
+    else:
+        options.miraligner_db = options.database
+    
+    ## load miRNA information once for all samples and software
+    print ("+ Load miRNA reference information for isomiR annotation")
+    ## use pre-parsed information if hairpin and gff3 retrieved from the reference store
+    mirtop_reference = isomiR_annotation.load_reference(options.hairpinFasta, options.miRNA_gff, options.species, 
+                                                        Debug, reference_folder=reference_folder)
     ############################################################
        
     ## generate output folder, if necessary
@@ -187,16 +228,21 @@ def run_miRNA(options):
     ## for samples
     outdir_dict = functions.files_functions.outdir_project(outdir, options.project, pd_samples_retrieved, "miRNA", options.debug)
     
-    ## optimize threads
-    name_list = set(pd_samples_retrieved["new_name"].tolist())
-    threads_job = functions.main_functions.optimize_threads(options.threads, len(name_list)) ## threads optimization
-    max_workers_int = int(options.threads/threads_job)
-
+    ## software required: resolved once for all samples
+    software = list(options.soft_name)
+    if "sRNAbench" in software or "miraligner" in software:
+        software.append('java')
+    if options.preprocess:
+        software.append('cutadapt')
+        if options.preprocess['join_engine'] == 'fastqjoin':
+            software.append('fastqjoin')
+        if not options.skip_report:
+            software.append('multiqc')
+    set_config.init_tools(outdir, software, options.refresh_tools, Debug)
+    
     ## debug message
     if (Debug):
         print (colored("**DEBUG: options.threads " +  str(options.threads) + " **", 'yellow'))
-        print (colored("**DEBUG: max_workers " +  str(max_workers_int) + " **", 'yellow'))
-        print (colored("**DEBUG: cpu_here " +  str(threads_job) + " **", 'yellow'))
 
     print ("+ Create a miRNA analysis for each sample retrieved...")    
     
@@ -204,28 +250,33 @@ def run_miRNA(options):
     ## Get user software selection: sRNAbench, optimir, ...
     ## Standarize using miRTop
     
-    ## dictionary results
-    global results_df
-    results_df = pd.DataFrame(columns=("name", "soft", "filename"))
-    
     # Group dataframe by sample name
     sample_frame = pd_samples_retrieved.groupby(["new_name"])
     
+    ## java software for all samples within a single process
+    if options.java_batch:
+        java_batch_caller(sample_frame, outdir_dict, options, outdir, Debug)
+    
     ## send for each sample
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_int) as executor:
-        commandsSent = { executor.submit(miRNA_analysis, sorted(cluster["sample"].tolist()), 
-                                         outdir_dict[name], name, threads_job, options.miRNA_gff,
-                                         options.soft_name, options.matureFasta, options.hairpinFasta, 
-                                         options.miRBase_str, options.species, options.database, Debug): name for name, cluster in sample_frame }
-
-        for cmd2 in concurrent.futures.as_completed(commandsSent):
-            details = commandsSent[cmd2]
-            try:
-                data = cmd2.result()
-            except Exception as exc:
-                print ('***ERROR:')
-                print (cmd2)
-                print('%r generated an exception: %s' % (details, exc))
+    jobs = [ scheduler.Job(name, miRNA_analysis, sorted(cluster["sample"].tolist()), 
+                           outdir_dict[name], name, scheduler.THREADS, options.miRNA_gff,
+                           options.soft_name, options.matureFasta, options.hairpinFasta, 
+                           options.miRBase_str, options.species, options.miraligner_db, 
+                           mirtop_reference, Debug, options.preprocess, files=cluster["sample"].tolist()) for name, cluster in sample_frame ]
+    results = scheduler.run_jobs(jobs, options.threads, Debug, scheduler.history_file(outdir), 
+                                 "smallRNA" if options.preprocess else "miRNA")
+    
+    ## results returned by each sample: collected in sample order
+    results_df = results_table([ result for name, cluster in sample_frame for result in results.get(name) or [] ])
+
+    ## report trimming and joining statistics
+    if options.preprocess and not options.skip_report:
+        print ("\n+ Generating a report using MultiQC module.")
+        outdir_report = functions.files_functions.create_subfolder("report", outdir)
+        trimm_report = functions.files_functions.create_subfolder("trimm", outdir_report)
+        my_outdir_list = set([ os.path.join(folder, 'collapsed') for folder in outdir_dict.values() ])
+        multiQC_report.multiQC_module_call(my_outdir_list, "Cutadapt", trimm_report,"")
+        print ('\n+ A summary HTML report of each sample is generated in folder: %s' %trimm_report)
 
     print ("\n\n+ miRNA analysis is finished...")
     print ("+ Let's summarize all results...")
@@ -240,7 +291,7 @@ def run_miRNA(options):
     
     ## merge all parse gtf files created
     print ("+ Summarize miRNA analysis for all samples...")
-    generate_DE.generate_DE(results_df, options.debug, expression_folder)
+    generate_DE.generate_DE(results_df, options.debug, expression_folder, options.output_format)
 
     print ("\n*************** Finish *******************")
     start_time_partial = functions.time_functions.timestamp(start_time_total)
@@ -249,66 +300,269 @@ def run_miRNA(options):
 
 ###############
 def miRNA_analysis(reads, folder, name, threads, miRNA_gff, soft_list, 
-                   matureFasta, hairpinFasta, miRBase_str, species, database, Debug):
-    
-    for soft in soft_list:
-        if (soft == "sRNAbench"):
-            ## create sRNAbench
-            sRNAbench_folder = functions.files_functions.create_subfolder('sRNAbench', folder)
-            code_success = sRNAbench_caller(reads, sRNAbench_folder, name, threads, species, Debug) ## Any additional sRNAbench parameter?
-                
-            if not code_success:
-                print ('** miRTop would not be executed for sample %s...' %name)
-                return ()
-            
-            ## create folder for sRNAbench results
-            miRTop_folder = functions.files_functions.create_subfolder("sRNAbench_miRTop", folder)
-            miRTop_caller(sRNAbench_folder, miRTop_folder, name, threads, miRNA_gff, hairpinFasta, 'sRNAbench', species, Debug)
-            
-            ## save results in dataframe
-            filename = os.path.join(miRTop_folder, 'counts', 'mirtop.tsv')
-            results_df.loc[len(results_df)] = name, soft, filename
-            
-        ###
-        if (soft == "optimir"):
-            ## create OptimiR analysis
-            optimir_folder = functions.files_functions.create_subfolder('OptimiR', folder)
-            code_success = optimir_caller(reads, optimir_folder, name, threads, matureFasta, hairpinFasta, miRNA_gff, species, Debug) ## Any additional sRNAbench parameter?
-            
-            ## create folder for Optimir results
-            miRTop_folder = functions.files_functions.create_subfolder("OptimiR_miRTop", folder)
-            miRTop_caller(optimir_folder, miRTop_folder, name, threads, miRNA_gff, hairpinFasta, 'optimir', species, Debug)
-            
-            ## save results in dataframe
-            filename = os.path.join(miRTop_folder, 'counts', 'mirtop.tsv')
-            results_df.loc[len(results_df)] = name, soft, filename
-            
-        ###
-        if (soft == "miraligner"):
-            ## create OptimiR analysis
-            miraligner_folder = functions.files_functions.create_subfolder('miraligner', folder)
-            code_success = miraligner_caller(reads, miraligner_folder, name, threads, database, species, Debug) 
-            
-            ## create folder for Optimir results
-            miRTop_folder = functions.files_functions.create_subfolder("miraligner_miRTop", folder)
-            miRTop_caller(miraligner_folder, miRTop_folder, name, threads, miRNA_gff, hairpinFasta, 'seqbuster', species, Debug)
+                   matureFasta, hairpinFasta, miRBase_str, species, database, mirtop_reference, Debug, preprocess=None):
+    
+    ## collapse reads once for all software (trimming and joining raw reads first, if desired)
+    collapse_folder = functions.files_functions.create_subfolder('collapsed', folder)
+    if preprocess:
+        collapsed = preprocess_caller(reads, collapse_folder, name, threads, preprocess, Debug)
+    else:
+        collapsed = collapse_caller(reads, collapse_folder, name, Debug)
+    if not collapsed:
+        print ('** miRNA analysis would not be executed for sample %s...' %name)
+        return ([])
+    
+    ## run software (and miRTop) at the same time: threads are split according to 
+    ## time recorded for each software in previous runs and the threads each one is able to use
+    jobs = [ scheduler.Job(soft, soft_analysis, soft, collapsed, folder, name, scheduler.THREADS, miRNA_gff, 
+                           matureFasta, hairpinFasta, species, database, mirtop_reference, Debug, 
+                           files=[collapsed['tabular']], max_threads=soft_max_threads.get(soft)) for soft in soft_list ]
+    results = scheduler.run_jobs(jobs, threads, Debug, scheduler.history_file(folder), "miRNA_software")
+    
+    ## return results for each software available
+    return ([ miRNA_result(name, soft, results[soft]) for soft in soft_list if results.get(soft) ])
+
+###############
+class miRNA_result:
+    """
+    Results of a software for a sample.
+
+    :param name: Sample name.
+    :param soft: Software name.
+    :param filename: mirtop.tsv file generated.
+    """
+    def __init__(self, name, soft, filename):
+        self.name = name
+        self.soft = soft
+        self.filename = filename
+
+###############
+def results_table(results):
+    """
+    Returns a dataframe containing name, soft and filename for each result given (see :class:`miRNA_result`).
+    """
+    return (pd.DataFrame({'name': [ result.name for result in results ], 
+                          'soft': [ result.soft for result in results ], 
+                          'filename': [ result.filename for result in results ]}, 
+                         columns=("name", "soft", "filename")))
+
+###############
+def soft_analysis(soft, collapsed, folder, name, threads, miRNA_gff, 
+                  matureFasta, hairpinFasta, species, database, mirtop_reference, Debug):
+    """
+    Runs the software given and miRTop for a sample.
+    
+    :returns: miRTop counts file or None if failed.
+    """
+    if (soft == "sRNAbench"):
+        ## create sRNAbench
+        sRNAbench_folder = functions.files_functions.create_subfolder('sRNAbench', folder)
+        code_success = sRNAbench_caller([collapsed['tabular']], sRNAbench_folder, name, threads, species, Debug) ## Any additional sRNAbench parameter?
             
-            ## save results in dataframe
-            filename = os.path.join(miRTop_folder, 'counts', 'mirtop.tsv')
-            results_df.loc[len(results_df)] = name, soft, filename
+        if not code_success:
+            print ('** miRTop would not be executed for sample %s...' %name)
+            return (None)
+        
+        ## create folder for sRNAbench results
+        miRTop_folder = functions.files_functions.create_subfolder("sRNAbench_miRTop", folder)
+        miRTop_caller(sRNAbench_folder, miRTop_folder, name, threads, mirtop_reference, 'sRNAbench', Debug)
+        
+    ###
+    elif (soft == "optimir"):
+        ## create OptimiR analysis
+        optimir_folder = functions.files_functions.create_subfolder('OptimiR', folder)
+        code_success = optimir_caller([collapsed['fastq']], optimir_folder, name, threads, matureFasta, hairpinFasta, miRNA_gff, species, Debug) ## Any additional sRNAbench parameter?
+        
+        ## create folder for Optimir results
+        ## OptimiR analyses each collapsed sequence once: restore counts
+        miRTop_folder = functions.files_functions.create_subfolder("OptimiR_miRTop", folder)
+        miRTop_caller(optimir_folder, miRTop_folder, name, threads, mirtop_reference, 'optimir', Debug, 
+                      collapsed=collapsed['tabular'])
+        
+    ###
+    elif (soft == "miraligner"):
+        ## create OptimiR analysis
+        miraligner_folder = functions.files_functions.create_subfolder('miraligner', folder)
+        code_success = miraligner_caller([collapsed['tabular']], miraligner_folder, name, threads, database, species, Debug) 
+        
+        ## create folder for Optimir results
+        miRTop_folder = functions.files_functions.create_subfolder("miraligner_miRTop", folder)
+        miRTop_caller(miraligner_folder, miRTop_folder, name, threads, mirtop_reference, 'seqbuster', Debug)
+    
+    else:
+        return (None)
+    
+    return (os.path.join(miRTop_folder, 'counts', 'mirtop.tsv'))
 
 ###############       
-def sRNAbench_caller(reads, sample_folder, name, threads, species, Debug):
-    # check if previously generated and succeeded
+def collapse_caller(reads, sample_folder, name, Debug):
+    """
+    Collapses reads into unique sequences with counts (see :func:`XICRA.scripts.collapse_reads.collapse`).
+    
+    :returns: Dictionary containing tabular and fastq collapsed files or False if failed.
+    """
+    # check if previously generated and succeeded with same reads
+    filename_stamp = sample_folder + '/.success'
+    (done, record) = step_cache.check_step(filename_stamp, name, 'collapse', reads, {}, 
+                                           step_cache.tool_version('XICRA'), Debug)
+    collapsed = {'tabular': os.path.join(sample_folder, name + '.rc'),
+                 'fastq': os.path.join(sample_folder, name + '_collapsed.fastq')}
+    if not done:
+        print ('+ Collapse reads for sample %s' %name)
+        try:
+            collapsed = collapse_reads.collapse(reads, sample_folder, name, Debug)
+        except Exception as exc:
+            print (colored("** ERROR: reads could not be collapsed for sample %s: %s" %(name, exc), 'red'))
+            return (False)
+        
+        print ('\t%s reads collapsed into %s unique sequences [%s]' %(collapsed['reads'], collapsed['unique'], name))
+        step_cache.save_step(filename_stamp, record)
+        
+    return (collapsed)
+
+###############       
+def preprocess_caller(reads, sample_folder, name, threads, preprocess, Debug):
+    """
+    Trims, joins and collapses raw reads streaming data between steps (see :func:`XICRA.scripts.smallRNA_stream.preprocess`).
+    
+    :returns: Dictionary containing tabular and fastq collapsed files or False if failed.
+    """
+    # check if previously generated and succeeded with same reads, parameters and versions
     filename_stamp = sample_folder + '/.success'
-    if os.path.isfile(filename_stamp):
-        stamp = functions.time_functions.read_time_stamp(filename_stamp)
-        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'sRNAbench'), 'yellow'))
+    cutadapt_exe = set_config.get_exe('cutadapt', Debug=Debug)
+    fastqjoin_exe = None
+    if len(reads) == 2 and preprocess['join_engine'] == 'fastqjoin':
+        fastqjoin_exe = set_config.get_exe('fastqjoin', Debug=Debug)
+    version = [step_cache.tool_version('cutadapt', cutadapt_exe), step_cache.tool_version('XICRA')]
+    if fastqjoin_exe:
+        version.append(step_cache.tool_version('fastqjoin', fastqjoin_exe))
+    (done, record) = step_cache.check_step(filename_stamp, name, 'trim, join & collapse', reads, preprocess, 
+                                           ", ".join(version), Debug)
+    collapsed = {'tabular': os.path.join(sample_folder, name + '.rc'),
+                 'fastq': os.path.join(sample_folder, name + '_collapsed.fastq')}
+    if not done:
+        print ('+ Trim, join and collapse reads for sample %s' %name)
+        collapsed = smallRNA_stream.preprocess(reads, sample_folder, name, threads, preprocess['adapters'], 
+                                               preprocess['extra'], preprocess['perc_diff'], cutadapt_exe, 
+                                               fastqjoin_exe, Debug)
+        if not collapsed:
+            return (False)
+        
+        print ('\t%s reads collapsed into %s unique sequences [%s]' %(collapsed['reads'], collapsed['unique'], name))
+        step_cache.save_step(filename_stamp, record)
+        
+    return (collapsed)
+
+###############       
+def java_batch_caller(sample_frame, outdir_dict, options, outdir, Debug):
+    """
+    Runs sRNAbench and miraligner for all samples pending within a single Java process for each software.
+    
+    Reads are collapsed first for all samples. Time stamps are saved for each sample succeeded: samples
+    failed or not processed are executed again individually by :func:`XICRA.modules.miRNA.miRNA_analysis`.
+    """
+    java_exe = set_config.get_exe('java', Debug=Debug)
+    if not java_batch.batch_available(java_exe):
+        print (colored("** ATTENTION: Java 11 to 23 is required for --java_batch. Samples would be analysed individually...", 'yellow'))
+        return ()
+    
+    ## collapse reads for all samples
+    print ("+ Collapse reads for all samples...")
+    if options.preprocess:
+        jobs = [ scheduler.Job(name, preprocess_caller, sorted(cluster["sample"].tolist()), 
+                               functions.files_functions.create_subfolder('collapsed', outdir_dict[name]), name, 
+                               scheduler.THREADS, options.preprocess, Debug, 
+                               files=cluster["sample"].tolist()) for name, cluster in sample_frame ]
     else:
+        jobs = [ scheduler.Job(name, collapse_caller, sorted(cluster["sample"].tolist()), 
+                               functions.files_functions.create_subfolder('collapsed', outdir_dict[name]), name, Debug, 
+                               files=cluster["sample"].tolist()) for name, cluster in sample_frame ]
+    collapsed_dict = scheduler.run_jobs(jobs, options.threads, Debug, scheduler.history_file(outdir), 
+                                        "preprocess" if options.preprocess else "collapse")
+    
+    ## samples pending for each software are split into batches: one Java process 
+    ## for each worker available, as samples would be executed individually
+    java_soft = [ soft for soft in options.soft_name if soft in ('sRNAbench', 'miraligner') ]
+    workers = max(1, int(options.threads) // max(1, len(java_soft)))
+    jobs = []
+    for soft in java_soft:
+        sizes = {}
+        for name, collapsed in collapsed_dict.items():
+            if collapsed and not java_step(soft, name, collapsed, outdir_dict, options.species, options.miraligner_db, Debug)[2]:
+                sizes[name] = os.path.getsize(collapsed['tabular'])
+        
+        batches = java_batch.split_batches(sizes, workers)
+        if batches:
+            print ("+ Running %s for %s samples within %s Java process(es)..." %(soft, len(sizes), len(batches)))
+        for number, batch in enumerate(batches):
+            batch_folder = functions.files_functions.create_subfolder('java_batch_%s_%s' %(soft, number + 1), outdir)
+            jobs.append(scheduler.Job('%s_%s' %(soft, number + 1), java_batch_soft, soft, 
+                                      { name: collapsed_dict[name] for name in batch }, outdir_dict, scheduler.THREADS, 
+                                      options.species, options.miraligner_db, batch_folder, Debug, 
+                                      files=[ collapsed_dict[name]['tabular'] for name in batch ], 
+                                      max_threads=soft_max_threads.get(soft)))
+    scheduler.run_jobs(jobs, options.threads, Debug)
+
+###############       
+def java_step(soft, name, collapsed, outdir_dict, species, database, Debug):
+    """
+    Returns sample folder, time stamp, True/False if results are up to date and record for sRNAbench or miraligner.
+    """
+    sample_folder = functions.files_functions.create_subfolder(soft, outdir_dict[name])
+    if soft == 'sRNAbench':
+        return ((sample_folder,) + sRNAbench_step([collapsed['tabular']], sample_folder, name, species, Debug))
+    return ((sample_folder,) + miraligner_step([collapsed['tabular']], sample_folder, name, database, species, Debug))
+
+###############       
+def java_batch_soft(soft, collapsed_dict, outdir_dict, threads, species, database, batch_folder, Debug):
+    """
+    Runs sRNAbench or miraligner for the samples pending given within a single Java process 
+    (see :func:`XICRA.scripts.java_batch.run_batch`).
+    """
+    pending = {}
+    records = {}
+    for name, collapsed in collapsed_dict.items():
+        (sample_folder, filename_stamp, done, record) = java_step(soft, name, collapsed, outdir_dict, species, database, Debug)
+        if done:
+            continue
+        
+        if soft == 'sRNAbench':
+            (args, logfile) = sRNAbench_args([collapsed['tabular']], sample_folder, threads, species, Debug)
+        else:
+            (args, logfile) = miraligner_args([collapsed['tabular']], sample_folder, name, database, species)
+        pending[name] = (args, logfile)
+        records[name] = (filename_stamp, record)
+    
+    if not pending:
+        return ()
+    
+    exe = set_config.get_exe(soft, Debug=Debug)
+    results = java_batch.run_batch(set_config.get_exe('java', Debug=Debug), exe, pending, batch_folder, Debug)
+    
+    for name in pending:
+        if results.get(name) == 0:
+            step_cache.save_step(*records[name])
+        else:
+            print (colored('** %s failed or not processed for sample %s within batch. It would be executed individually...' %(soft, name), 'yellow'))
+
+###############       
+def sRNAbench_step(reads, sample_folder, name, species, Debug):
+    """Returns time stamp, True/False if results are up to date and record for sRNAbench step."""
+    # check if previously generated and succeeded with same reads, parameters and version
+    filename_stamp = sample_folder + '/.success'
+    sRNAbench_exe = set_config.get_exe("sRNAbench", Debug=Debug)
+    (done, record) = step_cache.check_step(filename_stamp, name, 'sRNAbench', reads, {'species': species}, 
+                                           step_cache.tool_version('sRNAbench', sRNAbench_exe), Debug)
+    return (filename_stamp, done, record)
+
+###############       
+def sRNAbench_caller(reads, sample_folder, name, threads, species, Debug):
+    (filename_stamp, done, record) = sRNAbench_step(reads, sample_folder, name, species, Debug)
+    if not done:
         # Call sRNAbench
         code_returned = sRNAbench(reads, sample_folder, name, threads, species, Debug)
         if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, record)
         else:
             print ('** Sample %s failed...' %name)
             return(False)
@@ -316,8 +570,8 @@ def sRNAbench_caller(reads, sample_folder, name, threads, species, Debug):
     return(True)
 
 ###############       
-def sRNAbench (reads, outpath, file_name, num_threads, species, Debug):
-    
+def sRNAbench_args(reads, outpath, num_threads, species, Debug):
+    """Returns sRNAbench arguments and log file."""
     sRNAbench_exe = set_config.get_exe("sRNAbench", Debug=Debug)
     
     ## set as option
@@ -333,28 +587,39 @@ def sRNAbench (reads, outpath, file_name, num_threads, species, Debug):
         print (colored("** ERROR: Only 1 fastq file is allowed please joined reads before...", 'red'))
         exit()
     
+    ## create arguments
+    args = ['dbPath=' + sRNAbench_db, 'input=' + reads[0], 'output=' + outpath, 'p=' + str(num_threads),
+            'microRNA=' + species, 'isoMiR=true', 'plotLibs=true', 'graphics=true',
+            'plotMiR=true', 'bedGraphMode=true', 'writeGenomeDist=true',
+            'chromosomeLevel=true', 'chrMappingByLength=true']
+    
+    return (args, logfile)
+
+###############       
+def sRNAbench (reads, outpath, file_name, num_threads, species, Debug):
+    
+    sRNAbench_exe = set_config.get_exe("sRNAbench", Debug=Debug)
+    (args, logfile) = sRNAbench_args(reads, outpath, num_threads, species, Debug)
+    
     ## create command    
     java_exe = set_config.get_exe('java', Debug=Debug)
-    cmd = '%s -jar %s dbPath=%s input=%s output=%s' %(java_exe, sRNAbench_exe, sRNAbench_db, reads[0], outpath)  
-    cmd = cmd + ' microRNA=%s isoMiR=true plotLibs=true graphics=true' %species 
-    cmd = cmd + ' plotMiR=true bedGraphMode=true writeGenomeDist=true'
-    cmd = cmd + ' chromosomeLevel=true chrMappingByLength=true > ' + logfile 
+    cmd = '%s -jar %s %s > %s' %(java_exe, sRNAbench_exe, " ".join(args), logfile)
     
     return(functions.system_call_functions.system_call(cmd))
 
 ###############       
 def optimir_caller(reads, sample_folder, name, threads, matureFasta, hairpinFasta, miRNA_gff, species, Debug):
-    # check if previously generated and succeeded
+    # check if previously generated and succeeded with same reads, miRBase files and version
     filename_stamp = sample_folder + '/.success'
-    if os.path.isfile(filename_stamp):
-        stamp = functions.time_functions.read_time_stamp(filename_stamp)
-        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'OptimiR'), 'yellow'))
-    else:
-        # Call sRNAbench
-	## no species option for OptimiR
+    optimir_exe = set_config.get_exe("optimir", Debug=Debug)
+    (done, record) = step_cache.check_step(filename_stamp, name, 'OptimiR', reads + [matureFasta, hairpinFasta, miRNA_gff], {}, 
+                                           step_cache.tool_version('optimir', optimir_exe), Debug)
+    if not done:
+        # Call OptimiR
+        ## no species option for OptimiR
         code_returned = optimir(reads, sample_folder, name, threads, matureFasta, hairpinFasta, miRNA_gff,  Debug)
         if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, record)
         else:
             print ('** Sample %s failed...' %name)
             return(False)
@@ -379,17 +644,24 @@ def optimir (reads, outpath, file_name, num_threads, matureFasta, hairpinFasta,
     return(functions.system_call_functions.system_call(cmd))
 
 ###############       
-def miraligner_caller(reads, sample_folder, name, threads, database, species, Debug):
-    # check if previously generated and succeeded
+def miraligner_step(reads, sample_folder, name, database, species, Debug):
+    """Returns time stamp, True/False if results are up to date and record for miraligner step."""
+    # check if previously generated and succeeded with same reads, miRBase files, parameters and version
     filename_stamp = sample_folder + '/.success'
-    if os.path.isfile(filename_stamp):
-        stamp = functions.time_functions.read_time_stamp(filename_stamp)
-        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'sRNAbench'), 'yellow'))
-    else:
+    miraligner_exe = set_config.get_exe("miraligner", Debug=Debug)
+    db_files = [os.path.join(database, 'hairpin.fa'), os.path.join(database, 'miRNA.str')]
+    (done, record) = step_cache.check_step(filename_stamp, name, 'miraligner', reads + db_files, {'species': species}, 
+                                           step_cache.tool_version('miraligner', miraligner_exe), Debug)
+    return (filename_stamp, done, record)
+
+###############       
+def miraligner_caller(reads, sample_folder, name, threads, database, species, Debug):
+    (filename_stamp, done, record) = miraligner_step(reads, sample_folder, name, database, species, Debug)
+    if not done:
         # Call miralinger
         code_returned = miraligner(reads, sample_folder, name, database, species, Debug)
         if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, record)
         else:
             print ('** Sample %s failed...' %name)
             return(False)
@@ -397,9 +669,8 @@ def miraligner_caller(reads, sample_folder, name, threads, database, species, De
     return(True)
 
 ###############       
-def miraligner (reads, outpath, file_name, database, species, Debug):
-    
-    miraligner_exe = set_config.get_exe("miraligner", Debug=Debug)
+def miraligner_args(reads, outpath, file_name, database, species):
+    """Returns miraligner arguments and log file."""
     logfile = os.path.join(outpath, 'miraligner.log')
     
     ## output
@@ -409,36 +680,43 @@ def miraligner (reads, outpath, file_name, database, species, Debug):
         print (colored("** ERROR: Only 1 fastq file is allowed please joined reads before...", 'red'))
         exit()
     
-    ## create tabular information of reads
-    tabular_info = os.path.join(outpath, file_name + '-tab.freq.txt')
-    fasta_functions.reads2tabular(reads[0], tabular_info)
+    ## reads provided as tabular information (sequence & count): see collapse_caller
+    args = ['-db', database, '-sub', '1', '-add', '3', '-trim', '3', '-s', species, '-i', reads[0], '-o', outpath_file]
+    return (args, logfile)
+
+###############       
+def miraligner (reads, outpath, file_name, database, species, Debug):
+    
+    miraligner_exe = set_config.get_exe("miraligner", Debug=Debug)
+    (args, logfile) = miraligner_args(reads, outpath, file_name, database, species)
     
     ## create command 
     java_exe = set_config.get_exe('java', Debug=Debug)
-    cmd = '%s -jar %s -db %s -sub 1 -add 3 -trim 3 -s %s -i %s -o %s 2> %s' %(
-        java_exe, miraligner_exe, database, species, tabular_info, outpath_file, logfile)
+    cmd = '%s -jar %s %s 2> %s' %(java_exe, miraligner_exe, " ".join(args), logfile)
     
     return(functions.system_call_functions.system_call(cmd))
 
 
 ###############       
-def miRTop_caller(results_folder, mirtop_folder, name, threads, miRNA_gff, hairpinFasta, format, species, Debug):
+def miRTop_caller(results_folder, mirtop_folder, name, threads, mirtop_reference, format, Debug, collapsed=None):
     
     # check if previously generated and succeeded
-    mirtop_folder_gff = functions.files_functions.create_subfolder('gff', mirtop_folder)
-    mirtop_folder_stats = functions.files_functions.create_subfolder('stats', mirtop_folder)
-    mirtop_folder_counts = functions.files_functions.create_subfolder('counts', mirtop_folder)
-    mirtop_folder_counts = functions.files_functions.create_subfolder('export', mirtop_folder)
-
-    filename_stamp = mirtop_folder_counts + '/.success'
-    if os.path.isfile(filename_stamp):
-        stamp = functions.time_functions.read_time_stamp(filename_stamp)
-        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'miRTop'), 'yellow'))
-    else:
+    ## gff and counts folders are written by miRTop
+    functions.files_functions.create_subfolder('gff', mirtop_folder)
+    functions.files_functions.create_subfolder('counts', mirtop_folder)
+    mirtop_folder_export = functions.files_functions.create_subfolder('export', mirtop_folder)
+
+    ## software results and miRBase files are inputs
+    filename_stamp = mirtop_folder_export + '/.success'
+    inputs = [results_folder, mirtop_reference.hairpin, mirtop_reference.gtf] + ([collapsed] if collapsed else [])
+    (done, record) = step_cache.check_step(filename_stamp, name, 'miRTop', inputs, 
+                                           {'format': format.lower(), 'species': mirtop_reference.sps}, 
+                                           step_cache.tool_version('mirtop'), Debug)
+    if not done:
         # Call miRTop
-        code_returned = miRTop(results_folder, mirtop_folder, name, threads, format.lower(), miRNA_gff, hairpinFasta, species, Debug)
+        code_returned = miRTop(results_folder, mirtop_folder, name, threads, format.lower(), mirtop_reference, Debug, collapsed)
         if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, record)
         else:
             print ('** Sample %s failed...' %name)
             return(False)
@@ -446,19 +724,19 @@ def miRTop_caller(results_folder, mirtop_folder, name, threads, miRNA_gff, hairp
         return(True)
 
 ###############
-def miRTop(results_folder, sample_folder, name, threads, format, miRNA_gff, hairpinFasta, species,Debug):
-
-    miRTop_exe = set_config.get_exe('miRTop', Debug=Debug)
-    logfile = os.path.join(sample_folder, name + '.log')
+def miRTop(results_folder, sample_folder, name, threads, format, mirtop_reference, Debug, collapsed=None):
+    """
+    Creates isomiRs gff, counts and export information for a sample.
     
-    ## folders
-    mirtop_folder_gff = os.path.join(sample_folder, 'gff')
-    mirtop_folder_stats = os.path.join(sample_folder, 'stats')
-    mirtop_folder_counts = os.path.join(sample_folder, 'counts')
-    mirtop_folder_export = os.path.join(sample_folder, 'export')
+    miRTop python library is called within XICRA process using the reference
+    information previously loaded (see :func:`XICRA.scripts.isomiR_annotation.load_reference`)
+    instead of calling mirtop gff, counts and export for each sample.
     
+    If collapsed read counts are provided, expression for each isomiR is multiplied by the 
+    counts of its sequence.
+    """
     ## get info according to software
-    if format == "sRNAbench":
+    if format == "srnabench":
         ## get sRNAbench info
         reads_annot = os.path.join(results_folder, "reads.annotation")
         
@@ -487,77 +765,14 @@ def miRTop(results_folder, sample_folder, name, threads, format, miRNA_gff, hair
             print (colored("\tNo isomiRs detected for sample [%s -- %s]" %(name, 'miraligner'), 'yellow'))
             return (False)
     
-        
-    ## miRTop analysis gff
-    filename_stamp_gff = mirtop_folder_gff + '/.success'
-    if os.path.isfile(filename_stamp_gff):
-        stamp = functions.time_functions.read_time_stamp(filename_stamp_gff)
-        print (colored("\tA previous command generated results on: %s [%s -- %s - gff]" %(stamp, name, 'miRTop'), 'yellow'))
-    else:
-        print ('Creating isomiRs gtf file for sample %s' %name)
-        cmd = miRTop_exe + ' gff --sps %s --hairpin %s --gtf %s --format %s -o %s %s 2> %s' %(
-                                                    species, hairpinFasta, miRNA_gff, format,
-                                                    mirtop_folder_gff, results_folder, logfile)
-        
-        ## execute
-        code_miRTop = functions.system_call_functions.system_call(cmd)
-        if code_miRTop:
-            functions.time_functions.print_time_stamp(filename_stamp_gff)
-        else:
-            return(False)
-        
-    ## miRTop stats
-    mirtop_folder_gff_file = os.path.join(mirtop_folder_gff, 'mirtop.gff')
-
-    #filename_stamp_stats = mirtop_folder_stats + '/.success'
-    #if os.path.isfile(filename_stamp_stats):
-    #    stamp = functions.time_functions.read_time_stamp(filename_stamp_stats)
-    #    print (colored("\tA previous command generated results on: %s [%s -- %s - stats]" %(stamp, name, 'miRTop'), 'yellow'))
-    #else:
-    #    print ('Creating isomiRs stats for sample %s' %name)
-    #    cmd_stats = miRTop_exe + ' stats -o %s %s 2>> %s' %(mirtop_folder_stats, mirtop_folder_gff_file, logfile)
-    #    code_miRTop_stats = functions.system_call_functions.system_call(cmd_stats)
-    #    if code_miRTop_stats:
-    #        functions.time_functions.print_time_stamp(filename_stamp_stats)
-    #    else:
-    #        return(False)
-            
-    ## miRTop counts
-    filename_stamp_counts = mirtop_folder_counts + '/.success'
-    if os.path.isfile(filename_stamp_counts):
-        stamp = functions.time_functions.read_time_stamp(filename_stamp_counts)
-        print (colored("\tA previous command generated results on: %s [%s -- %s - counts]" %(stamp, name, 'miRTop'), 'yellow'))
-    else:
-        print ('Creating isomiRs counts for sample %s' %name)
-        ## if both succeeded
-        cmd_stats = miRTop_exe + ' counts -o %s --gff %s --hairpin %s --gtf %s --sps %s 2>> %s' %(mirtop_folder_counts, mirtop_folder_gff_file, hairpinFasta, miRNA_gff, species, logfile)
-        code_miRTop_counts = functions.system_call_functions.system_call(cmd_stats)
-        
-        if code_miRTop_counts:
-            functions.time_functions.print_time_stamp(filename_stamp_counts)
-        else:
-            return(False)
-    
-    ## miRTop export
-    filename_stamp_export = mirtop_folder_export + '/.success'
-    if os.path.isfile(filename_stamp_export):
-        stamp = functions.time_functions.read_time_stamp(filename_stamp_export)
-        print (colored("\tA previous command generated results on: %s [%s -- %s - export]" %(stamp, name, 'miRTop'), 'yellow'))
-    else:
-        print ('Creating isomiRs export information for sample %s' %name)
-        ## if both succeeded
-        cmd_export = miRTop_exe + ' export -o %s --hairpin %s --gtf %s --sps %s --format isomir %s 2> %s' %(mirtop_folder_export, hairpinFasta, miRNA_gff, species, mirtop_folder_gff_file, logfile)
-        code_miRTop_export = functions.system_call_functions.system_call(cmd_export)
-        
-        if code_miRTop_export:
-            functions.time_functions.print_time_stamp(filename_stamp_export)
-        else:
-            return(False)
+    ## miRTop analysis: gff, counts & export
+    print ('Creating isomiRs gtf, counts and export information for sample %s' %name)
+    try:
+        counts = collapse_reads.read_counts(collapsed) if collapsed else None
+        outdir_tsv = isomiR_annotation.isomiR_annotation(results_folder, format, mirtop_reference, sample_folder, counts)
+    except Exception as exc:
+        print (colored("** ERROR: miRTop annotation failed for sample [%s -- %s]: %s" %(name, format, exc), 'red'))
+        return (False)
     
     ## return all success
-    outdir_tsv = os.path.join(mirtop_folder_counts, 'mirtop.tsv')
     return (outdir_tsv)
-    
-    ## if any command failed
-    #return(False)
-    
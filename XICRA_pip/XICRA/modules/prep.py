@@ -12,12 +12,12 @@ import time
 import os
 import sys
 from io import open
-import shutil
 import pandas as pd
 from termcolor import colored
 
 ## import my modules
 from XICRA.modules import help_XICRA
+from XICRA.scripts import file_transfer
 from HCGB import functions
 from HCGB import sampleParser
 
@@ -171,9 +171,8 @@ def run_prep(options):
     if (options.merge_Reads):
         print ("+ Sample files will be merged...")
         ## TODO: check when rename option provided
-        pd_samples_merged = sampleParser.merge.one_file_per_sample(
-            pd_samples_retrieved, outdir_dict, options.threads,    
-            final_dir, options.debug)
+        pd_samples_merged = merge_samples(pd_samples_retrieved, outdir_dict, options.threads,    
+                                          final_dir, options.debug)
         
         if (options.rename):
             print ("+ Merge files have been renamed...")
@@ -206,10 +205,10 @@ def run_prep(options):
         print ("+ Sample files will be linked...")    
     
     list_reads = []
+    transfer_dict = {}
     for index, row in pd_samples_retrieved.iterrows():
         if (options.copy_reads):
-            ## TODO: debug & set threads to copy faster
-            shutil.copy(row['sample'], os.path.join(outdir_dict[row['new_name']], row['new_file'] ))            
+            transfer_dict[os.path.join(outdir_dict[row['new_name']], row['new_file'])] = [row['sample']]
             string = row['sample'] + '\t' + os.path.join(outdir_dict[row['new_name']], row['new_file']) + '\n'
             copy_details_hd.write(string)            
         else:
@@ -220,8 +219,11 @@ def run_prep(options):
                                                  os.path.join(outdir_dict[row['new_name']], row['new_file']))
 
     if (options.copy_reads):
-        print ("+ Sample files have been copied...")
+        ## copy in parallel
         copy_details_hd.close()
+        file_transfer.transfer_files(transfer_dict, options.threads, 
+                                     copy_details.replace('_prep_copyDetails.txt', '_prep_copyThroughput.txt'), options.debug)
+        print ("+ Sample files have been copied...")
     else:
         if not options.project:
             functions.files_functions.get_symbolic_link(list_reads, outdir)
@@ -231,3 +233,68 @@ def run_prep(options):
 
     print ("+ Exiting prep module.")
     return()
+
+################################
+def merge_samples(dataFrame, outdir_dict, threads, outdir, Debug=False):
+    """
+    Merges fastq files from different lanes for each sample and read pair.
+    
+    Files are merged in parallel (see :func:`XICRA.scripts.file_transfer.transfer_files`) 
+    and gzip integrity is checked for merged files.
+    
+    :param dataFrame: Dataframe containing sample information as retrieved by :func:`HCGB.sampleParser.files.get_files`.
+    :param outdir_dict: Dictionary containing sample names as keys and output folder as values.
+    :param threads: Number of files to merge at the same time.
+    :param outdir: Folder to write merge details.
+    :param Debug: True/False for debugging messages.
+    
+    :returns: Dataframe containing new_name, dirname, read_pair, new_file, ext and gz for each file merged.
+    """
+    ## merge sequencing files for sample, no matter of sector or lane generated.    
+    list_samples = set(dataFrame['new_name'].tolist())
+    print (colored("\t" + str(len(list_samples)) + " samples to be merged from the input provided...", 'yellow'))
+    print ("+ Merging sequencing files for samples")
+    
+    sample_frame = dataFrame.groupby(["new_name", "read_pair"])
+    
+    ### get extension for files
+    ## might generate a bug if several extension or some zip/unzip files provided
+    ext_list = dataFrame.ext.unique()
+    gz_list = dataFrame.gz.unique()
+    if gz_list[0]:
+        ext = ext_list[0] + '.' + gz_list[0].lstrip('.')
+    else:
+        ext = ext_list[0]
+    
+    ## merge in parallel
+    transfer_dict = {}
+    for name, cluster in sample_frame:
+        outfile = os.path.join(outdir_dict[name[0]], name[0] + '_' + name[1] + '.' + ext)
+        transfer_dict[outfile] = sorted(set(cluster["sample"].tolist()))
+    
+    timestamp = functions.time_functions.create_human_timestamp()
+    file_transfer.transfer_files(transfer_dict, threads, 
+                                 os.path.join(outdir, timestamp + '_prep_mergeThroughput.txt'), Debug)
+    
+    ## return output name merged generated in dataframe
+    name_columns = ("new_name", "dirname", "read_pair", "new_file", "ext", "gz")
+    name_frame = pd.DataFrame(columns=name_columns)
+    
+    ## print to a file
+    merge_details = os.path.join(outdir, timestamp + '_prep_mergeDetails.txt')
+    with open(merge_details, 'w') as merge_details_hd:
+        for name, cluster in sample_frame: ## loop over samples
+            outfile = os.path.join(outdir_dict[name[0]], name[0] + '_' + name[1] + '.' + ext)
+            
+            merge_details_hd.write("####################\n")        
+            merge_details_hd.write("Sample: " + name[0] + '\n')
+            merge_details_hd.write("New name: " + name[0] + '\n')
+            merge_details_hd.write("Read: " + name[1] + '\n')
+            merge_details_hd.write("Files:\n")
+            merge_details_hd.write(",".join(transfer_dict[outfile]))
+            merge_details_hd.write('\n')
+            merge_details_hd.write("####################\n")        
+            
+            name_frame.loc[len(name_frame)] = (name[0], outdir_dict[name[0]], name[1], outfile, ext_list[0], gz_list[0])
+    
+    return (name_frame)
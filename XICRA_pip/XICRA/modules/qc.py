@@ -13,13 +13,14 @@ import re
 import time
 from io import open
 import shutil
-import concurrent.futures
 from termcolor import colored
 import cutadapt
 
 ## import my modules
 from XICRA.scripts import multiQC_report
 from XICRA.scripts import fastqc_caller
+from XICRA.scripts import sample_reads
+from XICRA.scripts import scheduler
 from XICRA.config import set_config
 from XICRA.modules import help_XICRA
 from HCGB import sampleParser
@@ -101,39 +102,44 @@ def run_QC(options):
         functions.files_functions.create_folder(outdir)
     outdir_dict = functions.files_functions.outdir_project(outdir, options.project, pd_samples_retrieved, "fastqc", options.debug)
     
+    ## software required: resolved once for all samples
+    software = ['fastqc'] if options.qc_engine == 'fastqc' else []
+    if not options.skip_report:
+        software.append('multiqc')
+    set_config.init_tools(outdir, software, options.refresh_tools, Debug)
+    
     print ("+ Checking quality for each sample retrieved...")
     start_time_partial = start_time_total
     
     # Group dataframe by sample name
     sample_frame = pd_samples_retrieved.groupby(["name"])
 
-    ## optimize threads
-    name_list = set(pd_samples_retrieved["name"].tolist())
-    threads_job = functions.main_functions.optimize_threads(options.threads, len(name_list)) ## threads optimization
-    max_workers_int = int(options.threads/threads_job)
-
     ## debug message
     if (Debug):
         print (colored("**DEBUG: options.threads " +  str(options.threads) + " **", 'yellow'))
-        print (colored("**DEBUG: max_workers " +  str(max_workers_int) + " **", 'yellow'))
-        print (colored("**DEBUG: cpu_here " +  str(threads_job) + " **", 'yellow'))
 
     ## send for each sample
-    print ("+ Calling fastqc for samples...")    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=int(max_workers_int)) as executor:
-        commandsSent = { executor.submit(fastqc_caller.run_module_fastqc, outdir_dict[name], sorted( cluster["sample"].tolist() ), name, threads_job): name for name, cluster in sample_frame }
-        
-        for cmd2 in concurrent.futures.as_completed(commandsSent):
-            details = commandsSent[cmd2]
-            try:
-                data = cmd2.result()
-            except Exception as exc:
-                print ('***ERROR:')
-                print (cmd2)
-                print('%r generated an exception: %s' % (details, exc))
+    if options.qc_engine == 'native':
+        print ("+ Checking quality for samples within XICRA (FastQC format)...")    
+    else:
+        print ("+ Calling fastqc for samples...")    
+    adapters = [ adapter for adapter in (options.adapters_a, options.adapters_A) if adapter ]
+    jobs = [ scheduler.Job(name, fastqc_caller.run_module_fastqc, outdir_dict[name], sorted( cluster["sample"].tolist() ), 
+                           name, scheduler.THREADS, options.qc_engine, adapters, options.sample_reads, 
+                           files=cluster["sample"].tolist()) for name, cluster in sample_frame ]
+    scheduler.run_jobs(jobs, options.threads, Debug, scheduler.history_file(outdir), "qc")
 
     print ("+ FASTQC for samples has finished...")    
     
+    ## report fraction of reads sampled
+    if (options.sample_reads):
+        print ("+ Quality was checked for a subsample of reads of each file:")
+        for name in sorted(outdir_dict):
+            for details in sample_reads.read_summary(outdir_dict[name]):
+                print ("\t%s: %s reads sampled of %s (%.2f %%, %s)" %(details['file'], details['sampled'], 
+                                                                    details['total'], 100*float(details['fraction']), 
+                                                                    details['method']))
+    
     ## functions.time_functions.timestamp
     start_time_partial = functions.time_functions.timestamp(start_time_partial)
 
@@ -158,6 +164,12 @@ def run_QC(options):
             print ("\n")
         
         fastqc_report = functions.files_functions.create_subfolder("FASTQC", outdir_report)
+
+        ## include fraction of reads sampled
+        if (options.sample_reads):
+            sampling_table = os.path.join(fastqc_report, 'sampling_mqc.tsv')
+            if sample_reads.report_table(set(outdir_dict.values()), sampling_table):
+                my_outdir_list.add(sampling_table)
         multiQC_report.multiQC_module_call(my_outdir_list, "FASTQC", fastqc_report,"")
         print ('\n+ A summary HTML report of each sample is generated in folder: %s' %fastqc_report)
 
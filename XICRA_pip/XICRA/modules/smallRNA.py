@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Small RNA analysis from raw reads: trimming, joining and miRNA analysis for each sample.
+
+Trimmed and joined reads are streamed into the collapsing step and never written on disk
+(see :func:`XICRA.scripts.smallRNA_stream.preprocess`). miRNA analysis is then executed as in
+the miRNA module.
+"""
+## import useful modules
+from termcolor import colored
+
+## import my modules
+from XICRA.modules import help_XICRA
+from XICRA.modules import miRNA
+
+##############################################
+def run_smallRNA(options):
+
+    ##################################
+    ### show help messages if desired
+    ##################################
+    if (options.help_trimm_adapters):
+        ## help on trimm adapters
+        help_XICRA.print_help_adapters()
+        exit()
+
+    ## rest of help messages are shown by miRNA module
+    if (options.help_format or options.help_project or options.help_miRNA):
+        return (miRNA.run_miRNA(options))
+
+    ## check adapters provided
+    if (not options.adapters_a):
+        print (colored("** ERROR: No adapter trimming options provided...", 'red'))
+        print ("Please provide --adapters_a (and --adapters_A for paired-end reads)")
+        exit()
+
+    if (not options.single_end and not options.adapters_A):
+        print (colored("** ERROR: Missing adapter information for paired-end reads...", 'red'))
+        print ("Please provide --adapters_A")
+        exit()
+
+    ## create dictionary with
+    adapters_dict = {'adapter_a': options.adapters_a}
+    if not options.single_end:
+        adapters_dict['adapter_A'] = options.adapters_A
+
+    ## trimming, joining and collapsing options
+    options.preprocess = {'adapters': adapters_dict, 'extra': options.extra,
+                          'perc_diff': (options.perc_diff or 0) if not options.single_end else None,
+                          'join_engine': options.join_engine if not options.single_end else None}
+
+    return (miRNA.run_miRNA(options))
@@ -11,13 +11,17 @@ import os
 import sys
 import re
 import time
+import shlex
+import subprocess
 from io import open
 import shutil
-import concurrent.futures
 from termcolor import colored
 
 ## import my modules
 from XICRA.scripts import multiQC_report
+from XICRA.scripts import scheduler
+from XICRA.scripts import step_cache
+from XICRA.scripts import compression
 from XICRA.config import set_config
 from XICRA.modules import help_XICRA
 from HCGB import functions
@@ -120,36 +124,27 @@ def run_trimm(options):
     ## for samples
     outdir_dict = functions.files_functions.outdir_project(outdir, options.project, pd_samples_retrieved, "trimm", options.debug)
     
-    ## optimize threads
-    name_list = set(pd_samples_retrieved["new_name"].tolist())
-    threads_job = functions.main_functions.optimize_threads(options.threads, len(name_list)) ## threads optimization
-    max_workers_int = int(options.threads/threads_job)
-
+    ## software required: resolved once for all samples
+    software = ['cutadapt']
+    if not options.skip_report:
+        software.append('multiqc')
+    set_config.init_tools(outdir, software, options.refresh_tools, Debug)
+    
     ## debug message
     if (Debug):
         print (colored("**DEBUG: options.threads " +  str(options.threads) + " **", 'yellow'))
-        print (colored("**DEBUG: max_workers " +  str(max_workers_int) + " **", 'yellow'))
-        print (colored("**DEBUG: cpu_here " +  str(threads_job) + " **", 'yellow'))
 
     print ("+ Trimming adapters for each sample retrieved...")    
     
     # Group dataframe by sample name
     sample_frame = pd_samples_retrieved.groupby(["new_name"])
     
-    ## send for each sample
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_int) as executor:
-        commandsSent = { executor.submit(cutadapt_caller, sorted(cluster["sample"].tolist()), 
-                                         outdir_dict[name], name, threads_job, 
-                                         Debug, adapters_dict, options.extra): name for name, cluster in sample_frame }
-
-        for cmd2 in concurrent.futures.as_completed(commandsSent):
-            details = commandsSent[cmd2]
-            try:
-                data = cmd2.result()
-            except Exception as exc:
-                print ('***ERROR:')
-                print (cmd2)
-                print('%r generated an exception: %s' % (details, exc))
+    ## send for each sample: larger samples first and using more threads
+    jobs = [ scheduler.Job(name, cutadapt_caller, sorted(cluster["sample"].tolist()), 
+                           outdir_dict[name], name, scheduler.THREADS, 
+                           Debug, adapters_dict, options.extra, options.intermediate_compression, 
+                           files=cluster["sample"].tolist()) for name, cluster in sample_frame ]
+    scheduler.run_jobs(jobs, options.threads, Debug, scheduler.history_file(outdir), "trimm")
 
     print ("\n\n+ Trimming samples has finished...")
     ## functions.time_functions.timestamp
@@ -205,24 +200,26 @@ def run_trimm(options):
     
 
 #############################################
-def cutadapt_caller(list_reads, sample_folder, name, threads, Debug, adapters, extra):
-    ## check if previously trimmed and succeeded
+def cutadapt_caller(list_reads, sample_folder, name, threads, Debug, adapters, extra, compression_type='none'):
+    ## check if previously trimmed and succeeded with same reads, adapters, compression and version
     filename_stamp = sample_folder + '/.success'
-    if os.path.isfile(filename_stamp):
-        stamp = functions.time_functions.read_time_stamp(filename_stamp)
-        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'cutadapt'), 'yellow'))
-    else:
+    cutadapt_exe = set_config.get_exe('cutadapt')
+    params = {'adapters': adapters, 'extra': extra}
+    if compression_type != 'none':
+        params['compression'] = compression_type
+    (done, record) = step_cache.check_step(filename_stamp, name, 'cutadapt', list_reads, params, 
+                                           step_cache.tool_version('cutadapt', cutadapt_exe), Debug)
+    if not done:
         # Call cutadapt
-        cutadapt_exe = set_config.get_exe('cutadapt')
-        code_returned = cutadapt(cutadapt_exe, list_reads, sample_folder, name, threads, Debug, adapters, extra)
+        code_returned = cutadapt(cutadapt_exe, list_reads, sample_folder, name, threads, Debug, adapters, extra, compression_type)
         if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, record)
         else:
             print ('** Sample %s failed...' %name)
 
 
 #############################################
-def cutadapt (cutadapt_exe, reads, path, sample_name, num_threads, Debug, adapters, extra):
+def cutadapt (cutadapt_exe, reads, path, sample_name, num_threads, Debug, adapters, extra, compression_type='none'):
     """
     
     :param cutadapt_exe:
@@ -233,6 +230,7 @@ def cutadapt (cutadapt_exe, reads, path, sample_name, num_threads, Debug, adapte
     :param Debug:
     :param adapters
     :param extra:
+    :param compression_type: Compression for trimmed reads: none, gzip or zstd.
     
     :type cutadapt_exe:
     :type reads:
@@ -242,74 +240,86 @@ def cutadapt (cutadapt_exe, reads, path, sample_name, num_threads, Debug, adapte
     :type Debug:
     :type adapters: dictionary
     :type extra: string
+    :type compression_type: string
     
     """
     logfile = os.path.join(path, sample_name + '.cutadapt.log')
     
+    ## cutadapt compresses output according to the extension
+    ext = compression.extension(compression_type)
+    
     if (len(reads) == 2):
         if not adapters['adapter_a'] or not adapters['adapter_A']:
              print ("** ERROR: Missing adapter information")
              exit()
         
-        if extra:
-            o_param = os.path.join(path, sample_name + '_temp1_trim_R1.fastq')
-            p_param = os.path.join(path, sample_name + '_temp1_trim_R2.fastq')
-        else:
-            p_param = os.path.join(path, sample_name + '_trim_R2.fastq')
-            o_param = os.path.join(path, sample_name + '_trim_R1.fastq')
+        p_param = os.path.join(path, sample_name + '_trim_R2.fastq' + ext)
+        o_param = os.path.join(path, sample_name + '_trim_R1.fastq' + ext)
         
         ## paired-end mode
-        cmd = '%s -j %s -a %s -A %s -o %s -p %s %s %s > %s' %(cutadapt_exe,  
-                                                                       num_threads, adapters['adapter_a'], 
-                                                                       adapters['adapter_A'], o_param, 
-                                                                       p_param, reads[0], reads[1], logfile)
+        adapter_args = ['-a', adapters['adapter_a'], '-A', adapters['adapter_A']]
+        output_args = ['-o', o_param, '-p', p_param]
 
     elif (len(reads) == 1):
         if not adapters['adapter_a']:
              print ("** ERROR: Missing adapter information")
              exit()
 
-        if extra:
-            o_param = os.path.join(path, sample_name + '_temp1_trim.fastq')
-        else:
-            o_param = os.path.join(path, sample_name + '_trim.fastq')
+        o_param = os.path.join(path, sample_name + '_trim.fastq' + ext)
         
         ## single-end mode:
-        cmd = '%s -j %s -a %s -o %s %s > %s' %(cutadapt_exe, num_threads, 
-                                                        adapters['adapter_a'], o_param, reads[0], logfile)    
+        adapter_args = ['-a', adapters['adapter_a']]
+        output_args = ['-o', o_param]
     else:
         print ('** Wrong number of files provided for sample: %s...' %sample_name)
         return(False)
 
-    ##
-    code = functions.system_call_functions.system_call(cmd)
+    if not (extra):
+        cmd = '%s -j %s %s %s %s > %s' %(cutadapt_exe, num_threads, " ".join(adapter_args), 
+                                         " ".join(output_args), " ".join(reads), logfile)
+        code = functions.system_call_functions.system_call(cmd)
+    else:
+        ## if additional options, adapters are trimmed again together with these options 
+        ## to ensure this options take effect. Reads are streamed from the first cutadapt 
+        ## command into the second one: no intermediate files are written.
+        code = cutadapt_pipe(cutadapt_exe, reads, num_threads, adapter_args, output_args, extra, logfile, Debug)
+    
+    ## remove trimmed reads generated using a different compression
+    if code:
+        for outfile in output_args[1::2]:
+            compression.remove_other_files(outfile)
+    
+    return (code)
 
-    ## if additional options, run a second cutadapt command
-    ## to ensure this options take effect.
-    if (extra):
-        if (len(reads) == 2):
-            o_param2 = os.path.join(path, sample_name + '_trim_R1.fastq')
-            p_param2 = os.path.join(path, sample_name + '_trim_R2.fastq')
-        
-            ## paired-end mode
-            extra_cmd = '%s %s -j %s -a %s -A %s -o %s -p %s %s %s >> %s' %(cutadapt_exe, extra, num_threads, 
-                                                                adapters['adapter_a'], adapters['adapter_A'],
-                                                            o_param2, p_param2, o_param, p_param, logfile)
-        
-        elif (len(reads) == 1):
-            o_param2 = os.path.join(path, sample_name + '_trim.fastq')
-            ## single-end mode:
-            extra_cmd = '%s %s -j %s -a %s -o %s %s >> %s' %(cutadapt_exe, extra, num_threads, adapters['adapter_a'], 
-                                                   o_param2, o_param, logfile)    
-        
-        code2 = functions.system_call_functions.system_call(extra_cmd)
-        
-        ## remove: o_param p_param
-        if (len(reads) == 2):        
-            os.remove(p_param)
-       
-        os.remove(o_param)
-        return (code2)
+#############################################
+def cutadapt_pipe(cutadapt_exe, reads, num_threads, adapter_args, output_args, extra, logfile, Debug):
+    """
+    Trims adapters and then adapters and extra options, streaming reads between two cutadapt processes.
     
-    else:
-        return (code)
+    Paired-end reads are streamed interleaved. Reports for both commands are written into logfile.
+    
+    :returns: True/False if both commands succeeded.
+    """
+    ## split threads between both commands
+    threads_pipe = str(max(1, int(num_threads) // 2))
+    interleaved = ['--interleaved'] if len(reads) == 2 else []
+    
+    cmd1 = [cutadapt_exe, '-j', threads_pipe] + adapter_args + interleaved + reads
+    cmd2 = [cutadapt_exe] + shlex.split(extra) + ['-j', threads_pipe] + adapter_args + interleaved + output_args + ['-']
+    
+    ## debugging messages
+    if Debug:
+        print (colored("** DEBUG: cutadapt: %s | %s" %(" ".join(cmd1), " ".join(cmd2)), 'yellow'))
+    
+    with open(logfile, 'w') as log_handle:
+        ## report for first command is printed in stderr when output is sent to stdout
+        first = subprocess.Popen(cmd1, stdout=subprocess.PIPE, stderr=log_handle)
+        second = subprocess.Popen(cmd2, stdin=first.stdout, stdout=log_handle, stderr=log_handle)
+        first.stdout.close()
+        code2 = second.wait()
+        code1 = first.wait()
+    
+    if code1 or code2:
+        print (colored("** ERROR: cutadapt failed (%s, %s). See %s" %(code1, code2, logfile), 'red'))
+        return (False)
+    return (True)
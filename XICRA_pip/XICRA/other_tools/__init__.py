@@ -1,5 +1,12 @@
+import importlib
+
 __all__ = [
     'tools'    
 ]
 
-from XICRA.other_tools import *
+## modules are imported when first used (e.g. XICRA.other_tools.module): importing
+## the package does not load every module and its dependencies
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(__name__ + '.' + name)
+    raise AttributeError("module %r has no attribute %r" %(__name__, name))
@@ -11,23 +11,22 @@ import re
 import sys
 from sys import argv
 import subprocess
-from termcolor import colored
-import concurrent.futures
 
 ## import my modules
 from XICRA.config import set_config
+from XICRA.scripts import scheduler
+from XICRA.scripts import step_cache
+from XICRA.scripts import biotype_counter
 
 ## import HCGB
 from HCGB.functions import system_call_functions, main_functions, time_functions
 from HCGB.functions import files_functions, math_functions
 
-## plots
 import pandas as pd
-import matplotlib
+import numpy as np
 
-matplotlib.use('agg')
-import matplotlib.pyplot as plt
-from pandas.plotting import table
+## files read by each process when generating the summary matrix
+biotype_batch = 200
 
 #####################
 def help_info():
@@ -36,7 +35,13 @@ def help_info():
 	exit()
 
 #####################
-def biotype_all(featureCount_exe, path, gtf_file, bam_file, name, threads, Debug, allow_multimap, stranded):
+def biotype_all(featureCount_exe, path, gtf_file, bam_file, name, threads, Debug, allow_multimap, stranded, biotype_index=None):
+	"""
+	Counts reads for each transcript biotype and parses results for a sample.
+	
+	If biotype_index is provided (see :func:`XICRA.scripts.biotype_counter.build_index`), reads are counted 
+	within XICRA process. Otherwise, featureCounts binary provided is called.
+	"""
 	
 	## folder for results
 	if not os.path.isdir(path):
@@ -45,57 +50,71 @@ def biotype_all(featureCount_exe, path, gtf_file, bam_file, name, threads, Debug
 	out_file = os.path.join(path, 'featureCount.out')
 	logfile = os.path.join(path, name + '_RNAbiotype.log')
 
-	filename_stamp_all = path + '/.success_all'
-	if os.path.isfile(filename_stamp_all):
-		stamp = time_functions.read_time_stamp(filename_stamp_all)
-		print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'RNAbiotype'), 'yellow'))
-		return()
-
+	## each step is checked using its inputs, parameters and version: see XICRA.scripts.step_cache
+	filename_stamp_featureCounts = path + '/.success_featureCounts'
+	if biotype_index:
+		version = step_cache.tool_version('XICRA')
 	else:
-		filename_stamp_featureCounts = path + '/.success_featureCounts'
-		if os.path.isfile(filename_stamp_featureCounts):
-			stamp = time_functions.read_time_stamp(filename_stamp_featureCounts)
-			print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'featureCounts'), 'yellow'))
-		else:
-
-			## debugging messages
-			if Debug:
-				print ("** DEBUG:")
-				print ("featureCounts system call for sample: " + name)
-				print ("out_file: " + out_file)
-				print ("logfile: " + logfile)
-		
-			## send command for feature count
-			## Allow multimapping
-			if allow_multimap:
-				cmd_featureCount = ('%s -s %s -M -O -T %s -p -t exon -g transcript_biotype -a %s -o %s %s 2> %s' %(
-					featureCount_exe, stranded, threads, gtf_file, out_file, bam_file, logfile)
-				)
-			else:
-				cmd_featureCount = ('%s -s %s --largestOverlap -T %s -p -t exon -g transcript_biotype -a %s -o %s %s 2> %s' %(
-					featureCount_exe, stranded, threads, gtf_file, out_file, bam_file, logfile)
-				)
-				
-				
-			## system call
-			cmd_featureCount_code = system_call_functions.system_call(cmd_featureCount, False, True)
-			if not cmd_featureCount_code:
-				print("** ERROR: featureCount failed for sample " + name)
-				exit()
-				
-			## print time stamp
-			time_functions.print_time_stamp(filename_stamp_featureCounts)
+		version = step_cache.tool_version('featureCounts', featureCount_exe)
+	(done, record) = step_cache.check_step(filename_stamp_featureCounts, name, 'featureCounts', [bam_file, gtf_file], 
+										{'multimapping': allow_multimap, 'stranded': stranded, 'native': bool(biotype_index)}, 
+										version, Debug)
+	if not done and biotype_index:
+		## debugging messages
+		if Debug:
+			print ("** DEBUG:")
+			print ("Count biotypes for sample: " + name)
+			print ("out_file: " + out_file)
 		
-		## parse results
-		(extended_Stats_file, RNAbiotypes_stats_file) = parse_featureCount(out_file, path, name, bam_file, Debug)
+		## count reads within process using annotation loaded once
+		(counts, summary) = biotype_counter.count_bam(bam_file, biotype_index, int(stranded), allow_multimap, threads)
+		biotype_counter.write_results(out_file, bam_file, biotype_index, counts, summary)
+		with open(logfile, 'w') as log_handle:
+			log_handle.write("XICRA biotype_counter: %s fragments assigned\n" %summary['Assigned'])
 		
+		## print time stamp
+		step_cache.save_step(filename_stamp_featureCounts, record)
+	
+	elif not done:
+
 		## debugging messages
 		if Debug:
 			print ("** DEBUG:")
-			print ("extended_Stats: " + extended_Stats_file)
-			print (main_functions.get_data(extended_Stats_file, '\t', 'header=None'))
-			print ("RNAbiotypes_stats: " + RNAbiotypes_stats_file)
-			print (main_functions.get_data(RNAbiotypes_stats_file, '\t', 'header=None'))
+			print ("featureCounts system call for sample: " + name)
+			print ("out_file: " + out_file)
+			print ("logfile: " + logfile)
+	
+		## send command for feature count
+		## Allow multimapping
+		if allow_multimap:
+			cmd_featureCount = ('%s -s %s -M -O -T %s -p -t exon -g transcript_biotype -a %s -o %s %s 2> %s' %(
+				featureCount_exe, stranded, threads, gtf_file, out_file, bam_file, logfile)
+			)
+		else:
+			cmd_featureCount = ('%s -s %s --largestOverlap -T %s -p -t exon -g transcript_biotype -a %s -o %s %s 2> %s' %(
+				featureCount_exe, stranded, threads, gtf_file, out_file, bam_file, logfile)
+			)
+			
+			
+		## system call
+		cmd_featureCount_code = system_call_functions.system_call(cmd_featureCount, False, True)
+		if not cmd_featureCount_code:
+			print("** ERROR: featureCount failed for sample " + name)
+			exit()
+			
+		## print time stamp
+		step_cache.save_step(filename_stamp_featureCounts, record)
+	
+	## parse results
+	(extended_Stats_file, RNAbiotypes_stats_file) = parse_featureCount(out_file, path, name, bam_file, Debug)
+	
+	## debugging messages
+	if Debug:
+		print ("** DEBUG:")
+		print ("extended_Stats: " + extended_Stats_file)
+		print (main_functions.get_data(extended_Stats_file, '\t', 'header=None'))
+		print ("RNAbiotypes_stats: " + RNAbiotypes_stats_file)
+		print (main_functions.get_data(RNAbiotypes_stats_file, '\t', 'header=None'))
 
 	return ()
 
@@ -117,10 +136,9 @@ def parse_featureCount(out_file, path, name, bam_file, Debug):
 
 	##
 	filename_stamp_parse = path + '/.success_parse'
-	if os.path.isfile(filename_stamp_parse):
-		stamp = time_functions.read_time_stamp(filename_stamp_parse)
-		print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'parse results'), 'yellow'))
-	else:
+	(done, record) = step_cache.check_step(filename_stamp_parse, name, 'parse results', [out_file, bam_file], {}, 
+										step_cache.tool_version('XICRA'), Debug)
+	if not done:
 	
 		## debugging messages
 		if Debug:
@@ -267,39 +285,41 @@ def parse_featureCount(out_file, path, name, bam_file, Debug):
 		out_tsv_file.close()
 
 		## print timestamp
-		time_functions.print_time_stamp(filename_stamp_parse)
+		step_cache.save_step(filename_stamp_parse, record)
 
 	return(out_tsv_file_name, RNA_biotypes_file_name)
 
 #######################################################################
-def RNAbiotype_module_call(samples_dict, output_dict, gtf_file, Debug, max_workers_int, threads_job, multimapping, stranded):
+def RNAbiotype_module_call(samples_dict, output_dict, gtf_file, Debug, threads, multimapping, stranded, outdir, counting_engine='featureCounts'):
 	"""
 	Create RNAbiotype analysis for each sample and create summary plots
 	
 	:param samples_dict: Dictionary containing sample IDs as keys and bam files as values
 	:param output_dict: Dictionary containing sample IDs as keys and output folder as values
 	:param gtf_file: Gene annotation file for the reference genome used.
-	:param threads: Number of threads to use.
 	:param Debug: True/False for debugging messages
+	:param threads: Number of threads to use.
+	:param multimapping: True/False for counting multimapping reads.
+	:param stranded: Strandedness: 0, 1 or 2.
+	:param outdir: Folder to record wall time for each sample.
+	:param counting_engine: native (XICRA) or featureCounts.
 	"""
 	
-	## get bin
-	featureCount_exe = set_config.get_exe('featureCounts')
+	if counting_engine == 'featureCounts':
+		## get bin
+		featureCount_exe = set_config.get_exe('featureCounts')
+		biotype_index = None
+	else:
+		## load annotation once for all samples
+		print ("+ Loading annotation for RNA biotype counting: " + gtf_file)
+		featureCount_exe = None
+		biotype_index = biotype_counter.build_index(gtf_file, Debug)
 
-	## send for each sample
-	with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_int) as executor:
-		commandsSent = { executor.submit(biotype_all, featureCount_exe, 
-										output_dict[sample], gtf_file, bam_files, 
-										sample, threads_job, Debug, multimapping, stranded): sample for sample, bam_files in samples_dict.items() }
-	
-		for cmd2 in concurrent.futures.as_completed(commandsSent):
-			details = commandsSent[cmd2]
-			try:
-				data = cmd2.result()
-			except Exception as exc:
-				print ('***ERROR:')
-				print (cmd2)
-				print('%r generated an exception: %s' % (details, exc))
+	## send for each sample: larger samples first and using more threads
+	jobs = [ scheduler.Job(sample, biotype_all, featureCount_exe, 
+						output_dict[sample], gtf_file, bam_files, 
+						sample, scheduler.THREADS, Debug, multimapping, stranded, biotype_index, files=[bam_files]) for sample, bam_files in samples_dict.items() ]
+	scheduler.run_jobs(jobs, threads, Debug, scheduler.history_file(outdir), "biotype")
 
 	##
 	## plot results
@@ -311,29 +331,69 @@ def RNAbiotype_module_call(samples_dict, output_dict, gtf_file, Debug, max_worke
 	return()
 
 ############################################################
-def generate_matrix(dict_files):
-	######################################################
-	### For a dictionary containing names as keys and files as values, 
-	###	generates a count matrix with the classification from featurecounts
-	###		
-	### It returns a dataframe containing for each index generated
-	### count values for each sample (sample_name) in columns
-	###
-	#########################################################
-	all_data = pd.DataFrame()
-	for key,values in dict_files.items():
-		print ('+ Reading information from sample: ', key)	
-		data = pd.read_csv(values, sep='\t', header=None, names=['RNAbiotypes', key])
-		
-		## skip if file is empty
-		if data.empty:
-			continue
+def read_biotypes(count_file):
+	"""
+	Reads RNA biotypes and counts from a featureCount.out.tsv file (tab-separated, no header).
+	
+	:returns: List of RNA biotypes and array of counts (integer, or float if any decimal value).
+	"""
+	with open(count_file) as in_handle:
+		rows = [ line.rstrip('\n').split('\t') for line in in_handle if line.strip() ]
+	
+	biotypes = [ row[0] for row in rows ]
+	counts = [ row[1] for row in rows ]
+	try:
+		counts = np.array(counts, dtype=np.int64)
+	except ValueError:
+		counts = np.array(counts, dtype=np.float64)
+	return (biotypes, counts)
+
+############################################################
+def _read_biotypes_batch(count_files):
+	return ([ read_biotypes(count_file) for count_file in count_files ])
 
-		## get info, generate unique name and merge for samples
-		data = data.set_index('RNAbiotypes')
-		all_data = pd.concat([all_data, data], axis=1, sort=True)
+############################################################
+def generate_matrix(dict_files, threads=1):
+	"""
+	Generates a count matrix with the RNA biotype classification for each sample.
+	
+	Files are read in parallel and the matrix is created once for all samples: a column
+	is filled for each sample over all RNA biotypes (sorted), missing values as NaN.
 	
-	return (all_data)
+	:param dict_files: Dictionary containing sample names as keys and featureCount.out.tsv files as values.
+	:param threads: Number of processes to read files.
+	
+	:returns: Dataframe containing counts for each RNA biotype (index) and sample (columns).
+	"""
+	samples = list(dict_files.keys())
+	for sample in samples:
+		print ('+ Reading information from sample: ', sample)
+	
+	## files are sent in batches: each file is small
+	files = [ dict_files[sample] for sample in samples ]
+	batches = [ files[i:i + biotype_batch] for i in range(0, len(files), biotype_batch) ]
+	files_data = [ data for batch in scheduler.process_map(_read_biotypes_batch, batches, threads) for data in batch ]
+	
+	## skip if file is empty
+	samples_data = [ (sample, data) for sample, data in zip(samples, files_data) if data[0] ]
+	if not samples_data:
+		return (pd.DataFrame())
+	
+	## union of RNA biotypes
+	all_biotypes = np.unique(np.concatenate([ np.array(data[0], dtype=object) for sample, data in samples_data ]).astype(str))
+	index = { biotype: position for position, biotype in enumerate(all_biotypes) }
+	
+	columns = {}
+	for sample, (biotypes, counts) in samples_data:
+		rows = np.fromiter((index[biotype] for biotype in biotypes), dtype=np.int64, count=len(biotypes))
+		if len(np.unique(rows)) == len(all_biotypes):
+			column = np.zeros(len(all_biotypes), dtype=counts.dtype)
+		else:
+			column = np.full(len(all_biotypes), np.nan)
+		column[rows] = counts
+		columns[sample] = column
+	
+	return (pd.DataFrame(columns, index=pd.Index(all_biotypes.astype(object), name='RNAbiotypes')))
 	##
 
 #######################################################################
@@ -341,10 +401,13 @@ def pie_plot_results(RNAbiotypes_stats_file, name, folder, Debug):
 	
 	##
 	filename_stamp_plot = folder + '/.success_plot'
-	if os.path.isfile(filename_stamp_plot):
-		stamp = time_functions.read_time_stamp(filename_stamp_plot)
-		print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'plot results'), 'yellow'))
-	else:
+	(done, record) = step_cache.check_step(filename_stamp_plot, name, 'plot results', [RNAbiotypes_stats_file], {}, 
+										step_cache.tool_version('XICRA'), Debug)
+	if not done:
+		## plotting library is only loaded when plots are generated
+		import matplotlib
+		matplotlib.use('agg')
+		import matplotlib.pyplot as plt
 	
 		# PLOT and SHOW results
 		RNAbiotypes_stats = main_functions.get_data(RNAbiotypes_stats_file, '\t', 'header=None')
@@ -401,7 +464,7 @@ def pie_plot_results(RNAbiotypes_stats_file, name, folder, Debug):
 		plt.close(name_figure)
 
 		## print time stamps
-		time_functions.print_time_stamp(filename_stamp_plot)
+		step_cache.save_step(filename_stamp_plot, record)
 		filename_stamp_all = folder + '/.success_all'
 		time_functions.print_time_stamp(filename_stamp_all)
 		
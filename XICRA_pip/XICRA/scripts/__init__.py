@@ -1,10 +1,30 @@
+import importlib
+
 __all__ = [
     'fastqc_caller',
+    'fastq_qc',
     'multiQC_report',
     'generate_DE',
     'RNAbiotype',
-    'mapReads'
+    'mapReads',
+    'isomiR_annotation',
+    'miRBase_reference',
+    'scheduler',
+    'step_cache',
+    'biotype_counter',
+    'file_transfer',
+    'collapse_reads',
+    'java_batch',
+    'compression',
+    'smallRNA_stream',
+    'join_reads',
+    'sample_reads'
     
 ]
 
-from XICRA.scripts import *
+## modules are imported when first used (e.g. XICRA.scripts.module): importing
+## the package does not load every module and its dependencies
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(__name__ + '.' + name)
+    raise AttributeError("module %r has no attribute %r" %(__name__, name))
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Counts reads for each transcript biotype within XICRA process.
+
+Replaces ``featureCounts -p -t exon -g transcript_biotype`` calls: GTF exons are
+loaded once per run into an interval index shared by all samples and BAM
+records are streamed using pysam.
+
+Results are written using featureCounts output layout (counts and summary
+files) so they can be parsed and reported (MultiQC) as before. Counting rules
+follow featureCounts:
+
+- Paired-end reads are counted as fragments. Strand is determined by the first read.
+- Multimapping reads (NH > 1) are counted for each alignment (``-M``) or discarded and
+  reported as ``Unassigned_MultiMapping`` for each alignment.
+- Fragments overlapping several biotypes are counted for each one (``-O``) or assigned
+  to the biotype with the largest overlap (``--largestOverlap``), if any.
+- Strandedness: 0 (unstranded), 1 (stranded) or 2 (reversely stranded).
+"""
+## useful imports
+import os
+import sys
+import re
+import bisect
+from collections import OrderedDict, defaultdict
+import pysam
+
+## summary status reported as featureCounts
+summary_status = ['Assigned', 'Unassigned_Unmapped', 'Unassigned_Read_Type', 'Unassigned_Singleton',
+                  'Unassigned_MappingQuality', 'Unassigned_Chimera', 'Unassigned_FragmentLength',
+                  'Unassigned_Duplicate', 'Unassigned_MultiMapping', 'Unassigned_Secondary',
+                  'Unassigned_NonSplit', 'Unassigned_NoFeatures', 'Unassigned_Overlapping_Length',
+                  'Unassigned_Ambiguity']
+
+##########################################################
+def build_index(gtf_file, Debug, feature_type='exon', attribute='transcript_biotype'):
+    """
+    Creates an interval index for the features in GTF file grouped by the attribute given.
+
+    For each chromosome, features are split into non-overlapping segments. Each segment
+    contains the biotypes (as integer IDs) present for each strand.
+
+    :param gtf_file: Gene annotation file in GTF format.
+    :param Debug: True/False for debugging messages.
+    :param feature_type: Feature type to use (GTF third column).
+    :param attribute: Attribute to group features.
+
+    :returns: Dictionary containing names (biotypes), info (chromosome, start, end, strand and length for each biotype) and chroms (segments).
+    """
+    regex = re.compile(attribute + r' "([^"]+)"')
+    names = []
+    name_ids = {}
+    features = defaultdict(list)
+
+    ## read exons
+    with open(gtf_file) as in_handle:
+        for line in in_handle:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 9 or fields[2] != feature_type:
+                continue
+            hit = regex.search(fields[8])
+            if not hit:
+                continue
+            name_id = name_ids.get(hit.group(1))
+            if name_id is None:
+                name_id = len(names)
+                name_ids[hit.group(1)] = name_id
+                names.append(hit.group(1))
+
+            ## 0-based, half-open
+            features[fields[0]].append((int(fields[3]) - 1, int(fields[4]), fields[6], name_id))
+
+    ## split into segments
+    chroms = {}
+    info = [ {'chr': [], 'start': None, 'end': None, 'strand': [], 'length': 0} for name in names ]
+    for chrom, chrom_features in features.items():
+        events = defaultdict(list)
+        for (start, end, strand, name_id) in chrom_features:
+            events[start].append((1, strand, name_id))
+            events[end].append((-1, strand, name_id))
+
+            ## information for output
+            name_info = info[name_id]
+            if chrom not in name_info['chr']:
+                name_info['chr'].append(chrom)
+            if strand not in name_info['strand']:
+                name_info['strand'].append(strand)
+            name_info['start'] = start + 1 if name_info['start'] is None else min(name_info['start'], start + 1)
+            name_info['end'] = end if name_info['end'] is None else max(name_info['end'], end)
+
+        starts, ends, plus, minus, both = [], [], [], [], []
+        active = defaultdict(int)
+        positions = sorted(events)
+        for i, position in enumerate(positions[:-1]):
+            for (change, strand, name_id) in events[position]:
+                active[(strand, name_id)] += change
+
+            labels_plus = tuple(sorted(set([ n for (s, n), c in active.items() if c > 0 and s != '-' ])))
+            labels_minus = tuple(sorted(set([ n for (s, n), c in active.items() if c > 0 and s != '+' ])))
+            if not labels_plus and not labels_minus:
+                continue
+
+            starts.append(position)
+            ends.append(positions[i + 1])
+            plus.append(labels_plus)
+            minus.append(labels_minus)
+            both.append(tuple(sorted(set(labels_plus + labels_minus))))
+
+            ## length: bases covered by each biotype
+            for name_id in both[-1]:
+                info[name_id]['length'] += positions[i + 1] - position
+
+        chroms[chrom] = {'starts': starts, 'ends': ends, '+': plus, '-': minus, '.': both}
+
+    ## debugging messages
+    if Debug:
+        print ("** DEBUG: biotype index for " + gtf_file)
+        print ("biotypes: " + str(len(names)))
+        print ("segments: " + str(sum([ len(c['starts']) for c in chroms.values() ])))
+
+    return ({'names': names, 'info': info, 'chroms': chroms})
+
+##########################################################
+def _merge_blocks(blocks):
+    blocks = sorted(blocks)
+    merged = [list(blocks[0])]
+    for (start, end) in blocks[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return (merged)
+
+##########################################################
+def overlaps(index, chrom, blocks, strand):
+    """
+    Returns dictionary with bases overlapping each biotype for the blocks given.
+
+    :param strand: Strand of features to consider: +, - or . (any).
+    """
+    chrom_index = index['chroms'].get(chrom)
+    hits = defaultdict(int)
+    if not chrom_index or not blocks:
+        return (hits)
+
+    starts = chrom_index['starts']
+    ends = chrom_index['ends']
+    labels = chrom_index[strand]
+    for (start, end) in _merge_blocks(blocks):
+        i = bisect.bisect_right(ends, start)
+        while i < len(starts) and starts[i] < end:
+            overlap = min(end, ends[i]) - max(start, starts[i])
+            for name_id in labels[i]:
+                hits[name_id] += overlap
+            i += 1
+
+    return (hits)
+
+##########################################################
+def _strand(read, stranded):
+    """Strand of features to consider for the fragment (determined by first read)."""
+    if not stranded:
+        return ('.')
+    reverse = read.is_reverse
+    if read.is_paired and read.is_read2:
+        reverse = not reverse
+    if stranded == 2:
+        reverse = not reverse
+    return ('-' if reverse else '+')
+
+##########################################################
+def count_bam(bam_file, index, stranded, multimapping, threads=1):
+    """
+    Counts fragments for each biotype.
+
+    :param bam_file: BAM file.
+    :param index: Index created by :func:`XICRA.scripts.biotype_counter.build_index`.
+    :param stranded: 0, 1 or 2.
+    :param multimapping: True: count multimapping reads and overlaps with several biotypes (-M -O);
+        False: discard multimapping reads and assign to the largest overlap (--largestOverlap).
+    :param threads: Threads for BAM decompression.
+
+    :returns: List of counts for each biotype and dictionary with summary counts.
+    """
+    counts = [0] * len(index['names'])
+    summary = OrderedDict((status, 0) for status in summary_status)
+    pending = {}
+
+    def assign(read, blocks):
+        ## multimapping
+        if read.has_tag('NH') and read.get_tag('NH') > 1 and not multimapping:
+            summary['Unassigned_MultiMapping'] += 1
+            return
+
+        hits = overlaps(index, read.reference_name, blocks, _strand(read, stranded))
+        if not hits:
+            summary['Unassigned_NoFeatures'] += 1
+        elif len(hits) == 1 or multimapping:
+            for name_id in hits:
+                counts[name_id] += 1
+            summary['Assigned'] += 1
+        else:
+            ## largest overlap
+            largest = max(hits.values())
+            best = [ name_id for name_id, overlap in hits.items() if overlap == largest ]
+            if len(best) == 1:
+                counts[best[0]] += 1
+                summary['Assigned'] += 1
+            else:
+                summary['Unassigned_Ambiguity'] += 1
+
+    with pysam.AlignmentFile(bam_file, 'rb', threads=max(1, int(threads))) as bam:
+        for read in bam.fetch(until_eof=True):
+            ## secondary alignments (NH > 1) are counted or reported as multimapping for each alignment
+            if read.is_supplementary:
+                continue
+
+            ## unmapped: counted once per fragment
+            if read.is_unmapped:
+                if not read.is_paired or (read.mate_is_unmapped and read.is_read1):
+                    summary['Unassigned_Unmapped'] += 1
+                continue
+
+            blocks = read.get_blocks()
+            if not read.is_paired or read.mate_is_unmapped:
+                assign(read, blocks)
+                continue
+
+            ## paired-end: wait for mate
+            key = (read.query_name, read.get_tag('HI') if read.has_tag('HI') else 0,
+                   read.is_read1, read.next_reference_id, read.next_reference_start)
+            mate_key = (read.query_name, key[1], not read.is_read1, read.reference_id, read.reference_start)
+            mate = pending.pop(mate_key, None)
+            if mate is None:
+                pending[key] = (read, blocks)
+                continue
+
+            (mate_read, mate_blocks) = mate
+            first = read if read.is_read1 else mate_read
+            if read.reference_id == mate_read.reference_id:
+                assign(first, blocks + mate_blocks)
+            else:
+                ## chimeric fragment: use first read
+                assign(first, blocks if first is read else mate_blocks)
+
+    ## mates not found
+    for (read, blocks) in pending.values():
+        assign(read, blocks)
+
+    return (counts, summary)
+
+##########################################################
+def write_results(out_file, bam_file, index, counts, summary):
+    """
+    Writes counts and summary using featureCounts layout.
+    """
+    with open(out_file, 'w') as out_handle:
+        out_handle.write("# Program:XICRA biotype_counter; Command: transcript_biotype counts for %s\n" %bam_file)
+        out_handle.write("\t".join(['Geneid', 'Chr', 'Start', 'End', 'Strand', 'Length', bam_file]) + "\n")
+        for name_id, name in enumerate(index['names']):
+            info = index['info'][name_id]
+            out_handle.write("\t".join([name, ";".join(info['chr']), str(info['start']), str(info['end']),
+                                        ";".join(info['strand']), str(info['length']), str(counts[name_id])]) + "\n")
+
+    with open(out_file + '.summary', 'w') as out_handle:
+        out_handle.write("Status\t%s\n" %bam_file)
+        for status, count in summary.items():
+            out_handle.write("%s\t%s\n" %(status, count))
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) < 6:
+        print ("\nUsage:")
+        print ("python3 %s bam_file gtf_file out_file stranded[0/1/2] multimapping[True/False]\n" %os.path.realpath(__file__))
+        exit()
+
+    index = build_index(os.path.abspath(sys.argv[2]), True)
+    (counts, summary) = count_bam(os.path.abspath(sys.argv[1]), index, int(sys.argv[4]), sys.argv[5] == 'True')
+    write_results(os.path.abspath(sys.argv[3]), os.path.abspath(sys.argv[1]), index, counts, summary)
+
+######
+if __name__== "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Collapses reads into unique sequences with counts.
+
+Reads for each sample are streamed once and two files are generated:
+
+- read count tabular file (``sequence<TAB>count``): accepted by sRNAbench (``.rc`` input) and miraligner,
+- collapsed FASTQ file: one record for each unique sequence (``@seq_<id>_x<count>``) with the quality of the first read found, for OptimiR.
+
+Counts are carried back to miRTop results for software that do not take them
+into account (see :func:`XICRA.scripts.isomiR_annotation.restore_counts`).
+"""
+## useful imports
+import os
+import sys
+from termcolor import colored
+
+## import my modules
+from XICRA.scripts import compression
+
+##########################################################
+def collapse(fastq_files, out_folder, name, Debug):
+    """
+    Collapses reads from the fastq files given into unique sequences.
+
+    :param fastq_files: List of fastq files (plain, gzip or zstd) for the sample.
+    :param out_folder: Folder to store results.
+    :param name: Sample name.
+    :param Debug: True/False for debugging messages.
+
+    :returns: Dictionary containing tabular and fastq files generated and number of reads and unique sequences.
+    """
+    ## sequence: [count, quality of first read]
+    sequences = {}
+    total = 0
+    for fastq in fastq_files:
+        with compression.open_read(fastq) as in_handle:
+            while True:
+                header = in_handle.readline()
+                if not header:
+                    break
+                seq = in_handle.readline().rstrip()
+                in_handle.readline()
+                qual = in_handle.readline().rstrip()
+                total += 1
+
+                hit = sequences.get(seq)
+                if hit is None:
+                    sequences[seq] = [1, qual]
+                else:
+                    hit[0] += 1
+
+    ## sort by abundance
+    collapsed = sorted(sequences.items(), key=lambda item: (-item[1][0], item[0]))
+    files = {'tabular': os.path.join(out_folder, name + '.rc'),
+             'fastq': os.path.join(out_folder, name + '_collapsed.fastq'),
+             'reads': total, 'unique': len(collapsed)}
+
+    with open(files['tabular'], 'w') as tab_handle, open(files['fastq'], 'w') as fastq_handle:
+        for count_id, (seq, (count, qual)) in enumerate(collapsed):
+            tab_handle.write("%s\t%s\n" %(seq, count))
+            fastq_handle.write("@seq_%s_x%s\n%s\n+\n%s\n" %(count_id + 1, count, seq, qual))
+
+    ## debugging messages
+    if Debug:
+        print (colored("** DEBUG: collapse reads for %s: %s reads into %s unique sequences" %(name, total, len(collapsed)), 'yellow'))
+
+    return (files)
+
+##########################################################
+def read_counts(tabular_file):
+    """
+    Reads a read count tabular file.
+
+    :returns: Dictionary containing sequences as keys and counts as values.
+    """
+    counts = {}
+    with open(tabular_file) as in_handle:
+        for line in in_handle:
+            (seq, count) = line.rstrip('\n').split('\t')
+            counts[seq] = int(count)
+    return (counts)
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) < 4:
+        print ("\nUsage:")
+        print ("python3 %s out_folder name fastq_file [fastq_file2 ...]\n" %os.path.realpath(__file__))
+        exit()
+
+    files = collapse([ os.path.abspath(f) for f in sys.argv[3:] ], os.path.abspath(sys.argv[1]), sys.argv[2], True)
+    print (files)
+
+######
+if __name__== "__main__":
+    main()
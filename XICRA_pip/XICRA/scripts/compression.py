@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Compression of intermediate files (trimmed and joined reads).
+
+Files are compressed using multi-threaded compressors when available (``pigz``
+for gzip, ``zstd -T``). Software not able to write (or read) compressed files
+use named pipes: data is compressed (or decompressed) on the fly and never
+written uncompressed on disk.
+"""
+## useful imports
+import os
+import sys
+import time
+import shlex
+import shutil
+import tempfile
+import subprocess
+import contextlib
+from termcolor import colored
+from xopen import xopen
+
+## extension for each compression
+extensions = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+##########################################################
+def extension(compression):
+    """Returns file extension for the compression given: none, gzip or zstd."""
+    return (extensions[compression])
+
+##########################################################
+def compression_type(file_given):
+    """Returns compression for the file given according to its extension."""
+    for compression, ext in extensions.items():
+        if ext and file_given.endswith(ext):
+            return (compression)
+    return ('none')
+
+##########################################################
+def other_files(file_given):
+    """Returns files with the same name and a different compression, if existing."""
+    base = file_given[:len(file_given) - len(extension(compression_type(file_given)))]
+    return ([ base + ext for ext in extensions.values() if base + ext != file_given and os.path.isfile(base + ext) ])
+
+##########################################################
+def remove_other_files(file_given):
+    """Removes files with the same name and a different compression (e.g. generated with previous options)."""
+    for other in other_files(file_given):
+        os.remove(other)
+
+##########################################################
+def open_read(file_given, binary=False):
+    """Opens a plain or compressed file for reading (text or binary mode). Plain files might be named pipes."""
+    if compression_type(file_given) == 'none':
+        return (open(file_given, 'rb' if binary else 'r'))
+    return (xopen(file_given, 'rb' if binary else 'rt'))
+
+##########################################################
+def open_write(file_given, threads=1, binary=False):
+    """Opens a file for writing (text or binary mode) compressed according to its extension."""
+    if compression_type(file_given) == 'none':
+        return (open(file_given, 'wb' if binary else 'w'))
+    return (xopen(file_given, 'wb' if binary else 'wt', threads=threads))
+
+##########################################################
+def read_command(file_given):
+    """Returns command to decompress the file given to stdout (e.g. STAR --readFilesCommand) or None if not compressed."""
+    compression = compression_type(file_given)
+    if compression == 'gzip':
+        return ('gzip -dc')
+    elif compression == 'zstd':
+        return ('zstd -dcq')
+    return (None)
+
+##########################################################
+def compressor(compression, threads):
+    """Returns command to compress stdin to stdout."""
+    threads = max(1, int(threads))
+    if compression == 'gzip':
+        if shutil.which('pigz'):
+            return ('pigz -c -p %s' %threads)
+        return ('gzip -c')
+    elif compression == 'zstd':
+        return ('zstd -c -q -T%s' %threads)
+    raise ValueError("Compression %s not supported" %compression)
+
+##########################################################
+def _release_fifo(fifo):
+    ## a process might be blocked opening the pipe if the software failed before opening it
+    try:
+        fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+        os.close(fd)
+    except OSError:
+        pass
+    try:
+        fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+        os.close(fd)
+    except OSError:
+        pass
+
+##########################################################
+@contextlib.contextmanager
+def compressed_outputs(files, threads, Debug=False):
+    """
+    Context manager for software writing plain files: yields paths to write into.
+
+    For each compressed file, a named pipe is created and a compressor writes
+    the final file while the software runs. The first file receives the threads
+    given and the rest, one each.
+
+    Raises ``OSError`` if any compressor fails.
+    """
+    folder = tempfile.mkdtemp(prefix='XICRA_pipes_')
+    paths = []
+    processes = []
+    try:
+        for count, file_given in enumerate(files):
+            compression = compression_type(file_given)
+            if compression == 'none':
+                paths.append(file_given)
+                continue
+
+            fifo = os.path.join(folder, str(count) + '_' + os.path.basename(file_given)[:-len(extension(compression))])
+            os.mkfifo(fifo)
+            cmd = 'exec %s < %s > %s' %(compressor(compression, threads if not count else 1),
+                                        shlex.quote(fifo), shlex.quote(file_given))
+            processes.append((fifo, file_given, subprocess.Popen(cmd, shell=True)))
+            paths.append(fifo)
+
+            ## debugging messages
+            if Debug:
+                print (colored("** DEBUG: compress %s: %s" %(file_given, cmd), 'yellow'))
+
+        yield (paths)
+
+    finally:
+        failed = []
+        for (fifo, file_given, process) in processes:
+            if process.poll() is None:
+                _release_fifo(fifo)
+            if process.wait():
+                failed.append(file_given)
+        shutil.rmtree(folder, ignore_errors=True)
+
+    if failed:
+        raise OSError("Compression failed for %s" %", ".join(failed))
+
+##########################################################
+@contextlib.contextmanager
+def decompressed_inputs(files, compressions=('zstd',), Debug=False):
+    """
+    Context manager for software not able to read some compressions: yields paths to read from.
+
+    Files with the compressions given are decompressed into named pipes while the software runs.
+    Software must read each file once and sequentially.
+    """
+    folder = tempfile.mkdtemp(prefix='XICRA_pipes_')
+    paths = []
+    processes = []
+    try:
+        for count, file_given in enumerate(files):
+            compression = compression_type(file_given)
+            if compression not in compressions:
+                paths.append(file_given)
+                continue
+
+            fifo = os.path.join(folder, str(count) + '_' + os.path.basename(file_given)[:-len(extension(compression))])
+            os.mkfifo(fifo)
+            cmd = 'exec %s %s > %s' %(read_command(file_given), shlex.quote(file_given), shlex.quote(fifo))
+            processes.append((fifo, subprocess.Popen(cmd, shell=True, stderr=subprocess.DEVNULL)))
+            paths.append(fifo)
+
+            ## debugging messages
+            if Debug:
+                print (colored("** DEBUG: decompress %s: %s" %(file_given, cmd), 'yellow'))
+
+        yield (paths)
+
+    finally:
+        for (fifo, process) in processes:
+            if process.poll() is None:
+                _release_fifo(fifo)
+                process.kill()
+            process.wait()
+        shutil.rmtree(folder, ignore_errors=True)
+
+##########################################################
+def benchmark(fastq_file, folder, threads=1):
+    """
+    Writes the fastq file given using each compression and returns seconds, MB/s (uncompressed data) and size for each one.
+    """
+    results = {}
+    size = os.path.getsize(fastq_file)
+    for compression in extensions:
+        outfile = os.path.join(folder, 'benchmark.fastq' + extension(compression))
+        start = time.time()
+        with open(fastq_file) as in_handle, open_write(outfile, threads) as out_handle:
+            shutil.copyfileobj(in_handle, out_handle, 16 * 1024 * 1024)
+        seconds = time.time() - start
+        results[compression] = {'seconds': round(seconds, 2), 'MB/s': round(size / 1024**2 / seconds, 1),
+                                'size': os.path.getsize(outfile)}
+        os.remove(outfile)
+    return (results)
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) < 3:
+        print ("\nUsage:")
+        print ("python3 %s fastq_file folder [threads]\n" %os.path.realpath(__file__))
+        print ("Benchmark writing fastq_file in folder (e.g. NFS) using each compression.\n")
+        exit()
+
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    for compression, info in benchmark(os.path.abspath(sys.argv[1]), os.path.abspath(sys.argv[2]), threads).items():
+        print ("%s\t%s s\t%s MB/s\t%s bytes" %(compression, info['seconds'], info['MB/s'], info['size']))
+
+######
+if __name__== "__main__":
+    main()
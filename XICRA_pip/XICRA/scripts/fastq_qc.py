@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Quality check for fastq files within XICRA: a lightweight alternative to FastQC for small RNA reads.
+
+Reads are processed in chunks (encoded as NumPy arrays) using several processes and the
+following FastQC modules are generated:
+
+- Basic Statistics,
+- Per base sequence quality and Per sequence quality scores,
+- Per sequence GC content,
+- Sequence Length Distribution,
+- Overrepresented sequences: as FastQC, only the first 100,000 unique sequences are tracked,
+- Adapter Content: FastQC adapters and adapters provided.
+
+Results are written in FastQC format (``<name>_fastqc/fastqc_data.txt`` and ``summary.txt``), so
+MultiQC reports them as FastQC results. Pass/warn/fail status follow FastQC default limits.
+"""
+## useful imports
+import os
+import sys
+import math
+import collections
+import numpy as np
+from termcolor import colored
+
+## import my modules
+from XICRA.scripts import compression
+from XICRA.scripts import scheduler
+from XICRA.scripts import join_reads
+
+## reads for each chunk
+chunk_reads = 100000
+
+## FastQC format version emitted
+fastqc_format = '0.11.9'
+
+## adapters checked by FastQC: name and first 12 bases
+fastqc_adapters = [("Illumina Universal Adapter", "AGATCGGAAGAG"),
+                   ("Illumina Small RNA 3' Adapter", "TGGAATTCTCGG"),
+                   ("Illumina Small RNA 5' Adapter", "GATCGTCGGACT"),
+                   ("Nextera Transposase Sequence", "CTGTCTCTTATA"),
+                   ("SOLID Small RNA Adapter", "CGCCTTGGCCGT")]
+
+## overrepresented sequences: unique sequences tracked and sequences longer than 75 bp are truncated to 50 bp
+unique_limit = 100000
+
+##########################################################
+def adapter_list(adapters=()):
+    """Returns FastQC adapters and adapters provided (first 12 bases), if not included."""
+    adapter_kmers = list(fastqc_adapters)
+    for adapter in adapters:
+        if adapter and adapter[:12].upper() not in [ kmer for (name, kmer) in adapter_kmers ]:
+            adapter_kmers.append(("Adapter %s" %adapter[:12].upper(), adapter[:12].upper()))
+    return (adapter_kmers)
+
+##########################################################
+def _add(array1, array2):
+    """Sums arrays with different length for the first dimension."""
+    if array1 is None:
+        return (array2)
+    if len(array1) < len(array2):
+        (array1, array2) = (array2, array1)
+    array1 = array1.copy()
+    array1[:len(array2)] += array2
+    return (array1)
+
+##########################################################
+def chunk_stats(records, adapter_kmers):
+    """
+    Returns statistics for a chunk of fastq records.
+
+    :param records: List of lines (bytes) for fastq records (4 lines per record).
+    :param adapter_kmers: List of adapters (name, sequence) to search.
+    """
+    seqs = [ line.rstrip(b'\r\n') for line in records[1::4] ]
+    (seq, lengths) = join_reads.encode(seqs)
+    (qual, _) = join_reads.encode([ line.rstrip(b'\r\n') for line in records[3::4] ])
+    width = seq.shape[1]
+    valid = np.arange(width) < lengths[:, None]
+
+    ## quality values (ASCII) for each position
+    qual = np.minimum(qual, 127)
+    positions = np.broadcast_to(np.arange(width), qual.shape)
+    qual_pos = np.bincount((positions[valid] * 128 + qual[valid]).astype(np.int64),
+                           minlength=width * 128).reshape(width, 128)
+
+    ## mean quality (ASCII) for each read
+    sum_qual = np.where(valid, qual, 0).sum(axis=1).astype(np.int64)
+    mean_qual = np.bincount(sum_qual[lengths > 0] // lengths[lengths > 0], minlength=128)
+
+    ## GC content for each read (A, C, G and T bases)
+    upper = seq & 0xDF
+    gc = ((upper == ord('G')) | (upper == ord('C'))).sum(axis=1)
+    acgt = gc + ((upper == ord('A')) | (upper == ord('T'))).sum(axis=1)
+    gc_read = np.bincount(np.rint(100.0 * gc[acgt > 0] / acgt[acgt > 0]).astype(np.int64), minlength=101)
+
+    ## adapter content: first position found for each adapter
+    adapter_pos = np.zeros((width, len(adapter_kmers)), dtype=np.int64)
+    for count, (name, kmer) in enumerate(adapter_kmers):
+        kmer = kmer.encode()
+        found = [ read.find(kmer) for read in seqs ]
+        found = np.array([ pos for pos in found if pos >= 0 ], dtype=np.int64)
+        adapter_pos[:, count] = np.bincount(found, minlength=width)[:width]
+
+    ## overrepresented sequences (order of first occurrence is kept)
+    sequences = collections.Counter([ read[:50] if len(read) > 75 else read for read in seqs ])
+
+    return ({'reads': len(seqs), 'lengths': np.bincount(lengths), 'qual_pos': qual_pos,
+             'mean_qual': mean_qual, 'gc_read': gc_read, 'gc': int(gc.sum()), 'acgt': int(acgt.sum()),
+             'adapter_pos': adapter_pos, 'sequences': sequences,
+             'min_qual': int(qual[valid].min()) if valid.any() else 127})
+
+##########################################################
+def _chunks(handle):
+    while True:
+        records = join_reads.read_records(handle, chunk_reads)
+        if len(records) % 4:
+            raise ValueError("Truncated fastq record")
+        if not records:
+            return
+        yield (records)
+
+##########################################################
+def fastq_stats(fastq_file, threads, adapter_kmers):
+    """Returns statistics for a fastq file processing chunks using several processes."""
+    stats = {'reads': 0, 'gc': 0, 'acgt': 0, 'min_qual': 127, 'sequences': {}}
+    with compression.open_read(fastq_file, binary=True) as in_handle:
+        for chunk in scheduler.process_map(chunk_stats, _chunks(in_handle), threads, adapter_kmers):
+            for key in ('reads', 'gc', 'acgt'):
+                stats[key] += chunk[key]
+            stats['min_qual'] = min(stats['min_qual'], chunk['min_qual'])
+            for key in ('lengths', 'qual_pos', 'mean_qual', 'gc_read', 'adapter_pos'):
+                stats[key] = _add(stats.get(key), chunk[key])
+
+            ## track only the first unique sequences, as FastQC
+            for read, count in chunk['sequences'].items():
+                if read in stats['sequences']:
+                    stats['sequences'][read] += count
+                elif len(stats['sequences']) < unique_limit:
+                    stats['sequences'][read] = count
+    return (stats)
+
+##########################################################
+def _percentile(counts, percentile):
+    limit = counts.sum() * percentile / 100.0
+    return (int(np.searchsorted(np.cumsum(counts), limit)))
+
+##########################################################
+def _status(value, warn, fail, higher_is_worse=True):
+    if higher_is_worse:
+        return ('fail' if value > fail else 'warn' if value > warn else 'pass')
+    return ('fail' if value < fail else 'warn' if value < warn else 'pass')
+
+##########################################################
+def _gc_deviation(gc_read):
+    """Percentage of reads deviating from a normal distribution fitted to GC content (as FastQC)."""
+    total = gc_read.sum()
+    if total < 2:
+        return (0)
+    mode = int(np.argmax(gc_read))
+    stdev = math.sqrt(((np.arange(101) - mode) ** 2 * gc_read).sum() / (total - 1))
+    if not stdev:
+        return (0)
+    theoretical = np.exp(-0.5 * ((np.arange(101) - mode) / stdev) ** 2) / (stdev * math.sqrt(2 * math.pi)) * total
+    return (100.0 * np.abs(theoretical - gc_read).sum() / total)
+
+##########################################################
+def fastqc_modules(stats, filename, adapter_kmers):
+    """Returns list of (module name, status, header, rows) in FastQC format."""
+    offset = 64 if stats['min_qual'] >= 64 else 33
+    encoding = 'Illumina 1.5' if offset == 64 else 'Sanger / Illumina 1.9'
+    total = stats['reads']
+    lengths = stats.get('lengths', np.zeros(1, dtype=np.int64))
+    present = np.flatnonzero(lengths)
+    if len(present):
+        min_len, max_len = int(present.min()), int(present.max())
+    else:
+        min_len = max_len = 0
+    modules = []
+
+    ## Basic Statistics
+    gc_perc = int(round(100.0 * stats['gc'] / stats['acgt'])) if stats['acgt'] else 0
+    modules.append(('Basic Statistics', 'pass', ['Measure', 'Value'],
+                    [['Filename', filename], ['File type', 'Conventional base calls'], ['Encoding', encoding],
+                     ['Total Sequences', total], ['Sequences flagged as poor quality', 0],
+                     ['Sequence length', str(min_len) if min_len == max_len else '%s-%s' %(min_len, max_len)],
+                     ['%GC', gc_perc]]))
+
+    ## Per base sequence quality
+    rows = []
+    status = 'pass'
+    for position in range(max_len):
+        counts = stats['qual_pos'][position][offset:]
+        if not counts.sum():
+            continue
+        values = [ _percentile(counts, perc) for perc in (50, 25, 75, 10, 90) ]
+        rows.append([position + 1, round(float((counts * np.arange(len(counts))).sum()) / counts.sum(), 6)] +
+                    [ float(v) for v in values ])
+        status = max(status, _status(values[1], 10, 5, False), _status(values[0], 25, 20, False),
+                     key=['pass', 'warn', 'fail'].index)
+    modules.append(('Per base sequence quality', status,
+                    ['Base', 'Mean', 'Median', 'Lower Quartile', 'Upper Quartile', '10th Percentile', '90th Percentile'], rows))
+
+    ## Per sequence quality scores
+    mean_qual = stats.get('mean_qual', np.zeros(128, dtype=np.int64))[offset:]
+    rows = [ [quality, int(count)] for quality, count in enumerate(mean_qual) if count ]
+    mode = int(np.argmax(mean_qual)) if mean_qual.sum() else 0
+    modules.append(('Per sequence quality scores', _status(mode, 27, 20, False), ['Quality', 'Count'], rows))
+
+    ## Per sequence GC content
+    gc_read = stats.get('gc_read', np.zeros(101, dtype=np.int64))
+    modules.append(('Per sequence GC content', _status(_gc_deviation(gc_read), 15, 30), ['GC Content', 'Count'],
+                    [ [gc, int(count)] for gc, count in enumerate(gc_read) ]))
+
+    ## Sequence Length Distribution
+    status = 'fail' if lengths[0] else 'warn' if min_len != max_len else 'pass'
+    modules.append(('Sequence Length Distribution', status, ['Length', 'Count'],
+                    [ [length, int(lengths[length])] for length in range(min_len, max_len + 1) ]))
+
+    ## Overrepresented sequences
+    rows = []
+    for read, count in sorted(stats['sequences'].items(), key=lambda item: -item[1]):
+        percentage = 100.0 * count / total
+        if percentage <= 0.1:
+            break
+        rows.append([read.decode(), count, percentage, 'No Hit'])
+    status = _status(max([ row[2] for row in rows ], default=0), 0.1, 1)
+    modules.append(('Overrepresented sequences', status, ['Sequence', 'Count', 'Percentage', 'Possible Source'], rows))
+
+    ## Adapter Content: cumulative percentage of reads containing each adapter
+    adapter_pos = stats.get('adapter_pos', np.zeros((1, len(adapter_kmers)), dtype=np.int64))
+    cumulative = 100.0 * np.cumsum(adapter_pos, axis=0) / total if total else adapter_pos * 0.0
+    rows = [ [position + 1] + cumulative[position].tolist() for position in range(min(max_len, len(cumulative))) ]
+    status = _status(cumulative.max(initial=0), 5, 10)
+    modules.append(('Adapter Content', status, ['Position'] + [ name for (name, kmer) in adapter_kmers ], rows))
+
+    return (modules)
+
+##########################################################
+def sample_name(fastq_file):
+    """Returns name for the fastq file given as FastQC (removing fastq and compression extensions)."""
+    name = os.path.basename(fastq_file)
+    for extensions in (('.gz', '.bz2', '.zst'), ('.fastq', '.fq', '.txt')):
+        for ext in extensions:
+            if name.endswith(ext):
+                name = name[:-len(ext)]
+                break
+    return (name)
+
+##########################################################
+def write_fastqc(modules, folder, filename):
+    """Writes fastqc_data.txt and summary.txt files in the folder given."""
+    with open(os.path.join(folder, 'fastqc_data.txt'), 'w') as out_handle:
+        out_handle.write("##FastQC\t%s\n" %fastqc_format)
+        for (module, status, header, rows) in modules:
+            out_handle.write(">>%s\t%s\n" %(module, status))
+            out_handle.write("#" + "\t".join(header) + "\n")
+            for row in rows:
+                out_handle.write("\t".join([ str(value) for value in row ]) + "\n")
+            out_handle.write(">>END_MODULE\n")
+
+    with open(os.path.join(folder, 'summary.txt'), 'w') as out_handle:
+        for (module, status, header, rows) in modules:
+            out_handle.write("%s\t%s\t%s\n" %(status.upper(), module, filename))
+
+##########################################################
+def run_qc(path, files, sample, threads, adapters=(), Debug=False):
+    """
+    Checks quality for each fastq file given and writes results in FastQC format within path.
+
+    :param path: Output folder.
+    :param files: List of fastq files (plain, gzip or zstd).
+    :param sample: Sample name.
+    :param threads: Number of processes.
+    :param adapters: Adapter sequences to check in addition to FastQC adapters.
+    :param Debug: True/False for debugging messages.
+
+    :returns: True/False if succeeded.
+    """
+    adapter_kmers = adapter_list(adapters)
+    for fastq_file in files:
+        ## debugging messages
+        if Debug:
+            print (colored("** DEBUG: quality check for %s using %s processes" %(fastq_file, threads), 'yellow'))
+
+        try:
+            stats = fastq_stats(fastq_file, threads, adapter_kmers)
+        except (OSError, ValueError, EOFError) as exc:
+            print (colored("** ERROR: quality check failed for %s [%s]: %s" %(fastq_file, sample, exc), 'red'))
+            return (False)
+
+        folder = os.path.join(path, sample_name(fastq_file) + '_fastqc')
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        filename = os.path.basename(fastq_file)
+        write_fastqc(fastqc_modules(stats, filename, adapter_kmers), folder, filename)
+
+    return (True)
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) < 3:
+        print ("\nUsage:")
+        print ("python3 %s out_folder fastq_file [fastq_file2 ...]\n" %os.path.realpath(__file__))
+        exit()
+
+    files = [ os.path.abspath(f) for f in sys.argv[2:] ]
+    run_qc(os.path.abspath(sys.argv[1]), files, 'sample', 2, Debug=True)
+
+######
+if __name__== "__main__":
+    main()
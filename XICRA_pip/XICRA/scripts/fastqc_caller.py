@@ -12,12 +12,18 @@ import io
 import os
 import re
 import sys
+import shutil
+import tempfile
 from sys import argv
 from io import open
+from termcolor import colored
 
 ## import my modules
 from HCGB import functions
 from XICRA.config import set_config
+from XICRA.scripts import step_cache
+from XICRA.scripts import fastq_qc
+from XICRA.scripts import sample_reads
 
 ############
 def call_fastqc(path, files, sample, fastqc_bin, threads):    
@@ -40,20 +46,51 @@ def call_fastqc(path, files, sample, fastqc_bin, threads):
     return (fastq_code)
         
 ############
-def run_module_fastqc(path, files, sample, threads):    
+def run_module_fastqc(path, files, sample, threads, engine='fastqc', adapters=(), num_reads=None):    
     ## Arguments provided via ARGVs
 
-    ## check if previously done and succeeded
+    ## check if previously done and succeeded with same reads, engine, sampling and version
     filename_stamp = path + '/.success'
-    if os.path.isfile(filename_stamp):
-        stamp = functions.time_functions.read_time_stamp(filename_stamp)
-        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'fastqc'), 'yellow'))
+    if engine == 'native':
+        params = {'engine': engine, 'adapters': list(adapters)}
+        version = step_cache.tool_version('XICRA')
     else:
-        ## call fastqc
         fastqc_bin = set_config.get_exe('fastqc')
-        codeReturn = call_fastqc(path, files, sample, fastqc_bin, threads)
+        params = {}
+        version = step_cache.tool_version('fastqc', fastqc_bin)
+    if num_reads:
+        params['sample_reads'] = num_reads
+    (done, record) = step_cache.check_step(filename_stamp, sample, 'fastqc', files, params, version, False)
+    if not done:
+        ## check quality for a subsample of reads, if desired
+        sampled_folder = None
+        qc_files = files
+        summary = os.path.join(path, sample_reads.summary_file)
+        if os.path.isfile(summary):
+            os.remove(summary)
+        
+        try:
+            if num_reads:
+                sampled_folder = tempfile.mkdtemp(prefix='sampled_reads_', dir=path)
+                qc_files = [ os.path.join(sampled_folder, fastq_qc.sample_name(f) + '.fastq') for f in files ]
+                sampling = [ sample_reads.subsample(f, num_reads, sampled) for f, sampled in zip(files, qc_files) ]
+                sample_reads.write_summary(sampling, path)
+                
+            ## call fastqc or check quality within XICRA
+            if engine == 'native':
+                codeReturn = fastq_qc.run_qc(path, qc_files, sample, threads, adapters)
+            else:
+                codeReturn = call_fastqc(path, qc_files, sample, fastqc_bin, threads)
+
+        except (OSError, ValueError, EOFError) as exc:
+            print (colored("** ERROR: sampling reads failed for sample %s: %s" %(sample, exc), 'red'))
+            codeReturn = False
+        
+        finally:
+            if sampled_folder:
+                shutil.rmtree(sampled_folder, ignore_errors=True)
 
         if codeReturn:
-            functions.time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, record)
         
         return ()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Copies and merges sequencing files in parallel.
+
+Files are transferred using, if possible:
+
+- reflinks (copy on write clone), when copying a file within the same filesystem,
+- ``copy_file_range`` system call, for copies and merges (data is not copied into XICRA process),
+- large buffers otherwise.
+
+Gzip files generated are verified member by member (CRC and size) and transfer
+throughput is reported for each file.
+"""
+## useful imports
+import os
+import sys
+import time
+import zlib
+import fcntl
+import concurrent.futures
+from termcolor import colored
+
+## buffer size for copies
+buffer_size = 16 * 1024 * 1024
+
+## ioctl FICLONE (linux/fs.h)
+FICLONE = 0x40049409
+
+##########################################################
+def _reflink(src_fd, dest_fd):
+    try:
+        fcntl.ioctl(dest_fd, FICLONE, src_fd)
+        return (True)
+    except OSError:
+        return (False)
+
+##########################################################
+def _copy_range(src_fd, dest_fd, size, dest_offset):
+    """Copies data using copy_file_range. Returns False if not supported."""
+    if not hasattr(os, 'copy_file_range'):
+        return (False)
+
+    copied = 0
+    try:
+        while copied < size:
+            sent = os.copy_file_range(src_fd, dest_fd, min(size - copied, 1024**3), copied, dest_offset + copied)
+            if sent == 0:
+                break
+            copied += sent
+    except OSError:
+        if copied:
+            raise
+        return (False)
+    return (copied == size)
+
+##########################################################
+def _copy_buffer(src_fd, dest_fd, dest_offset):
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    os.lseek(dest_fd, dest_offset, os.SEEK_SET)
+    while True:
+        data = os.read(src_fd, buffer_size)
+        if not data:
+            break
+        os.write(dest_fd, data)
+
+##########################################################
+def concatenate(outfile, list_files):
+    """
+    Copies (one file) or concatenates (several files) into outfile.
+
+    :returns: Method used: reflink, copy_file_range or buffer.
+    """
+    methods = set()
+    same_fs = all([ os.stat(fn).st_dev == os.stat(os.path.dirname(os.path.abspath(outfile))).st_dev for fn in list_files ])
+
+    dest_fd = os.open(outfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        offset = 0
+        for fn in list_files:
+            size = os.path.getsize(fn)
+            src_fd = os.open(fn, os.O_RDONLY)
+            try:
+                if len(list_files) == 1 and same_fs and _reflink(src_fd, dest_fd):
+                    methods.add('reflink')
+                elif _copy_range(src_fd, dest_fd, size, offset):
+                    methods.add('copy_file_range')
+                else:
+                    _copy_buffer(src_fd, dest_fd, offset)
+                    methods.add('buffer')
+            finally:
+                os.close(src_fd)
+            offset += size
+    finally:
+        os.close(dest_fd)
+
+    return (",".join(sorted(methods)))
+
+##########################################################
+def check_gzip(file_given):
+    """
+    Checks integrity of all members in a gzip file: CRC and size are checked by zlib for each member.
+
+    :returns: Number of members and uncompressed size. Raises ValueError if file is corrupted or truncated.
+    """
+    members = 0
+    total = 0
+    decompressor = None
+    with open(file_given, 'rb') as in_handle:
+        while True:
+            data = in_handle.read(4 * 1024 * 1024)
+            if not data:
+                break
+            while data:
+                if decompressor is None:
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    members += 1
+                try:
+                    total += len(decompressor.decompress(data))
+                except zlib.error as exc:
+                    raise ValueError("gzip member %s corrupted: %s" %(members, exc))
+                if decompressor.eof:
+                    data = decompressor.unused_data
+                    decompressor = None
+                else:
+                    data = b''
+
+    if decompressor is not None:
+        raise ValueError("gzip member %s truncated" %members)
+
+    return (members, total)
+
+##########################################################
+def transfer(outfile, list_files, Debug=False):
+    """
+    Copies or merges files into outfile and checks gzip integrity, if compressed.
+
+    :param outfile: Absolute path for the output file.
+    :param list_files: List of files to copy/merge. Files are merged in the order provided.
+
+    :returns: Dictionary with information for the transfer: files, bytes, seconds, method, members and MB/s.
+        Raises an exception if the transfer fails or checks do not pass: partial output is removed.
+    """
+    start = time.time()
+    try:
+        method = concatenate(outfile, list_files)
+        size = os.path.getsize(outfile)
+
+        ## check size
+        expected = sum([ os.path.getsize(fn) for fn in list_files ])
+        if size != expected:
+            raise ValueError("Size for %s (%s) differs from files provided (%s)" %(outfile, size, expected))
+
+        ## check gzip integrity
+        members = ''
+        if outfile.endswith('.gz'):
+            (members, uncompressed) = check_gzip(outfile)
+    except Exception:
+        if os.path.isfile(outfile):
+            os.remove(outfile)
+        raise
+
+    seconds = time.time() - start
+    info = {'outfile': outfile, 'files': list_files, 'bytes': size, 'seconds': round(seconds, 3),
+            'method': method, 'members': members,
+            'MB/s': round(size / 1024**2 / seconds, 2) if seconds else 0}
+
+    ## debugging messages
+    if Debug:
+        print (colored("** DEBUG: transfer %s" %info, 'yellow'))
+
+    return (info)
+
+##########################################################
+def transfer_files(transfer_dict, threads, details_file, Debug=False):
+    """
+    Copies or merges files in parallel.
+
+    :param transfer_dict: Dictionary containing output files as keys and list of files to copy/merge as values.
+    :param threads: Number of files to transfer at the same time.
+    :param details_file: File to write details and throughput for each file.
+    :param Debug: True/False for debugging messages.
+
+    :returns: List of dictionaries with information for each transfer (see :func:`XICRA.scripts.file_transfer.transfer`).
+        If any transfer fails, output generated is removed, failed files are listed and the process exits.
+    """
+    results = []
+    failed = {}
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, int(threads))) as executor:
+        commandsSent = { executor.submit(transfer, outfile, list_files, Debug): outfile for outfile, list_files in transfer_dict.items() }
+        for cmd2 in concurrent.futures.as_completed(commandsSent):
+            details = commandsSent[cmd2]
+            try:
+                info = cmd2.result()
+                results.append(info)
+                print ("\t%s: %.1f MB in %.2f s (%.1f MB/s) [%s]" %(os.path.basename(info['outfile']), info['bytes'] / 1024**2,
+                                                                     info['seconds'], info['MB/s'], info['method']))
+            except Exception as exc:
+                failed[details] = exc
+                print (colored('***ERROR:', 'red'))
+                print(colored('%r generated an exception: %s' % (details, exc), 'red'))
+
+    ## total throughput
+    seconds = time.time() - start
+    total = sum([ info['bytes'] for info in results ])
+    print ("+ %s files transferred: %.1f MB in %.2f s (%.1f MB/s)" %(len(results), total / 1024**2, seconds,
+                                                                     total / 1024**2 / seconds if seconds else 0))
+
+    ## details
+    with open(details_file, 'w') as out_handle:
+        out_handle.write("\t".join(['outfile', 'files', 'bytes', 'seconds', 'MB/s', 'method', 'gzip_members']) + "\n")
+        for info in sorted(results, key=lambda i: i['outfile']):
+            out_handle.write("\t".join([info['outfile'], ",".join(info['files']), str(info['bytes']), str(info['seconds']),
+                                        str(info['MB/s']), info['method'], str(info['members'])]) + "\n")
+
+    ## stop if any transfer failed: no partial or corrupted file is kept
+    if failed:
+        for outfile in failed:
+            if os.path.isfile(outfile):
+                os.remove(outfile)
+        print (colored("** ERROR: %s of %s files could not be transferred:" %(len(failed), len(transfer_dict)), 'red'))
+        for outfile in sorted(failed):
+            print (colored("\t%s (%s): %s" %(outfile, ",".join(transfer_dict[outfile]), failed[outfile]), 'red'))
+        print (colored("** Check the files above and run again.", 'red'))
+        exit(1)
+
+    return (results)
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) < 3:
+        print ("\nUsage:")
+        print ("python3 %s outfile file1 [file2 ...]\n" %os.path.realpath(__file__))
+        exit()
+
+    print (transfer(os.path.abspath(sys.argv[1]), [ os.path.abspath(f) for f in sys.argv[2:] ], True))
+
+######
+if __name__== "__main__":
+    main()
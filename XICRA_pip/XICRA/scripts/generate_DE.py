@@ -11,13 +11,37 @@ import sys
 from io import open
 from sys import argv
 import pandas as pd
+import numpy as np
 import csv
+import json
+import itertools
+from array import array
+from scipy import sparse
+from termcolor import colored
 
 from HCGB import functions
+from XICRA.scripts import step_cache
+
+## folder within the report folder to store counts for each software
+cohort_folder = '.cohort'
+
+## rows converted to dense and written at once
+chunk_rows = 50000
 
 ####################
-def generate_DE(dataframe_results, Debug, outfolder):
+def generate_DE(dataframe_results, Debug, outfolder, output_format='csv', store=True):
 	"""
+	Generates expression matrices for each software employed.
+	
+	Counts for each sample are kept in a cohort store within outfolder (see 
+	:func:`XICRA.scripts.generate_DE.load_cohort`): when samples are added or analyzed again, 
+	only their results are read and matrices are generated from the store.
+	
+	:param dataframe_results: Dataframe containing name, soft and filename (mirtop.tsv) for each sample.
+	:param Debug: True/False for debugging messages.
+	:param outfolder: Folder to store results.
+	:param output_format: csv, parquet or feather.
+	:param store: True/False to use the cohort store.
 	"""
 	## get results dictionary for each software employed 
 	soft_list = dataframe_results.soft.unique()
@@ -43,135 +67,383 @@ def generate_DE(dataframe_results, Debug, outfolder):
 			print ("dict_files")
 			print (dict_files)
 
-		## get data
-		(all_data, all_seqs) = generate_matrix(dict_files, soft_name.lower(), Debug)
+		## get data: only samples new or with different results are read
+		cohort = load_cohort(os.path.join(outfolder, cohort_folder, soft_name)) if store else None
+		(all_data, all_seqs, uid_codes) = generate_matrix(dict_files, soft_name.lower(), Debug, cohort)
 		
 		## discard duplicate UIDs if any
-		all_data_filtered, all_data_duplicated = discard_UID_duplicated(all_data)
+		all_data_filtered, all_data_duplicated = discard_UID_duplicated(all_data, uid_codes)
 		
 		## dump data in folder provided
 		csv_outfile = os.path.join(outfolder, 'miRNA_expression-' + soft_name)
-		all_data_filtered.to_csv(csv_outfile + ".csv", quoting=csv.QUOTE_NONNUMERIC)
-		all_data_duplicated.to_csv(csv_outfile + '_dup.csv', quoting=csv.QUOTE_NONNUMERIC)
-		all_seqs.to_csv(csv_outfile + '_seq.csv', quoting=csv.QUOTE_NONNUMERIC)
+		if output_format == 'csv':
+			write_csv(all_data_filtered, csv_outfile + ".csv")
+			write_csv(all_data_duplicated, csv_outfile + '_dup.csv')
+			write_csv(all_seqs, csv_outfile + '_seq.csv')
+		else:
+			write_matrix(split_ID(all_data_filtered), csv_outfile, output_format)
+			write_matrix(split_ID(all_data_duplicated), csv_outfile + '_dup', output_format)
+			write_matrix(all_seqs, csv_outfile + '_seq', output_format)
 
 ####################
-def discard_UID_duplicated(df_data):
+def check_output_format(output_format):
 	"""
+	Checks python modules required for the output format are available.
 	"""
-	## get data index
-	df_data['ID'] = df_data.index
-	new_data = df_data.filter(['ID'], axis=1)	
+	if output_format in ('parquet', 'feather'):
+		try:
+			import pyarrow
+		except ImportError:
+			print (colored("** ERROR: python module pyarrow is required for --output_format %s. Install it or use csv." %output_format, 'red'))
+			exit()
 
-	# split ID (hsa-let-7a-2-3p&NA&qNkjr6Ov2) into miRNA, variant and UID
-	tmp = new_data['ID'].str.split('&', expand = True)
-	new_data['miRNA']  = tmp[0]
-	new_data['variant']  = tmp[1]
-	new_data['UID']  = tmp[2]
+####################
+def split_ID(df_data):
+	"""
+	Adds categorical miRNA and variant columns retrieved from index (miRNA&variant&UID).
+	"""
+	df_data = df_data.copy()
+	ID_split = df_data.index.str.split('&')
+	df_data.insert(0, 'variant', pd.Categorical(ID_split.str[1]))
+	df_data.insert(0, 'miRNA', pd.Categorical(ID_split.str[0]))
+	return (df_data)
+
+####################
+def _dense(df_data):
+	"""Returns dataframe given with sparse columns converted to dense."""
+	sparse_columns = { col: df_data[col].dtype.subtype for col in df_data.columns if isinstance(df_data[col].dtype, pd.SparseDtype) }
+	return (df_data.astype(sparse_columns) if sparse_columns else df_data)
+
+####################
+def _chunks(df_data):
+	"""Yields dense dataframes for each chunk of rows (at least one, for empty dataframes)."""
+	for start in range(0, max(len(df_data), 1), chunk_rows):
+		yield (_dense(df_data.iloc[start:start + chunk_rows]))
+
+####################
+def write_csv(df_data, outfile):
+	"""
+	Writes a matrix in csv format (quoting non numeric values).
+	
+	Rows are written in chunks: sparse columns are only converted to dense for each chunk.
+	"""
+	with open(outfile, 'w', newline='') as out_handle:
+		for position, chunk in enumerate(_chunks(df_data)):
+			chunk.to_csv(out_handle, header=(position == 0), quoting=csv.QUOTE_NONNUMERIC)
 
-	## count 
-	count_groups = new_data.groupby('UID').count()
-	## print to file?
+####################
+def write_matrix(df_data, outfile, output_format):
+	"""
+	Writes a matrix in columnar format (parquet or feather).
 	
-	## get duplicated
-	bigger1count = count_groups[ count_groups['ID'] > 1 ]
-	## print counts to file?
+	Count columns containing only integer values are stored as integers (nullable
+	if any missing value) and index is stored as first column. Samples can be
+	loaded later without reading the whole file, e.g.:
 	
-	## get list of UIDs duplicate
-	bigger1count_list = bigger1count.index.to_list()
-	duplicates = new_data[new_data['UID'].isin(bigger1count_list)]
-	## print duplicate to file?
+	pd.read_parquet(file, columns=['ID', 'sample1'])
+	
+	Rows are written in chunks: sparse columns are only converted to dense for each chunk.
+	
+	:param df_data: Dataframe to write.
+	:param outfile: Absolute path for the output file without extension.
+	:param output_format: parquet or feather.
+	
+	:returns: Absolute path for the file generated.
+	"""
+	import pyarrow
+	import pyarrow.parquet
+	
+	## integer columns: checked for the whole column
+	dtypes = {}
+	for col in df_data.columns:
+		if not pd.api.types.is_float_dtype(df_data[col]):
+			continue
+		if isinstance(df_data[col].dtype, pd.SparseDtype):
+			values = df_data[col].array.sp_values
+			missing = len(values) < len(df_data) or np.isnan(values).any()
+		else:
+			values = df_data[col].to_numpy()
+			missing = np.isnan(values).any()
+		values = values[~np.isnan(values)]
+		if not (np.mod(values, 1) == 0).all():
+			continue
+		dtypes[col] = 'Int64' if missing else 'int64'
+	
+	outfile = outfile + "." + output_format
+	writer = None
+	try:
+		for chunk in _chunks(df_data):
+			chunk = chunk.reset_index().astype(dtypes)
+			if writer is None:
+				schema = pyarrow.Schema.from_pandas(chunk, preserve_index=False)
+				if output_format == 'parquet':
+					writer = pyarrow.parquet.ParquetWriter(outfile, schema, compression='zstd')
+				elif output_format == 'feather':
+					writer = pyarrow.ipc.new_file(outfile, schema, options=pyarrow.ipc.IpcWriteOptions(compression='zstd'))
+			writer.write_table(pyarrow.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+	finally:
+		if writer is not None:
+			writer.close()
+	
+	return (outfile)
 
-	## get duplicated data
-	duplicates_indes_list = duplicates.index.to_list()
-	duplicates_expression = df_data[df_data.index.isin(duplicates_indes_list)]
-	#duplicates_expression['UID'] = duplicates_expression['ID'].str.split('&', expand = True)[2]
-	duplicates_expression = duplicates_expression.drop(['ID'], axis=1)
+####################
+def discard_UID_duplicated(df_data, uid_codes=None):
+	"""
+	Splits count matrix into features with a unique UID and features sharing UID.
+	
+	The same sequence (UID) might be assigned to several miRNA or variants e.g.
+	hsa-let-7a-2-3p&NA&qNkjr6Ov2 and hsa-let-7a-3p&NA&qNkjr6Ov2
+	
+	:param df_data: Count matrix with index miRNA&variant&UID.
+	:param uid_codes: Integer code of the UID for each row, as returned by :func:`XICRA.scripts.generate_DE.generate_matrix`. 
+		If not provided, it is retrieved from the index.
+	
+	:returns: Dataframe for unique UIDs and dataframe for duplicated UIDs.
+	"""
+	## integer code for each UID
+	if uid_codes is None:
+		uid_codes = pd.factorize(df_data.index.str.rsplit('&', n=1).str[-1])[0]
+	
+	## count each code in a single pass
+	uid_codes = np.asarray(uid_codes)
+	duplicated_mask = np.bincount(uid_codes)[uid_codes] > 1 if len(uid_codes) else np.zeros(0, dtype=bool)
+	
+	## get duplicated & clean data
+	duplicates_expression = df_data[duplicated_mask]
 	duplicates_expression.index.name = "ID"
 	
-	## get clean data
-	clean_data_expression = df_data[~df_data.index.isin(duplicates_indes_list)]
-	#clean_data_expression['UID'] = clean_data_expression['ID'].str.split('&', expand = True)[2]
-	clean_data_expression =	clean_data_expression.drop(['ID'], axis=1)
+	clean_data_expression = df_data[~duplicated_mask]
 	clean_data_expression.index.name = "ID"
-	## Fix this error
-	## A value is trying to be set on a copy of a slice from a DataFrame.
-	## Try using .loc[row_indexer,col_indexer] = value instead
-	## 
-	## See the caveats in the documentation: http://pandas.pydata.org/pandas-docs/stable/indexing.html#indexing-view-versus-copy
-	##   clean_data_expression['UID'] = clean_data_expression['ID'].str.split('&', expand = True)[2]
 	
 	return (clean_data_expression, duplicates_expression)
 
 ####################
-def generate_matrix(dict_files, soft_name, Debug):
+def _count_column(header, sample, soft_name):
 	"""
+	Returns position of the column containing counts for the sample given.
+	
+	 - sRNAbench mirtop creates a column id with sRNAbench instead of sample name
+	 - OptimiR mirtop creates a column containing sample name and other tags (trim, joined, fastq...)
+	 - miraligner mirtop creates a column containing sample name
 	"""
-	######################################################
-	### For a list of files, generates a count matrix with a unique index id by merging:
-	### information provided within each file: name, variant and UID by '&'
-	### e.g. AlaAGC&3'-tRF&tRF-16-KSP185D
-	### e.g. hsa-let-7a-2-3p&NA&qNkjr6Ov2
-	### 
-	### It returns a dataframe containing for each index generated
-	### count values for each sample (sample_name) in columns
-	###
-	#########################################################
-	all_data = pd.DataFrame()
-	seq_all_data = pd.DataFrame()
-	for sample, this_file in dict_files.items():
-		print ('+ Reading information from sample: ', sample)	
+	if (soft_name == 'srnabench'):
+		search_list = [ col for col in header if col == 'sRNAbench' ]
+	elif (soft_name == 'optimir'):
+		regex=re.compile(sample + '.*')
+		search_list = list(filter(regex.match, header))
+	else:
+		search_list = [ col for col in header if col == sample ]
+
+	if search_list:
+		return (header.index(search_list[0]))
+	return (None)
+
+####################
+def new_features():
+	"""
+	Returns an empty feature dictionary shared by all samples:
+	
+	 - ids: unique id (miRNA&variant&UID) -> integer ID, unique_ids: unique id for each integer ID
+	 - uid_ids: UID -> integer code, uids and reads: UID and sequence (Read) for each code
+	 - feature_uid: integer code of the UID for each integer ID
+	"""
+	return ({'ids': {}, 'unique_ids': [], 'uid_ids': {}, 'uids': [], 'reads': [], 'feature_uid': array('q')})
+
+####################
+def _add_feature(features, unique_id, uid, read):
+	"""Adds a feature to the dictionary and returns its integer ID."""
+	uid_id = features['uid_ids'].get(uid)
+	if uid_id is None:
+		uid_id = len(features['uids'])
+		features['uid_ids'][uid] = uid_id
+		features['uids'].append(uid)
+		features['reads'].append(read)
+	
+	feature_id = len(features['unique_ids'])
+	features['ids'][unique_id] = feature_id
+	features['unique_ids'].append(unique_id)
+	features['feature_uid'].append(uid_id)
+	return (feature_id)
+
+####################
+def read_counts(this_file, sample, soft_name, features):
+	"""
+	Reads counts for each feature of a sample from a mirtop.tsv file.
+	
+	Features not found in the dictionary are added.
+	
+	:param this_file: mirtop.tsv file.
+	:param sample: Sample name.
+	:param soft_name: Software name in lower case: srnabench, optimir, miraligner.
+	:param features: Feature dictionary, see :func:`XICRA.scripts.generate_DE.new_features`.
+	
+	:returns: Arrays containing integer ID and count for each row or None if not available.
+	"""
+	if not functions.files_functions.is_non_zero_file(this_file):
+		return (None)
+	
+	sample_features = array('q')
+	sample_counts = array('d')
+	ids = features['ids']
+	
+	## header of tsv files: 
+	## UID	Read	miRNA	Variant	iso_5p	iso_3p	iso_add3p	iso_snp	sRNAbench
+	with open(this_file) as in_handle:
+		reader = csv.reader(in_handle, delimiter='\t')
+		header = next(reader, [])
+		count_index = _count_column(header, sample, soft_name)
+		if count_index is None:
+			return (None)
 		
-		## 
-		if functions.files_functions.is_non_zero_file(this_file):
-			data = pd.read_csv(this_file, sep='\t')
-		else:
-			print ('\t - Information not available for sample: ', sample)	
-			continue
-		##
-		if (data.size == 0):
-			print ('\t - Information not available for sample: ', sample)  
-			continue
+		uid_index = header.index('UID')
+		read_index = header.index('Read')
+		miRNA_index = header.index('miRNA')
+		variant_index = header.index('Variant')
+		
+		for row in reader:
+			if not row:
+				continue
+			variant = row[variant_index] if row[variant_index] else 'NA'
+			unique_id = row[miRNA_index] + '&' + variant + '&' + row[uid_index]
+			
+			## get or assign integer ID
+			feature_id = ids.get(unique_id)
+			if feature_id is None:
+				feature_id = _add_feature(features, unique_id, row[uid_index], row[read_index])
+			
+			sample_features.append(feature_id)
+			sample_counts.append(float(row[count_index]))
+	
+	##
+	if not len(sample_features):
+		return (None)
+	
+	return (np.frombuffer(sample_features, dtype=np.int64), np.frombuffer(sample_counts, dtype=np.float64))
 
-		## get info, generate unique name and merge for samples
-		## header of tsv files: 
-		## UID	Read	miRNA	Variant	iso_5p	iso_3p	iso_add3p	iso_snp	sRNAbench
-
-		data['Variant'].fillna('NA', inplace=True)
-		data['unique_id'] = data.apply(lambda data: data['miRNA'] + '&' + data['Variant'] + '&' + data['UID'], axis=1)
-
-		## parse according to software
-		if (soft_name == 'srnabench'):
-			## sRNAbench mirtop creates a column id with sRNAbench instead of sample name
-			new_data = data.filter(['unique_id', 'sRNAbench'], axis=1)
-			new_data = new_data.set_index('unique_id')
-			new_data = new_data.rename(columns={'sRNAbench': sample})
-
-		if (soft_name == 'optimir'):
-			## OptimiR mirtop creates a column containing sample name and other tags (trim, joined, fastq...)
-			regex=re.compile(sample + '.*')
-			search_list = list(filter(regex.match, data.columns.values.tolist()))
-			new_data = data.filter(['unique_id', search_list[0]], axis=1)
-			new_data = new_data.set_index('unique_id')
-			new_data = new_data.rename(columns={search_list[0]: sample})
-
-		if (soft_name == 'miraligner'):
-			## miraligner mirtop creates a column containing sample name and other tags (trim, joined, fastq...)
-			new_data = data.filter(['unique_id', sample], axis=1)
-			new_data = new_data.set_index('unique_id')
-
-		## sequence information
-		seq_data = data.filter(['UID', 'Read'], axis=1)	
-		seq_data = seq_data.set_index('UID')
-		seq_all_data = seq_all_data.append(seq_data, sort=True).drop_duplicates('Read')
+####################
+def build_matrix(features, samples, sample_data):
+	"""
+	Creates the count matrix for the samples given: features sorted by unique id, missing values as NaN.
+	
+	Only features present in any of the samples are included. Counts are stored as sparse columns
+	(see :func:`XICRA.scripts.generate_DE.write_csv` and :func:`XICRA.scripts.generate_DE.write_matrix`
+	to write them), so memory grows with the counts retrieved and the number of unique features.
+	
+	:param features: Feature dictionary, see :func:`XICRA.scripts.generate_DE.new_features`.
+	:param samples: Sample names.
+	:param sample_data: Arrays containing integer ID and count for each row of each sample, as returned by 
+		:func:`XICRA.scripts.generate_DE.read_counts`.
+	
+	:returns: Dataframe containing for each index generated count values for each sample in columns,
+		dataframe containing the sequence (Read) for each UID and integer code of the UID for each row.
+	"""
+	feature_col = np.concatenate([ data[0] for data in sample_data ]) if sample_data else np.array([], dtype=np.int64)
+	count_col = np.concatenate([ data[1] for data in sample_data ]) if sample_data else np.array([], dtype=np.float64)
+	sample_col = np.repeat(np.arange(len(samples)), [ len(data[0]) for data in sample_data ]).astype(np.int64)
+	
+	## features present sorted by unique_id
+	used = np.unique(feature_col)
+	unique_ids = np.array(features['unique_ids'], dtype=object)[used] if len(used) else np.array([], dtype=object)
+	order = np.argsort(unique_ids, kind='stable')
+	rank = np.full(len(features['unique_ids']), -1, dtype=np.int64)
+	rank[used[order]] = np.arange(len(used))
+	
+	## entries for the same feature and sample are summed in the order read
+	rows = rank[feature_col]
+	(keys, inverse) = np.unique(sample_col * len(used) + rows, return_inverse=True)
+	sums = np.zeros(len(keys))
+	np.add.at(sums, inverse, count_col)
+	
+	## sparse matrix: counts of zero are kept (different from missing values)
+	matrix = sparse.coo_matrix((sums, (keys % max(len(used), 1), keys // max(len(used), 1))), 
+							shape=(len(used), len(samples))).tocsc()
+	
+	## a sparse column (missing values as NaN) for each sample
+	columns = {}
+	for position, sample in enumerate(samples):
+		(start, end) = (matrix.indptr[position], matrix.indptr[position + 1])
+		column = np.full(len(used), np.nan)
+		column[matrix.indices[start:end]] = matrix.data[start:end]
+		columns[sample] = pd.arrays.SparseArray(column, fill_value=np.nan)
+	
+	all_data = pd.DataFrame(columns, index=pd.Index(unique_ids[order], name='unique_id'), columns=samples)
+	feature_uid = np.frombuffer(features['feature_uid'], dtype=np.int64) if len(features['feature_uid']) else np.array([], dtype=np.int64)
+	uid_codes = feature_uid[used[order]]
+	
+	## sequence for each UID in order of appearance
+	codes = feature_uid[feature_col]
+	first = np.sort(np.unique(codes, return_index=True)[1])
+	seq_codes = codes[first]
+	seq_all_data = pd.DataFrame({'Read': [ features['reads'][code] for code in seq_codes ]}, 
+							index=pd.Index([ features['uids'][code] for code in seq_codes ], name='UID'))
+	
+	return (all_data, seq_all_data, uid_codes)
 
+####################
+def generate_matrix(dict_files, soft_name, Debug, cohort=None):
+	"""
+	Generates a count matrix for all samples provided.
+	
+	For a list of files, generates a count matrix with a unique index id by merging
+	information provided within each file: name, variant and UID by '&'
+	
+	 - e.g. AlaAGC&3'-tRF&tRF-16-KSP185D
+	 - e.g. hsa-let-7a-2-3p&NA&qNkjr6Ov2
+	
+	Each file is read line by line. Each unique id gets an integer ID in a dictionary
+	shared by all samples and counts are stored as (feature, sample, count) entries, 
+	so memory is proportional to the counts retrieved. The matrix is only created once
+	all samples have been read.
+	
+	If a cohort store is provided (see :func:`XICRA.scripts.generate_DE.load_cohort`), only
+	samples new or with a different mirtop.tsv (content) are read and the store is updated.
+	
+	:param dict_files: Dictionary containing sample names as keys and mirtop.tsv files as values.
+	:param soft_name: Software name in lower case: srnabench, optimir, miraligner.
+	:param Debug: True/False for debugging messages.
+	:param cohort: Cohort store or None.
+	
+	:returns: Dataframe containing for each index generated count values for each sample in columns,
+		dataframe containing the sequence (Read) for each UID and integer code of the UID for each row.
+	"""
+	features = cohort['features'] if cohort else new_features()
+	digests = step_cache.input_digests(dict_files.values(), cohort['inputs'] if cohort else {})
+	samples = []
+	sample_data = []
+	
+	for sample, this_file in dict_files.items():
+		digest = digests[os.path.abspath(this_file)][1]
+		stored = cohort['samples'].get(sample) if cohort else None
+		if stored and digest and stored['digest'] == digest:
+			## same results as previous run
+			if Debug:
+				print ('+ Reusing information from sample: ', sample)
+			data = _load_sample(cohort, sample, stored)
+		else:
+			print ('+ Reading information from sample: ', sample)
+			data = read_counts(this_file, sample, soft_name, features)
+			if cohort:
+				_save_sample(cohort, sample, digest, data)
+		
+		if data is None:
+			print ('\t - Information not available for sample: ', sample)
+			continue
+		
+		samples.append(sample)
+		sample_data.append(data)
+		
 		## debugging messages
 		if Debug:
-			print ("*** DEBUG: data for sample ***")
-			print (new_data)
-		
-		all_data = pd.concat([all_data, new_data], axis=1, sort=True)
-
+			print ("*** DEBUG: features for sample ***")
+			print (len(data[0]))
+	
+	if cohort:
+		cohort['inputs'].update(digests)
+		save_cohort(cohort)
+	
+	(all_data, seq_all_data, uid_codes) = build_matrix(features, samples, sample_data)
+	
 	##
 	## debugging messages
 	if Debug:
@@ -180,8 +452,88 @@ def generate_matrix(dict_files, soft_name, Debug):
 		print ("*** DEBUG: data for sequences all samples ***")
 		print (seq_all_data)
 		
-		
-	return (all_data, seq_all_data)	
+	return (all_data, seq_all_data, uid_codes)
+
+####################
+def load_cohort(folder):
+	"""
+	Loads a cohort store: feature dictionary and counts for each sample read in previous runs.
+	
+	Store files within folder:
+	
+	 - features.tsv: unique id, UID and Read for each feature (integer ID is the line number). New features are appended.
+	 - samples/<sample>.npz: integer ID and count for each row of the mirtop.tsv file of the sample.
+	 - cohort.json: digest of the mirtop.tsv file for each sample and number of features stored.
+	
+	:returns: Cohort store (empty if not available).
+	"""
+	cohort = {'folder': folder, 'features': new_features(), 'samples': {}, 'inputs': {}, 'stored': 0}
+	info_file = os.path.join(folder, 'cohort.json')
+	features_file = os.path.join(folder, 'features.tsv')
+	if not os.path.isfile(info_file) or not os.path.isfile(features_file):
+		return (cohort)
+	
+	try:
+		with open(info_file) as in_handle:
+			info = json.load(in_handle)
+		with open(features_file, newline='') as in_handle:
+			reader = csv.reader(in_handle, delimiter='\t', quoting=csv.QUOTE_NONE, escapechar='\\')
+			for row in itertools.islice(reader, info['features']):
+				_add_feature(cohort['features'], row[0], row[1], row[2])
+	except (OSError, ValueError, KeyError, IndexError):
+		print (colored("** ATTENTION: cohort store in %s could not be read. All samples would be read again." %folder, 'yellow'))
+		return (cohort)
+	
+	if len(cohort['features']['unique_ids']) != info['features']:
+		return (cohort)
+	
+	cohort['samples'] = info['samples']
+	cohort['inputs'] = info['inputs']
+	cohort['stored'] = info['features']
+	return (cohort)
+
+####################
+def _sample_file(cohort, sample):
+	return (os.path.join(cohort['folder'], 'samples', sample + '.npz'))
+
+####################
+def _load_sample(cohort, sample, stored):
+	"""Returns arrays stored for the sample (None if no information available)."""
+	if not stored['available']:
+		return (None)
+	with np.load(_sample_file(cohort, sample)) as data:
+		return (data['features'], data['counts'])
+
+####################
+def _save_sample(cohort, sample, digest, data):
+	"""Stores arrays for the sample (saved in the store together with features, see :func:`save_cohort`)."""
+	os.makedirs(os.path.join(cohort['folder'], 'samples'), exist_ok=True)
+	if data is not None:
+		np.savez(_sample_file(cohort, sample), features=data[0], counts=data[1])
+	cohort['samples'][sample] = {'digest': digest, 'available': data is not None}
+
+####################
+def save_cohort(cohort):
+	"""Appends new features and saves information for each sample of the cohort store."""
+	os.makedirs(cohort['folder'], exist_ok=True)
+	features = cohort['features']
+	features_file = os.path.join(cohort['folder'], 'features.tsv')
+	
+	## discard features not recorded (e.g. interrupted run) and append new ones
+	with open(features_file, 'a+', newline='') as out_handle:
+		out_handle.seek(0)
+		size = sum([ len(line.encode()) for line in itertools.islice(out_handle, cohort['stored']) ])
+		out_handle.truncate(size)
+		writer = csv.writer(out_handle, delimiter='\t', quoting=csv.QUOTE_NONE, escapechar='\\', lineterminator='\n')
+		for feature_id in range(cohort['stored'], len(features['unique_ids'])):
+			uid_id = features['feature_uid'][feature_id]
+			writer.writerow([features['unique_ids'][feature_id], features['uids'][uid_id], features['reads'][uid_id]])
+	cohort['stored'] = len(features['unique_ids'])
+	
+	info_file = os.path.join(cohort['folder'], 'cohort.json')
+	with open(info_file + '.tmp', 'w') as out_handle:
+		json.dump({'features': cohort['stored'], 'samples': cohort['samples'], 'inputs': cohort['inputs']}, out_handle)
+	os.replace(info_file + '.tmp', info_file)
 
 ######
 
@@ -200,17 +552,17 @@ def main():
     print (dictionary_info)
 
     ## get data
-    (all_data, all_seqs) = generate_matrix(dictionary_info, "miraligner", False)
+    (all_data, all_seqs, uid_codes) = generate_matrix(dictionary_info, "miraligner", False)
 
     ## discard duplicate UIDs if any
-    all_data_filtered, all_data_duplicated = discard_UID_duplicated(all_data)
+    all_data_filtered, all_data_duplicated = discard_UID_duplicated(all_data, uid_codes)
 
     ## dump data in folder provided
     outfolder = "./"
     csv_outfile = os.path.join(outfolder, 'miRNA_expression')
-    all_data_filtered.to_csv(csv_outfile + ".csv", quoting=csv.QUOTE_NONNUMERIC)
-    all_data_duplicated.to_csv(csv_outfile + '_dup.csv', quoting=csv.QUOTE_NONNUMERIC)
-    all_seqs.to_csv(csv_outfile + '_seq.csv', quoting=csv.QUOTE_NONNUMERIC)
+    write_csv(all_data_filtered, csv_outfile + ".csv")
+    write_csv(all_data_duplicated, csv_outfile + '_dup.csv')
+    write_csv(all_seqs, csv_outfile + '_seq.csv')
 
 
 
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+In-process isomiR annotation using miRTop python library.
+
+Replaces the ``mirtop gff``, ``mirtop counts`` and ``mirtop export`` command
+line calls for each sample. Reference information (hairpin fasta and miRBase
+GFF) is loaded once per run and shared by all samples and software.
+"""
+## useful imports
+import os
+import sys
+import argparse
+import csv
+from collections import OrderedDict
+
+## mirtop library
+from mirtop.mirna import fasta, mapper
+from mirtop.mirna.realign import read_id
+from mirtop.mirna.annotate import annotate
+from mirtop.importer import seqbuster, srnabench, optimir
+from mirtop.gff import body, header
+from mirtop.gff.classgff import feature
+
+## import my modules
+from HCGB import functions
+from XICRA.scripts import miRBase_reference
+
+## column names generated by mirtop counts
+variant_header = ['iso_5p', 'iso_3p', 'iso_add3p', 'iso_snp']
+
+##########################################################
+def load_reference(hairpinFasta, miRNA_gff, species, Debug, reference_folder=None):
+    """
+    Loads hairpin and miRNA coordinates once for all samples.
+
+    It returns a namespace with the attributes expected by mirtop importers, so
+    the same object can be shared (read only) by all threads.
+
+    :param hairpinFasta: miRNA hairpin fasta file.
+    :param miRNA_gff: miRBase GFF file containing miRNA information.
+    :param species: Species tag ID (e.g. hsa).
+    :param Debug: True/False for debugging messages.
+    :param reference_folder: miRBase reference store folder containing pre-parsed information, if any.
+
+    :type hairpinFasta: string
+    :type miRNA_gff: string
+    :type species: string
+    :type Debug: bool
+    :type reference_folder: string
+
+    :returns: :class:`argparse.Namespace` containing precursors, matures and database.
+    """
+    reference = argparse.Namespace(hairpin=hairpinFasta, gtf=miRNA_gff, sps=species,
+                                   out_format='gff', add_extra=False, keep_name=False,
+                                   out_genomic=False, low_memory=False, database=None)
+
+    if reference_folder:
+        ## pre-parsed information: see XICRA.scripts.miRBase_reference
+        (reference.database, reference.precursors, reference.matures) = miRBase_reference.load_index(reference_folder)
+    else:
+        reference.database = mapper.guess_database(reference)
+        reference.precursors = fasta.read_precursor(hairpinFasta, species)
+        reference.matures = mapper.read_gtf_to_precursor(miRNA_gff, reference.database)
+
+    ## debugging messages
+    if Debug:
+        print ("** DEBUG: isomiR annotation reference")
+        print ("database: " + reference.database)
+        print ("precursors: " + str(len(reference.precursors)))
+        print ("matures: " + str(len(reference.matures)))
+
+    return (reference)
+
+##########################################################
+def read_results(results, format, reference):
+    """
+    Reads software results and converts them into GFF lines.
+
+    :param results: sRNAbench folder, OptimiR gff3 file or miraligner .mirna file.
+    :param format: Software format: srnabench, optimir or seqbuster.
+    :param reference: Object returned by :func:`XICRA.scripts.isomiR_annotation.load_reference`.
+
+    :returns: Sample name and nested dictionary: {precursor: {start: [hits]}}
+    """
+    if format == "srnabench":
+        ## sRNAbench reads reads.annotation and microRNAannotation.txt within folder
+        sample = os.path.basename(os.path.normpath(results))
+        lines = srnabench.read_file(results, reference)
+    elif format == "optimir":
+        sample = header.read_samples(results)
+        lines = optimir.read_file(results, reference)
+    elif format == "seqbuster":
+        sample = os.path.splitext(os.path.basename(results))[0]
+        reads = seqbuster.read_file(results, reference)
+        ann = annotate(reads, reference.matures, reference.precursors, quiet=True)
+        lines = body.create(ann, reference.database, sample, reference, quiet=True)
+    else:
+        raise ValueError("Format %s not supported for isomiR annotation" %format)
+
+    ## optimir returns a list of samples
+    if isinstance(sample, list):
+        sample = sample[0]
+
+    return (sample, lines)
+
+##########################################################
+def restore_counts(lines, counts):
+    """
+    Multiplies expression for each isomiR by the number of reads collapsed into its sequence.
+
+    Used for software analysing collapsed reads without taking counts into
+    account (see :func:`XICRA.scripts.collapse_reads.collapse`).
+
+    :param lines: Nested dictionary returned by :func:`XICRA.scripts.isomiR_annotation.read_results`.
+    :param counts: Dictionary containing sequences as keys and counts as values.
+    """
+    for precursor in lines:
+        for start in lines[precursor]:
+            for hit in lines[precursor][start]:
+                gff = feature(hit[4])
+                count = counts.get(read_id(gff.attributes["UID"]), 1)
+                
+                expression = []
+                for value in gff.attributes["Expression"].split(","):
+                    value = float(value) * count
+                    expression.append(str(int(value)) if value.is_integer() else str(round(value, 2)))
+                
+                gff.attributes["Expression"] = ",".join(expression)
+                hit[2] = expression
+                hit[4] = body.paste_columns(gff, body.guess_format(hit[4]))
+
+##########################################################
+def _sorted_lines(lines):
+    """Returns GFF lines in the order mirtop would print them."""
+    for precursor in lines:
+        for start in sorted(lines[precursor].keys()):
+            for hit in lines[precursor][start]:
+                yield (hit[4])
+
+##########################################################
+def write_gff(lines, sample, format, reference, gff_file):
+    """
+    Writes a mirGFF3 file for the sample given.
+
+    :param lines: Nested dictionary returned by :func:`XICRA.scripts.isomiR_annotation.read_results`.
+    :param sample: Sample name to include in COLDATA header.
+    :param format: Software format.
+    :param reference: Object returned by :func:`XICRA.scripts.isomiR_annotation.load_reference`.
+    :param gff_file: Absolute path for the output GFF file.
+    """
+    gff_header = header.create([sample], reference.database, header.make_tools([format]))
+    with open(gff_file, 'w') as out_handle:
+        print (gff_header, file=out_handle)
+        for line in _sorted_lines(lines):
+            ## same attribute layout as mirtop merged output
+            print (body.paste_columns(feature(line), body.guess_format(line)), file=out_handle)
+
+##########################################################
+def expand_variant(variant):
+    """
+    Classifies a mirtop Variant attribute into iso_5p, iso_3p, iso_add3p and iso_snp.
+
+    Follows the same rules as ``mirtop counts``: length changes are retrieved
+    from the tag value and any single nucleotide variant counts once.
+
+    :param variant: Variant attribute e.g. iso_5p:-1,iso_add3p:2,iso_snv_seed
+    :returns: List of strings for iso_5p, iso_3p, iso_add3p and iso_snp.
+    """
+    isomir = {}
+    snp = 0
+    for v in variant.split(","):
+        if v.find(":") > 0:
+            isomir[v.split(":")[0]] = v.split(":")[1]
+        elif v.find("snv") > 0:
+            snp += 1
+
+    return ([ str(isomir.get(tag, 0)) for tag in variant_header[:-1] ] + [str(snp)])
+
+##########################################################
+def write_counts(lines, sample, counts_file):
+    """
+    Writes a count table compatible with ``mirtop counts``.
+
+    Header: UID Read miRNA Variant iso_5p iso_3p iso_add3p iso_snp sample
+
+    Information is retrieved from lines in memory instead of reading the GFF
+    file generated.
+    """
+    seen = set()
+    with open(counts_file, 'w', newline='') as out_handle:
+        writer = csv.writer(out_handle, delimiter='\t', lineterminator='\n')
+        writer.writerow(['UID', 'Read', 'miRNA', 'Variant'] + variant_header + [sample])
+
+        for line in _sorted_lines(lines):
+            attr = feature(line).attributes
+            row = [attr["UID"], attr["Read"], attr["Name"], attr["Variant"]]
+            row = row + expand_variant(attr["Variant"]) + attr["Expression"].strip().split(",")
+
+            ## mirtop counts drops duplicated entries
+            key = tuple(row)
+            if key in seen:
+                continue
+            seen.add(key)
+            writer.writerow(row)
+
+##########################################################
+def write_export(lines, sample, reference, export_file):
+    """
+    Writes isomiRs (Bioconductor) format as ``mirtop export --format isomir``.
+
+    Header: seq mir mism add t5 t3 sample
+    """
+    with open(export_file, 'w') as out_handle:
+        print ("\t".join(['seq', 'mir', 'mism', 'add', 't5', 't3', sample]), file=out_handle)
+
+        for line in _sorted_lines(lines):
+            gff = feature(line)
+            attr = gff.attributes
+            if attr["Parent"] not in reference.precursors:
+                continue
+            if attr["Name"] not in reference.matures[attr["Parent"]]:
+                continue
+
+            extra = body.variant_with_nt(line, reference.precursors, reference.matures)
+            if extra == "Invalid":
+                continue
+
+            ## nucleotide changes: iso_snv, iso_add3p, iso_5p, iso_3p
+            isomir = OrderedDict((tag, "0") for tag in ['iso_snv', 'iso_add3p', 'iso_5p', 'iso_3p'])
+            for v in extra.split(","):
+                if v.find(":") > 0:
+                    isomir[v.split(":")[0]] = v.split(":")[1]
+
+            print ("\t".join([attr["Read"], attr["Name"]] + list(isomir.values()) +
+                             attr["Expression"].strip().split(",")), file=out_handle)
+
+##########################################################
+def isomiR_annotation(results, format, reference, mirtop_folder, counts=None):
+    """
+    Generates miRTop gff, counts and export results for a given sample.
+
+    :param results: Software results: folder (sRNAbench) or file (optimir, seqbuster).
+    :param format: Software format: srnabench, optimir or seqbuster.
+    :param reference: Object returned by :func:`XICRA.scripts.isomiR_annotation.load_reference`.
+    :param mirtop_folder: Folder containing gff, counts and export subfolders.
+    :param counts: Dictionary containing counts for collapsed sequences, if software results do not include them.
+
+    :returns: Absolute path for the counts file (mirtop.tsv).
+    """
+    (sample, lines) = read_results(results, format, reference)
+    if counts:
+        restore_counts(lines, counts)
+
+    gff_file = os.path.join(mirtop_folder, 'gff', 'mirtop.gff')
+    write_gff(lines, sample, format, reference, gff_file)
+
+    counts_file = os.path.join(mirtop_folder, 'counts', 'mirtop.tsv')
+    write_counts(lines, sample, counts_file)
+
+    export_file = os.path.join(mirtop_folder, 'export', 'mirtop_rawData.tsv')
+    write_export(lines, sample, reference, export_file)
+
+    return (counts_file)
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) < 7:
+        print ("\nUsage:")
+        print ("python3 %s results format hairpin_fasta miRNA_gff species outfolder\n" %os.path.realpath(__file__))
+        exit()
+
+    reference = load_reference(os.path.abspath(sys.argv[3]), os.path.abspath(sys.argv[4]), sys.argv[5], True)
+    outfolder = os.path.abspath(sys.argv[6])
+    for subfolder in ('gff', 'counts', 'export'):
+        functions.files_functions.create_subfolder(subfolder, outfolder)
+
+    counts_file = isomiR_annotation(os.path.abspath(sys.argv[1]), sys.argv[2].lower(), reference, outfolder)
+    print ("+ Counts file: " + counts_file)
+
+######
+if __name__== "__main__":
+    main()
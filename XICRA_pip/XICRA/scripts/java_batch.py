@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Runs a java software (e.g. sRNAbench, miraligner) for several samples within
+a single Java process.
+
+A small launcher (``XICRABatch.java``, executed as a single-file source program,
+Java 11 to 23) calls the main class of the software jar for each sample in a manifest.
+The jar is loaded by a new class loader for each sample: static fields of the software
+start from their initial values as in a new process, while the Java virtual machine is
+started (and JDK classes loaded and compiled) only once. Output for each sample is
+redirected to its log file and calls to ``System.exit`` are trapped, so the process
+continues with the next sample.
+
+As each sample uses a new class loader, only Java start-up is shared: software classes
+and the files they load (sRNAbench ``libs``, miraligner ``database``) are loaded again for
+each sample. Batch results have not been compared with individual runs of sRNAbench or
+miraligner yet (see ``devel/check_java_batch.py``), so this mode is experimental.
+
+Exit code for each sample is written to a status file as soon as it finishes:
+samples processed can be recorded if the process fails and the rest can be
+executed again.
+"""
+## useful imports
+import os
+import re
+import sys
+import zipfile
+import functools
+import subprocess
+from termcolor import colored
+
+## java launcher
+launcher_name = 'XICRABatch.java'
+launcher_code = r"""
+import java.io.*;
+import java.lang.reflect.*;
+import java.net.*;
+import java.nio.file.*;
+import java.util.*;
+
+public class XICRABatch {
+    static class ExitException extends SecurityException {
+        final int code;
+        ExitException(int code) { super("exit " + code); this.code = code; }
+    }
+
+    public static void main(String[] argv) throws Exception {
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                public void checkPermission(java.security.Permission perm) {}
+                public void checkPermission(java.security.Permission perm, Object context) {}
+                public void checkExit(int code) { throw new ExitException(code); }
+            });
+        } catch (UnsupportedOperationException e) {
+            System.err.println("XICRABatch: System.exit calls could not be trapped");
+            Runtime.getRuntime().halt(3);
+        }
+
+        URL[] jar = new URL[] { Paths.get(argv[0]).toUri().toURL() };
+        PrintStream out = System.out;
+        PrintStream err = System.err;
+
+        try (BufferedWriter status = Files.newBufferedWriter(Paths.get(argv[3]),
+                StandardOpenOption.CREATE, StandardOpenOption.APPEND)) {
+            for (String line : Files.readAllLines(Paths.get(argv[2]))) {
+                if (line.isEmpty()) continue;
+                String[] fields = line.split("\t");
+                String[] args = Arrays.copyOfRange(fields, 2, fields.length);
+                int code = 0;
+                // new class loader for each sample: no static state is shared between samples
+                try (URLClassLoader loader = new URLClassLoader(jar, ClassLoader.getPlatformClassLoader());
+                     PrintStream log = new PrintStream(new FileOutputStream(fields[1]), true)) {
+                    System.setOut(log);
+                    System.setErr(log);
+                    Thread.currentThread().setContextClassLoader(loader);
+                    Method method = Class.forName(argv[1], true, loader).getMethod("main", String[].class);
+                    method.invoke(null, (Object) args);
+                } catch (InvocationTargetException e) {
+                    if (e.getCause() instanceof ExitException) {
+                        code = ((ExitException) e.getCause()).code;
+                    } else {
+                        code = 1;
+                        e.getCause().printStackTrace(err);
+                    }
+                } catch (ExitException e) {
+                    code = e.code;
+                } finally {
+                    System.setOut(out);
+                    System.setErr(err);
+                }
+                status.write(fields[0] + "\t" + code + "\n");
+                status.flush();
+            }
+        }
+        Runtime.getRuntime().halt(0);
+    }
+}
+"""
+
+##########################################################
+@functools.lru_cache(maxsize=None)
+def java_version(java_exe):
+    """Returns major version for the java executable given or 0 if it could not be retrieved."""
+    try:
+        output = subprocess.run([java_exe, '-version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True).stdout
+    except OSError:
+        return (0)
+
+    hit = re.search(r'version "(\d+)(?:\.(\d+))?', output)
+    if not hit:
+        return (0)
+    if hit.group(1) == '1' and hit.group(2):
+        ## e.g. 1.8.0_252
+        return (int(hit.group(2)))
+    return (int(hit.group(1)))
+
+##########################################################
+def main_class(jar_file):
+    """Returns Main-Class for the jar file given."""
+    with zipfile.ZipFile(jar_file) as jar:
+        manifest = jar.read('META-INF/MANIFEST.MF').decode('utf-8', 'replace')
+    hit = re.search(r'^Main-Class:\s*(\S+)', manifest, re.MULTILINE)
+    if not hit:
+        raise ValueError("No Main-Class found in %s" %jar_file)
+    return (hit.group(1))
+
+##########################################################
+def batch_available(java_exe):
+    """
+    Java >= 11 is required to run the launcher as a single-file source program. Since Java 24
+    ``System.exit`` calls can not be trapped (JEP 486: SecurityManager permanently disabled).
+    """
+    return (11 <= java_version(java_exe) < 24)
+
+##########################################################
+def split_batches(sizes, batches):
+    """
+    Splits samples into batches of similar total size: larger samples first, each one
+    to the batch with the smallest size so far.
+
+    :param sizes: Dictionary containing sample names as keys and size (e.g. bytes) as values.
+    :param batches: Maximum number of batches.
+
+    :returns: List of lists of sample names (no empty batches).
+    """
+    batches = max(1, min(int(batches), len(sizes)))
+    totals = [0] * batches
+    names = [ [] for i in range(batches) ]
+    for name in sorted(sizes, key=lambda name: (-sizes[name], name)):
+        position = totals.index(min(totals))
+        names[position].append(name)
+        totals[position] += sizes[name]
+    return ([ batch for batch in names if batch ])
+
+##########################################################
+def run_batch(java_exe, jar_file, samples, batch_folder, Debug):
+    """
+    Runs the java software for all samples within a single process.
+
+    :param java_exe: Java executable.
+    :param jar_file: Software jar file.
+    :param samples: Dictionary containing sample names as keys and (arguments, log file) as values.
+    :param batch_folder: Folder to write launcher, manifest and status.
+    :param Debug: True/False for debugging messages.
+
+    :returns: Dictionary containing exit code for each sample processed. Samples missing were not processed.
+    """
+    launcher = os.path.join(batch_folder, launcher_name)
+    with open(launcher, 'w') as out_handle:
+        out_handle.write(launcher_code)
+
+    ## manifest: name, log file and arguments
+    manifest = os.path.join(batch_folder, 'manifest.txt')
+    status = os.path.join(batch_folder, 'status.txt')
+    with open(manifest, 'w') as out_handle:
+        for name, (args, logfile) in samples.items():
+            out_handle.write("\t".join([name, logfile] + [ str(a) for a in args ]) + "\n")
+    if os.path.isfile(status):
+        os.remove(status)
+
+    ## SecurityManager must be allowed explicitly since java 12
+    cmd = [java_exe]
+    if java_version(java_exe) >= 12:
+        cmd.append('-Djava.security.manager=allow')
+    cmd = cmd + [launcher, os.path.abspath(jar_file), main_class(jar_file), manifest, status]
+
+    ## debugging messages
+    if Debug:
+        print (colored("** DEBUG: java batch: " + " ".join(cmd), 'yellow'))
+
+    with open(os.path.join(batch_folder, 'batch.log'), 'w') as log_handle:
+        code = subprocess.call(cmd, stdout=log_handle, stderr=subprocess.STDOUT)
+    if code:
+        print (colored("** ERROR: java batch process for %s finished with code %s. See %s" %(
+            os.path.basename(jar_file), code, os.path.join(batch_folder, 'batch.log')), 'red'))
+
+    ## read status
+    results = {}
+    if os.path.isfile(status):
+        with open(status) as in_handle:
+            for line in in_handle:
+                (name, code) = line.rstrip('\n').split('\t')
+                results[name] = int(code)
+
+    return (results)
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) < 2:
+        print ("\nUsage:")
+        print ("python3 %s jar_file\n" %os.path.realpath(__file__))
+        exit()
+
+    print ("Main-Class: " + main_class(os.path.abspath(sys.argv[1])))
+
+######
+if __name__== "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Joins paired-end reads that overlap, as fastq-join does.
+
+Read pairs are processed in batches encoded as NumPy arrays. For each pair, R1 is
+compared with the reverse complement of R2 for every overlap length and the best
+overlap is retrieved using fastq-join rules:
+
+- overlap length from the minimum overlap (6) up to the length of the shortest read,
+- mismatches allowed: ``perc_diff * overlap / 100`` (integer division),
+- score: ``1000 * (mismatches^2 + 1) / overlap``, lower is better. Shortest overlap is kept on ties.
+
+Within the overlap, mismatches are resolved using the base with higher quality and
+quality is set to the difference between both qualities (minimum 3). Matching bases
+receive the highest quality. Read pairs without overlap are reported unjoined.
+
+Batches are sent to several processes, if desired, and results are written in input order.
+
+Results have not been compared with fastq-join output yet (see ``tests/test_join_reads.py``),
+so fastq-join remains the default (``--join_engine fastqjoin``) and this engine is opt-in.
+"""
+## useful imports
+import os
+import sys
+import math
+import numpy as np
+from termcolor import colored
+
+## import my modules
+from XICRA.scripts import compression
+from XICRA.scripts import scheduler
+
+## read pairs for each batch
+batch_pairs = 50000
+
+## complement for each base (ASCII)
+_complement = np.arange(256, dtype=np.uint8)
+for base, comp in zip(b'ACGTNacgtn', b'TGCANtgcan'):
+    _complement[base] = comp
+
+##########################################################
+def encode(lines):
+    """
+    Encodes lines (bytes) into a matrix (one row for each line, left aligned and padded with zeros).
+
+    :returns: Matrix and length for each line.
+    """
+    lengths = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+    width = max(1, int(lengths.max())) if len(lines) else 1
+    matrix = np.zeros((len(lines), width), dtype=np.uint8)
+    matrix[np.arange(width) < lengths[:, None]] = np.frombuffer(b''.join(lines), dtype=np.uint8)
+    return (matrix, lengths)
+
+##########################################################
+def reverse_complement(seq, qual, lengths):
+    """Returns reverse complement sequences and reverse qualities for the encoded reads given (left aligned)."""
+    idx = lengths[:, None] - 1 - np.arange(seq.shape[1])
+    valid = idx >= 0
+    idx = np.where(valid, idx, 0)
+    rc_seq = np.where(valid, _complement[np.take_along_axis(seq, idx, axis=1)], 0).astype(np.uint8)
+    rc_qual = np.where(valid, np.take_along_axis(qual, idx, axis=1), 0).astype(np.uint8)
+    return (rc_seq, rc_qual)
+
+##########################################################
+def best_overlap(seq1, len1, rc_seq, len2, perc_diff, min_overlap):
+    """
+    Returns the best overlap between the end of R1 and the start of reverse complement R2 for each pair (0: no overlap).
+    """
+    ## R1 right aligned: the last bases of each read in the same columns
+    width1 = seq1.shape[1]
+    right1 = np.zeros_like(seq1)
+    right1[np.arange(width1) >= width1 - len1[:, None]] = seq1[np.arange(width1) < len1[:, None]]
+
+    max_overlap = np.minimum(len1, len2)
+    best_score = np.full(len(len1), np.iinfo(np.int64).max, dtype=np.int64)
+    best = np.zeros(len(len1), dtype=np.int64)
+    for overlap in range(min_overlap, int(max_overlap.max(initial=0)) + 1):
+        diff = np.count_nonzero(right1[:, width1 - overlap:] != rc_seq[:, :overlap], axis=1)
+        score = (1000 * (diff * diff + 1)) // overlap
+        better = (max_overlap >= overlap) & (diff <= (perc_diff * overlap) // 100) & (score < best_score)
+        best_score[better] = score[better]
+        best[better] = overlap
+
+    return (best)
+
+##########################################################
+def merge(seq1, qual1, len1, rc_seq, rc_qual, len2, overlap):
+    """
+    Merges R1 and reverse complement R2 given the overlap for each pair.
+
+    :returns: Matrices with joined sequences and qualities and length for each joined read.
+    """
+    joined_len = len1 + len2 - overlap
+    cols = np.arange(max(1, int(joined_len.max(initial=0))))
+
+    ## R1 from the first base and reverse complement R2 after R1 non overlapping bases
+    in1 = cols < len1[:, None]
+    idx2 = cols - (len1 - overlap)[:, None]
+    in2 = (idx2 >= 0) & (idx2 < len2[:, None])
+    idx1 = np.minimum(cols, seq1.shape[1] - 1)[None, :].repeat(len(len1), axis=0)
+    idx2 = np.clip(idx2, 0, rc_seq.shape[1] - 1)
+
+    base1 = np.take_along_axis(seq1, idx1, axis=1)
+    base2 = np.take_along_axis(rc_seq, idx2, axis=1)
+    q1 = np.take_along_axis(qual1, idx1, axis=1).astype(np.int64)
+    q2 = np.take_along_axis(rc_qual, idx2, axis=1).astype(np.int64)
+
+    seq = np.where(in1, base1, base2)
+    qual = np.where(in1, q1, q2)
+
+    ## overlapping bases
+    both = in1 & in2
+    same = both & (base1 == base2)
+    qual = np.where(same, np.maximum(q1, q2), qual)
+
+    ## mismatches: base with higher quality
+    keep1 = both & (base1 != base2) & (q1 > q2)
+    keep2 = both & (base1 != base2) & (q1 <= q2)
+    qual = np.where(keep1, 33 + np.minimum(q1, np.maximum(q1 - q2, 3)), qual)
+    qual = np.where(keep2, 33 + np.minimum(q2, np.maximum(q2 - q1, 3)), qual)
+    seq = np.where(keep2, base2, seq)
+
+    return (seq.astype(np.uint8), qual.astype(np.uint8), joined_len)
+
+##########################################################
+def merge_batch(records1, records2, perc_diff, min_overlap=6):
+    """
+    Joins a batch of read pairs.
+
+    :param records1: List of lines (bytes) for R1 records (4 lines per record).
+    :param records2: List of lines (bytes) for R2 records.
+    :param perc_diff: Percentage difference allowed within the overlap.
+    :param min_overlap: Minimum overlap.
+
+    :returns: Joined, unjoined R1 and unjoined R2 records (bytes), number of pairs and list of joined lengths.
+    """
+    (seq1, len1) = encode([ line.rstrip(b'\r\n') for line in records1[1::4] ])
+    (qual1, _) = encode([ line.rstrip(b'\r\n') for line in records1[3::4] ])
+    (seq2, len2) = encode([ line.rstrip(b'\r\n') for line in records2[1::4] ])
+    (qual2, _) = encode([ line.rstrip(b'\r\n') for line in records2[3::4] ])
+    (rc_seq, rc_qual) = reverse_complement(seq2, qual2, len2)
+
+    overlap = best_overlap(seq1, len1, rc_seq, len2, perc_diff, min_overlap)
+    joined_rows = np.flatnonzero(overlap)
+    (seq, qual, joined_len) = merge(seq1[joined_rows], qual1[joined_rows], len1[joined_rows],
+                                    rc_seq[joined_rows], rc_qual[joined_rows], len2[joined_rows],
+                                    overlap[joined_rows])
+
+    joined = []
+    for count, row in enumerate(joined_rows.tolist()):
+        length = joined_len[count]
+        joined.extend([records1[4*row], seq[count, :length].tobytes(), b'\n',
+                       records1[4*row + 2], qual[count, :length].tobytes(), b'\n'])
+
+    unjoined1 = []
+    unjoined2 = []
+    for row in np.flatnonzero(overlap == 0).tolist():
+        unjoined1.extend(records1[4*row:4*row + 4])
+        unjoined2.extend(records2[4*row:4*row + 4])
+
+    return (b''.join(joined), b''.join(unjoined1), b''.join(unjoined2), len(len1), joined_len.tolist())
+
+##########################################################
+def read_records(handle, count):
+    """Returns lines for the next records (up to the number given) from a fastq file."""
+    lines = []
+    for i in range(4 * count):
+        line = handle.readline()
+        if not line:
+            break
+        lines.append(line)
+    return (lines)
+
+##########################################################
+def read_pairs(handle1, handle2):
+    """Yields batches of R1 and R2 records (lists of lines) from both files."""
+    while True:
+        records1 = read_records(handle1, batch_pairs)
+        records2 = read_records(handle2, batch_pairs)
+        if len(records1) != len(records2) or len(records1) % 4:
+            raise ValueError("Paired-end files contain a different number of reads or truncated reads")
+        if not records1:
+            return
+        yield (records1, records2)
+
+##########################################################
+def read_interleaved(handle):
+    """Yields batches of R1 and R2 records (lists of lines) from interleaved reads."""
+    while True:
+        records = read_records(handle, 2 * batch_pairs)
+        if len(records) % 8:
+            raise ValueError("Interleaved reads are not paired or truncated")
+        if not records:
+            return
+        records1 = []
+        records2 = []
+        for i in range(0, len(records), 8):
+            records1.extend(records[i:i + 4])
+            records2.extend(records[i + 4:i + 8])
+        yield (records1, records2)
+
+##########################################################
+def _merge_pair_batch(batch, perc_diff, min_overlap):
+    return (merge_batch(batch[0], batch[1], perc_diff, min_overlap))
+
+##########################################################
+def join_batches(batches, perc_diff, threads, min_overlap=6):
+    """
+    Joins batches of read pairs (see :func:`XICRA.scripts.join_reads.merge_batch`) using several processes, if desired.
+
+    Results are returned in the same order as batches (see :func:`XICRA.scripts.scheduler.process_map`).
+    """
+    return (scheduler.process_map(_merge_pair_batch, batches, threads, perc_diff, min_overlap))
+
+##########################################################
+class Stats:
+    """Number of reads and joined reads and length for joined reads."""
+    def __init__(self):
+        self.total = 0
+        self.joined = 0
+        self.sum_len = 0
+        self.sum_len2 = 0
+
+    def update(self, total, joined_len):
+        self.total += total
+        self.joined += len(joined_len)
+        self.sum_len += sum(joined_len)
+        self.sum_len2 += sum([ length * length for length in joined_len ])
+
+    def report(self):
+        """Returns report as fastq-join."""
+        mean = self.sum_len / self.joined if self.joined else 0
+        stdev = math.sqrt(max(0, self.sum_len2 / self.joined - mean * mean)) if self.joined else 0
+        return ("Total reads: %s\nTotal joined: %s\nAverage join len: %.2f\nStdev join len: %.2f\n" %(
+            self.total, self.joined, mean, stdev))
+
+##########################################################
+def join(reads, joined_file, unjoined_files, logfile, perc_diff, threads, Debug, min_overlap=6):
+    """
+    Joins paired-end reads.
+
+    :param reads: R1 and R2 files (plain, gzip or zstd).
+    :param joined_file: File to write joined reads, compressed according to its extension.
+    :param unjoined_files: Files to write unjoined R1 and R2 reads.
+    :param logfile: File to write report.
+    :param perc_diff: Percentage difference allowed within the overlap.
+    :param threads: Number of processes.
+    :param Debug: True/False for debugging messages.
+    :param min_overlap: Minimum overlap.
+
+    :returns: True/False if succeeded.
+    """
+    ## debugging messages
+    if Debug:
+        print (colored("** DEBUG: join reads %s (perc_diff: %s; threads: %s)" %(" ".join(reads), perc_diff, threads), 'yellow'))
+
+    stats = Stats()
+    try:
+        with compression.open_read(reads[0], binary=True) as handle1, \
+                compression.open_read(reads[1], binary=True) as handle2, \
+                compression.open_write(joined_file, threads, binary=True) as out_joined, \
+                compression.open_write(unjoined_files[0], binary=True) as out_unjoined1, \
+                compression.open_write(unjoined_files[1], binary=True) as out_unjoined2:
+            for (joined, unjoined1, unjoined2, total, joined_len) in join_batches(read_pairs(handle1, handle2),
+                                                                                  perc_diff, threads, min_overlap):
+                out_joined.write(joined)
+                out_unjoined1.write(unjoined1)
+                out_unjoined2.write(unjoined2)
+                stats.update(total, joined_len)
+    except (OSError, ValueError) as exc:
+        print (colored("** ERROR: reads could not be joined (%s): %s" %(" ".join(reads), exc), 'red'))
+        return (False)
+
+    with open(logfile, 'w') as log_handle:
+        log_handle.write(stats.report())
+    return (True)
+
+##########################################################
+def join_stream(in_handle, out_handle, perc_diff, threads, min_overlap=6):
+    """
+    Joins interleaved paired-end reads from a binary stream and writes joined reads. Unjoined reads are discarded.
+
+    :returns: Report as fastq-join.
+    """
+    stats = Stats()
+    for (joined, unjoined1, unjoined2, total, joined_len) in join_batches(read_interleaved(in_handle),
+                                                                          perc_diff, threads, min_overlap):
+        out_handle.write(joined)
+        stats.update(total, joined_len)
+    return (stats.report())
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) < 4:
+        print ("\nUsage:")
+        print ("python3 %s reads_R1 reads_R2 out_prefix [perc_diff] [threads]\n" %os.path.realpath(__file__))
+        exit()
+
+    out_prefix = os.path.abspath(sys.argv[3])
+    perc_diff = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+    threads = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+    join([ os.path.abspath(f) for f in sys.argv[1:3] ], out_prefix + '_joined.fastq',
+         [out_prefix + '_unjoin_R1.fastq', out_prefix + '_unjoin_R2.fastq'], out_prefix + '.log',
+         perc_diff, threads, True)
+
+######
+if __name__== "__main__":
+    main()
@@ -11,9 +11,17 @@ import re
 import sys
 from sys import argv
 import subprocess
+import json
+import fcntl
+import socket
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from termcolor import colored
 
 from HCGB.functions import system_call_functions
 from HCGB.functions import files_functions
+from XICRA.scripts import compression
 
 ############################################################
 def create_genomeDir(folder, STAR_exe, num_threads, fasta_file, limitGenomeGenerateRAM):
@@ -58,6 +66,143 @@ def remove_Genome(STAR_exe, genomeDir, folder, num_threads):
     remove_code = system_call_functions.system_call(cmd_RM, False, True)
     return (remove_code)
 
+############################################################
+def _genome_state_files(genomeDir):
+    """
+    Returns lock and users files for the genomeDir given.
+    
+    Files are stored in the node shared memory filesystem (or temporary folder), as
+    genome residency is node specific even if genomeDir is shared by several nodes.
+    """
+    state_folder = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    tag = hashlib.sha1(os.path.realpath(genomeDir).encode()).hexdigest()[:16]
+    state_file = os.path.join(state_folder, 'XICRA_STAR_' + tag)
+    return (state_file + '.lock', state_file + '.json')
+
+############################################################
+@contextmanager
+def _genome_lock(genomeDir):
+    """Exclusive lock for the genomeDir state while loading or releasing the genome."""
+    (lock_file, users_file) = _genome_state_files(genomeDir)
+    with open(lock_file, 'a') as lock_handle:
+        fcntl.flock(lock_handle, fcntl.LOCK_EX)
+        try:
+            yield (users_file)
+        finally:
+            fcntl.flock(lock_handle, fcntl.LOCK_UN)
+
+############################################################
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return (False)
+    except PermissionError:
+        ## process exists but belongs to other user
+        return (True)
+    return (True)
+
+############################################################
+def _read_users(users_file):
+    """Returns dictionary with genome state: loaded flag and list of processes attached."""
+    if not os.path.isfile(users_file):
+        return ({'loaded': False, 'users': []})
+    try:
+        with open(users_file) as in_handle:
+            return (json.load(in_handle))
+    except ValueError:
+        return ({'loaded': True, 'users': []})
+
+############################################################
+def _write_users(users_file, state):
+    with open(users_file + '.tmp', 'w') as out_handle:
+        json.dump(state, out_handle, indent=4)
+    os.replace(users_file + '.tmp', users_file)
+
+############################################################
+def attach_Genome(folder, STAR_exe, genomeDir, num_threads, Debug):
+    """
+    Attaches current process to the genome loaded in shared memory, loading it if necessary.
+    
+    A reference count (processes using the genome) and a lock file are kept for each genomeDir
+    so several XICRA runs on the same node share a unique copy of the genome. Processes no longer 
+    alive (e.g. a run interrupted) are discarded and, if none alive is attached, any orphaned 
+    shared memory segment is removed before loading the genome again.
+    
+    :param folder: Path for STAR load/remove output files.
+    :param STAR_exe: Executable path for STAR binary
+    :param genomeDir: STAR genomeDir.
+    :param num_threads: Number of threads to use.
+    :param Debug: True/False for debugging messages.
+    
+    :returns: True/False if genome is available in shared memory.
+    """
+    hostname = socket.gethostname()
+    with _genome_lock(genomeDir) as users_file:
+        state = _read_users(users_file)
+        
+        ## discard processes no longer alive
+        alive = [ user for user in state['users'] if _pid_alive(user['pid']) ]
+        orphans = len(state['users']) - len(alive)
+        
+        ## debug message
+        if (Debug):
+            print (colored("**DEBUG: genome state for %s **" %genomeDir, 'yellow'))
+            print (state)
+        
+        if alive and state['loaded']:
+            print ('\t+ Genome already loaded in memory by %s process(es). Attaching...' %len(alive))
+        else:
+            if orphans or state['loaded']:
+                print (colored('\t** ATTENTION: Orphaned genome in memory (%s process(es) not alive). Removing it...' %orphans, 'yellow'))
+            
+            ## remove previous reference genome from memory, if any
+            remove_Genome(STAR_exe, genomeDir, folder, num_threads)
+            
+            ## load reference genome
+            if not load_Genome(folder, STAR_exe, genomeDir, num_threads):
+                print (colored("** ERROR: Genome could not be loaded in memory for STAR mapping **", 'red'))
+                _write_users(users_file, {'loaded': False, 'users': []})
+                return (False)
+            
+            alive = []
+        
+        alive.append({'pid': os.getpid(), 'host': hostname, 'folder': folder})
+        _write_users(users_file, {'loaded': True, 'genomeDir': genomeDir, 'users': alive})
+    
+    return (True)
+
+############################################################
+def release_Genome(folder, STAR_exe, genomeDir, num_threads, Debug):
+    """
+    Detaches current process from the genome in shared memory. Last process attached removes it.
+    
+    See :func:`XICRA.scripts.mapReads.attach_Genome` for details.
+    
+    :returns: True/False if genome was removed from memory.
+    """
+    with _genome_lock(genomeDir) as users_file:
+        state = _read_users(users_file)
+        alive = [ user for user in state['users'] 
+                 if user['pid'] != os.getpid() and _pid_alive(user['pid']) ]
+        
+        ## debug message
+        if (Debug):
+            print (colored("**DEBUG: genome state for %s **" %genomeDir, 'yellow'))
+            print (state)
+        
+        if alive:
+            print ('\t+ Genome kept in memory for %s other process(es).' %len(alive))
+            state['users'] = alive
+            _write_users(users_file, state)
+            return (False)
+        
+        remove_Genome(STAR_exe, genomeDir, folder, num_threads)
+        if os.path.isfile(users_file):
+            os.remove(users_file)
+    
+    return (True)
+
 ############################################################
 def mapReads(option, reads, folder, name, STAR_exe, genomeDir, limitRAM_option, num_threads, Debug):
     """
@@ -114,6 +259,11 @@ def mapReads(option, reads, folder, name, STAR_exe, genomeDir, limitRAM_option,
     
     ## ReadFiles
     cmd = cmd + " --readFilesIn %s " %jread
+    
+    ## compressed reads (e.g. --intermediate_compression)
+    read_command = compression.read_command(reads[0])
+    if read_command:
+        cmd = cmd + "--readFilesCommand %s " %read_command
 
     ## logfile & errfile
     logfile = os.path.join(folder, 'STAR.log')
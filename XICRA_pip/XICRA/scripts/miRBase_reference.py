@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Persistent miRBase reference store.
+
+miRBase files (hairpin, mature, str and species gff3) are downloaded once,
+filtered for the species of interest and stored by miRBase release and species:
+
+    database/miRBase/<release>/<species>/
+
+Hairpin sequences and mature coordinates are also stored pre-parsed (numpy
+arrays loaded using memory mapping and a json index) so later runs do not need
+to parse fasta or gff3 files. A manifest contains checksums for every file
+stored to check integrity before usage: files are only checksummed again if their
+size or modification time changed. Runs without network access reuse the
+latest release stored for the species.
+"""
+## useful imports
+import os
+import sys
+import re
+import json
+import shutil
+import hashlib
+import argparse
+from collections import defaultdict
+from collections.abc import Mapping
+import numpy as np
+from termcolor import colored
+from mirtop.mirna import mapper
+
+## import my modules
+from HCGB import functions
+
+## miRBase ftp site
+miRBase_ftp = "ftp://mirbase.org/pub/mirbase/"
+
+## files stored for each release & species
+manifest_name = 'manifest.json'
+index_name = 'index.json'
+seq_name = 'hairpin.seq.npy'
+offsets_name = 'hairpin.offsets.npy'
+
+##########################################################
+def _checksum(file_given):
+    """Returns sha256 checksum for file given."""
+    sha = hashlib.sha256()
+    with open(file_given, 'rb') as in_handle:
+        for chunk in iter(lambda: in_handle.read(1024*1024), b''):
+            sha.update(chunk)
+    return (sha.hexdigest())
+
+##########################################################
+def _stat(file_given):
+    """Returns size and modification time (ns) for file given."""
+    stat = os.stat(file_given)
+    return ([stat.st_size, stat.st_mtime_ns])
+
+##########################################################
+def _write_manifest(store_folder, manifest):
+    manifest_file = os.path.join(store_folder, manifest_name)
+    with open(manifest_file + '.tmp', 'w') as out_handle:
+        json.dump(manifest, out_handle, indent=4)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+##########################################################
+def _get_release(gff_file):
+    """
+    Retrieves miRBase release from gff3 header e.g. # microRNAs: miRBase v22.1
+
+    Returns release (e.g. 22.1) or None if not found.
+    """
+    with open(gff_file) as in_handle:
+        for line in in_handle:
+            if not line.startswith("#"):
+                break
+            hits = re.search(r"miRBase\s*v?([0-9][0-9\.]*)", line)
+            if hits:
+                return (hits.group(1).rstrip('.'))
+    return (None)
+
+##########################################################
+def _filter_fasta(fasta_file, out_file, species):
+    """Writes fasta (or miRNA.str) entries whose name starts with species tag."""
+    keep = False
+    with open(fasta_file) as in_handle, open(out_file, 'w') as out_handle:
+        for line in in_handle:
+            if line.startswith('>'):
+                keep = line[1:].startswith(species + '-')
+            if keep:
+                out_handle.write(line)
+
+##########################################################
+def _parse_precursors(hairpin_file):
+    """
+    Parses hairpin sequences as mirtop does (U replaced by T and each
+    precursor padded with 12 N).
+
+    Returns list of names and list of sequences.
+    """
+    names = []
+    seqs = []
+    with open(hairpin_file) as in_handle:
+        for line in in_handle:
+            if line.startswith(">"):
+                names.append(line.strip().replace(">", " ").split()[0])
+                seqs.append([])
+            elif names:
+                seqs[-1].append(line.strip().replace("U", "T"))
+    seqs = [ "".join(s) + "NNNNNNNNNNNN" for s in seqs ]
+    return (names, seqs)
+
+##########################################################
+def _download_release(download_folder, release, species, Debug):
+    """Downloads raw miRBase files for the release given. Returns dictionary of files."""
+
+    os.makedirs(download_folder, exist_ok=True)
+
+    raw_files = {}
+    raw_files['miRNA_gff'] = functions.main_functions.urllib_request(download_folder,
+                                        miRBase_ftp + release + "/genomes/" + species + ".gff3", species + ".gff3", Debug)
+    raw_files['hairpinFasta'] = functions.main_functions.urllib_request(download_folder,
+                                        miRBase_ftp + release + "/hairpin.fa.gz", "hairpin.fa.gz", Debug)
+    raw_files['matureFasta'] = functions.main_functions.urllib_request(download_folder,
+                                        miRBase_ftp + release + "/mature.fa.gz", "mature.fa.gz", Debug)
+    raw_files['miRBase_str'] = functions.main_functions.urllib_request(download_folder,
+                                        miRBase_ftp + release + "/miRNA.str.gz", "miRNA.str.gz", Debug)
+    return (raw_files)
+
+##########################################################
+def create_store(store_folder, raw_files, release, species, Debug):
+    """
+    Filters raw miRBase files for the species and creates pre-parsed indexes.
+
+    :param store_folder: Absolute path for database/miRBase/<release>/<species>
+    :param raw_files: Dictionary containing miRNA_gff, hairpinFasta, matureFasta and miRBase_str files.
+    :param release: miRBase release.
+    :param species: Species tag ID.
+    :param Debug: True/False for debugging messages.
+    """
+    os.makedirs(store_folder, exist_ok=True)
+
+    files_stored = {'miRNA_gff': species + '.gff3', 'hairpinFasta': 'hairpin.fa',
+                    'matureFasta': 'mature.fa', 'miRBase_str': 'miRNA.str'}
+
+    ## species filtered files
+    shutil.copy(raw_files['miRNA_gff'], os.path.join(store_folder, files_stored['miRNA_gff']))
+    for tag in ('hairpinFasta', 'matureFasta', 'miRBase_str'):
+        _filter_fasta(raw_files[tag], os.path.join(store_folder, files_stored[tag]), species)
+
+    ## hairpin sequences: concatenated bytes + offsets
+    (names, seqs) = _parse_precursors(os.path.join(store_folder, files_stored['hairpinFasta']))
+    offsets = np.zeros(len(seqs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(s) for s in seqs])
+    np.save(os.path.join(store_folder, offsets_name), offsets)
+    np.save(os.path.join(store_folder, seq_name), np.frombuffer("".join(seqs).encode('ascii'), dtype=np.uint8))
+
+    ## mature coordinates relative to precursor (as mirtop)
+    gff_file = os.path.join(store_folder, files_stored['miRNA_gff'])
+    database = mapper.guess_database(argparse.Namespace(gtf=gff_file, database=None))
+    matures = mapper.read_gtf_to_precursor(gff_file, database)
+    with open(os.path.join(store_folder, index_name), 'w') as out_handle:
+        json.dump({'database': database, 'names': names, 'matures': matures}, out_handle)
+
+    ## manifest with checksums, size and modification time
+    checksums = {}
+    stats = {}
+    for file_stored in list(files_stored.values()) + [offsets_name, seq_name, index_name]:
+        checksums[file_stored] = _checksum(os.path.join(store_folder, file_stored))
+        stats[file_stored] = _stat(os.path.join(store_folder, file_stored))
+
+    manifest = {'release': release, 'species': species, 'files': files_stored, 'checksums': checksums,
+                'stats': stats, 'date': functions.time_functions.create_human_timestamp()}
+    _write_manifest(store_folder, manifest)
+
+    if Debug:
+        print (colored("** DEBUG: miRBase reference stored in " + store_folder, 'yellow'))
+        print (manifest)
+
+    return (manifest)
+
+##########################################################
+def check_store(store_folder, Debug):
+    """
+    Checks integrity of files stored using checksums in manifest.
+
+    Files whose size and modification time are the same as recorded in the
+    manifest are not checksummed again. If only the modification time changed
+    and the checksum is correct, the manifest is updated.
+
+    :returns: Manifest dictionary if all files are correct, None otherwise.
+    """
+    manifest_file = os.path.join(store_folder, manifest_name)
+    if not functions.files_functions.is_non_zero_file(manifest_file):
+        return (None)
+
+    with open(manifest_file) as in_handle:
+        manifest = json.load(in_handle)
+
+    stats = manifest.setdefault('stats', {})
+    updated = False
+    for file_stored, checksum in manifest['checksums'].items():
+        file_path = os.path.join(store_folder, file_stored)
+        if not os.path.isfile(file_path):
+            print (colored("\t** ATTENTION: miRBase reference file %s is missing" %file_path, 'yellow'))
+            return (None)
+
+        stat = _stat(file_path)
+        if stats.get(file_stored) == stat:
+            continue
+        if _checksum(file_path) != checksum:
+            print (colored("\t** ATTENTION: miRBase reference file %s is corrupted" %file_path, 'yellow'))
+            return (None)
+        stats[file_stored] = stat
+        updated = True
+
+    ## store might be read-only: checksums are computed again next time
+    if updated:
+        try:
+            _write_manifest(store_folder, manifest)
+        except OSError:
+            pass
+
+    if Debug:
+        print (colored("** DEBUG: miRBase reference checked: " + store_folder, 'yellow'))
+
+    return (manifest)
+
+##########################################################
+def _latest_release(database, species):
+    """Returns folder for the latest miRBase release stored for the species, if any."""
+    releases_folder = os.path.join(database, 'miRBase')
+    if not os.path.isdir(releases_folder):
+        return (None)
+
+    releases = []
+    for release in os.listdir(releases_folder):
+        if os.path.isfile(os.path.join(releases_folder, release, species, manifest_name)):
+            releases.append(release)
+    if not releases:
+        return (None)
+
+    ## sort numerically: 22.1 > 21 > 9.2
+    releases.sort(key=lambda r: [ int(x) if x.isdigit() else 0 for x in r.split('.') ])
+    return (os.path.join(releases_folder, releases[-1], species))
+
+##########################################################
+def get_reference(database, species, release, Debug):
+    """
+    Returns species folder in the miRBase reference store, downloading and
+    creating it if necessary.
+
+    :param database: Absolute path to store miRNA annotation files.
+    :param species: Species tag ID (e.g. hsa).
+    :param release: miRBase release (e.g. 22.1) or CURRENT.
+    :param Debug: True/False for debugging messages.
+
+    :returns: Absolute path for the folder and dictionary with files: miRNA_gff, hairpinFasta, matureFasta, miRBase_str
+    """
+    if release != 'CURRENT':
+        store_folder = os.path.join(database, 'miRBase', release, species)
+        manifest = check_store(store_folder, Debug)
+        if manifest:
+            print ("+ miRBase release %s for %s available in: %s" %(release, species, store_folder))
+            return (store_folder, _files_stored(store_folder, manifest))
+
+    ## download
+    download_folder = os.path.join(database, 'miRBase', 'download', release)
+    try:
+        print ("+ Download miRBase release %s files" %release)
+        raw_files = _download_release(download_folder, release, species, Debug)
+    except (Exception, SystemExit) as exc:
+        ## no network: use latest release stored
+        print (colored("\t** ATTENTION: miRBase files could not be downloaded: %s" %exc, 'yellow'))
+        store_folder = _latest_release(database, species) if release == 'CURRENT' else None
+        manifest = check_store(store_folder, Debug) if store_folder else None
+        if not manifest:
+            print (colored("** ERROR: No miRBase reference available for %s. Provide files or network access." %species, 'red'))
+            exit()
+        print ("+ Using miRBase release %s stored in: %s" %(manifest['release'], store_folder))
+        return (store_folder, _files_stored(store_folder, manifest))
+
+    ## release name
+    if release == 'CURRENT':
+        release = _get_release(raw_files['miRNA_gff']) or 'CURRENT'
+
+    store_folder = os.path.join(database, 'miRBase', release, species)
+    manifest = check_store(store_folder, Debug)
+    if not manifest:
+        print ("+ Create miRBase reference for release %s and %s in: %s" %(release, species, store_folder))
+        manifest = create_store(store_folder, raw_files, release, species, Debug)
+
+    return (store_folder, _files_stored(store_folder, manifest))
+
+##########################################################
+def _files_stored(store_folder, manifest):
+    return ({ tag: os.path.join(store_folder, file_name) for tag, file_name in manifest['files'].items() })
+
+##########################################################
+class Precursors(Mapping):
+    """
+    Hairpin sequences stored, retrieved from the memory mapped array when requested.
+
+    Each sequence is decoded the first time it is used and kept for later lookups. As
+    for mirtop (defaultdict), an empty sequence is returned for precursors not stored.
+    """
+    def __init__(self, names, seqs, offsets):
+        self._index = { name: i for i, name in enumerate(names) }
+        self._seqs = seqs
+        self._offsets = offsets
+        self._decoded = {}
+
+    def __getitem__(self, name):
+        seq = self._decoded.get(name)
+        if seq is None:
+            i = self._index.get(name)
+            if i is None:
+                return ('')
+            seq = self._seqs[self._offsets[i]:self._offsets[i+1]].tobytes().decode('ascii')
+            self._decoded[name] = seq
+        return (seq)
+
+    def __contains__(self, name):
+        return (name in self._index)
+
+    def __iter__(self):
+        return (iter(self._index))
+
+    def __len__(self):
+        return (len(self._index))
+
+##########################################################
+def load_index(store_folder):
+    """
+    Loads pre-parsed miRBase information from the reference store.
+
+    Hairpin sequences are memory mapped and only decoded for precursors used
+    (see :class:`Precursors`). The information returned has the same structure as mirtop parsers (:func:`mirtop.mirna.fasta.read_precursor`
+    and :func:`mirtop.mirna.mapper.read_gtf_to_precursor`).
+
+    :returns: database name, precursors dictionary and matures dictionary.
+    """
+    offsets = np.load(os.path.join(store_folder, offsets_name)).tolist()
+    seqs = np.load(os.path.join(store_folder, seq_name), mmap_mode='r')
+    with open(os.path.join(store_folder, index_name)) as in_handle:
+        index = json.load(in_handle)
+
+    ## precursor sequences
+    precursors = Precursors(index['names'], seqs, offsets)
+
+    ## mature coordinates
+    matures = defaultdict(dict)
+    matures.update(index['matures'])
+
+    return (index['database'], precursors, matures)
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) < 4:
+        print ("\nUsage:")
+        print ("python3 %s database species release[CURRENT]\n" %os.path.realpath(__file__))
+        exit()
+
+    (store_folder, files_stored) = get_reference(os.path.abspath(sys.argv[1]), sys.argv[2], sys.argv[3], True)
+    print (files_stored)
+
+######
+if __name__== "__main__":
+    main()
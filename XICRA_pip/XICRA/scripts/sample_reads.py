@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Subsampling of fastq files for a quick quality check.
+
+Two strategies are used to draw reads uniformly from each file:
+
+- random offsets: for plain and BGZF compressed files (e.g. generated by ``bgzip``), reads
+  are retrieved seeking random positions of the file. Only the sampled reads are read, and
+  the total number of reads is estimated from the mean size of the reads sampled.
+- reservoir sampling: for other compressed files (gzip, zstd), files are read once keeping
+  a reservoir of reads (Algorithm L: reads not sampled are skipped without parsing).
+
+Reservoir sampling is also used for small files (reads sampled would cover a large fraction
+of the file), as all reads are counted within a single pass.
+"""
+## useful imports
+import os
+import io
+import sys
+import math
+import zlib
+import random
+import struct
+import itertools
+import collections
+
+## import my modules
+from XICRA.scripts import compression
+from XICRA.scripts import fastq_qc
+
+## random offsets only if sampled reads are less than this fraction of the file
+offsets_fraction = 0.1
+
+## compressed data read to find BGZF blocks: up to 64 kb each
+bgzf_window = 3*65536
+
+## file to record sampling details within each output folder
+summary_file = 'sampling.txt'
+
+##########################################################
+def _uniform(rng):
+    """Returns a random number within the open interval (0, 1)."""
+    value = rng.random()
+    while value == 0.0:
+        value = rng.random()
+    return (value)
+
+##########################################################
+def _read_record(handle):
+    """Returns next fastq record (4 lines) or None if finished."""
+    record = [ handle.readline() for i in range(4) ]
+    if not record[3]:
+        return (None)
+    return (record)
+
+##########################################################
+def reservoir(handle, n, rng):
+    """
+    Draws a uniform sample of reads from the stream given within a single pass (Algorithm L).
+
+    :param handle: Binary stream containing fastq records.
+    :param n: Number of reads to sample.
+    :param rng: random.Random instance.
+
+    :returns: Tuple containing list of records sampled and total number of reads.
+    """
+    sample = []
+    while len(sample) < n:
+        record = _read_record(handle)
+        if not record:
+            return (sample, len(sample))
+        sample.append(record)
+
+    total = n
+    weight = math.exp(math.log(_uniform(rng)) / n)
+    while True:
+        ## skip records not sampled: lines are counted while consumed
+        skip = int(math.log(_uniform(rng)) / math.log(1 - weight))
+        counter = itertools.count()
+        collections.deque(zip(itertools.islice(handle, 4*skip), counter), maxlen=0)
+        lines = next(counter)
+        total += lines // 4
+        if lines < 4*skip:
+            break
+
+        record = _read_record(handle)
+        if not record:
+            break
+        total += 1
+        sample[rng.randrange(n)] = record
+        weight *= math.exp(math.log(_uniform(rng)) / n)
+
+    return (sample, total)
+
+##########################################################
+def _sync_record(handle, offset):
+    """
+    Returns the first complete fastq record after the offset given within the stream.
+
+    Records are identified as four lines: header (@), sequence, separator (+) and
+    quality of the same length as the sequence.
+
+    :returns: Tuple containing offset and record or (None, None) if not found.
+    """
+    handle.seek(offset)
+    if offset:
+        ## discard partial line
+        offset += len(handle.readline())
+
+    lines = []
+    starts = []
+    while True:
+        while len(lines) < 4:
+            starts.append(offset)
+            line = handle.readline()
+            if not line.endswith(b'\n'):
+                return (None, None)
+            lines.append(line)
+            offset += len(line)
+
+        if lines[0].startswith(b'@') and lines[2].startswith(b'+') and len(lines[1]) == len(lines[3]):
+            return (starts[0], lines)
+        lines.pop(0)
+        starts.pop(0)
+
+##########################################################
+def random_offsets(handle, size, n, rng):
+    """
+    Samples reads seeking random offsets of a plain fastq file.
+
+    Each read is sampled with a probability proportional to the size of the previous
+    read: uniform for reads of similar length.
+
+    :returns: Tuple containing list of records sampled and estimated number of reads.
+    """
+    records = {}
+    for offset in sorted([ rng.randrange(size) for i in range(n) ]):
+        (start, record) = _sync_record(handle, offset)
+        if record:
+            records[start] = record
+
+    sample = [ records[start] for start in sorted(records) ]
+    return (sample, _estimate(sample, size))
+
+##########################################################
+def _estimate(sample, size):
+    """Returns number of reads estimated for the uncompressed size given."""
+    if not sample:
+        return (0)
+    mean_size = sum([ len(line) for record in sample for line in record ]) / len(sample)
+    return (max(len(sample), int(round(size / mean_size))))
+
+##########################################################
+def is_bgzf(fastq_file):
+    """Returns True if the file is compressed using BGZF (blocked gzip)."""
+    with open(fastq_file, 'rb') as handle:
+        header = handle.read(18)
+    return (len(header) == 18 and header[:4] == b'\x1f\x8b\x08\x04' and header[12:16] == b'BC\x02\x00')
+
+##########################################################
+def _bgzf_blocks(handle, offset, count=2):
+    """
+    Returns consecutive BGZF blocks (up to count) starting at or after the offset given.
+
+    :returns: List of tuples containing block offset, compressed size and uncompressed data.
+    """
+    handle.seek(offset)
+    data = handle.read(bgzf_window)
+    blocks = []
+    position = 0
+    while len(blocks) < count:
+        position = data.find(b'\x1f\x8b\x08\x04', position)
+        if position < 0 or position + 18 > len(data):
+            break
+        if data[position + 12:position + 16] == b'BC\x02\x00':
+            block_size = struct.unpack('<H', data[position + 16:position + 18])[0] + 1
+            block = data[position:position + block_size]
+            if len(block) == block_size:
+                try:
+                    blocks.append((offset + position, block_size, zlib.decompress(block[18:-8], -15)))
+                    position += block_size
+                    continue
+                except zlib.error:
+                    pass
+            if blocks:
+                break
+        elif blocks:
+            break
+        position += 1
+    return (blocks)
+
+##########################################################
+def random_offsets_bgzf(handle, size, n, rng):
+    """
+    Samples reads seeking random offsets of a BGZF compressed fastq file.
+
+    A random block is decompressed (together with the following one, for reads spanning two
+    blocks) and a read is retrieved from a random position within the block.
+
+    :returns: Tuple containing list of records sampled and estimated number of reads.
+    """
+    records = {}
+    compressed = 0
+    uncompressed = 0
+    blocks = []
+    for offset in sorted([ rng.randrange(size) for i in range(n) ]):
+        ## offsets are sorted: first block after the offset is the previous one, if not passed
+        if not blocks or offset > blocks[0][0]:
+            blocks = _bgzf_blocks(handle, offset)
+            if not blocks or not blocks[0][2]:
+                continue
+            compressed += blocks[0][1]
+            uncompressed += len(blocks[0][2])
+            stream = io.BytesIO(b''.join([ block[2] for block in blocks ]))
+        (start, block_size, data) = blocks[0]
+        if not data:
+            continue
+
+        (position, record) = _sync_record(stream, rng.randrange(len(data)))
+        if record and position < len(data):
+            records[(start, position)] = record
+
+    sample = [ records[key] for key in sorted(records) ]
+    if not compressed:
+        return (sample, len(sample))
+    return (sample, _estimate(sample, size * uncompressed / compressed))
+
+##########################################################
+def _first_record_size(handle):
+    """Returns size of the first record of the stream or None if empty."""
+    record = _read_record(handle)
+    if not record:
+        return (None)
+    return (sum([ len(line) for line in record ]))
+
+##########################################################
+def subsample(fastq_file, n, out_file, seed=1):
+    """
+    Writes a uniform sample of reads of the fastq file given (plain, gzip, BGZF or zstd).
+
+    :param fastq_file: Fastq file.
+    :param n: Number of reads to sample.
+    :param out_file: Plain fastq file to write reads sampled.
+    :param seed: Seed for random numbers: same reads are sampled for the same file.
+
+    :returns: Dictionary containing file, method, sampled and total reads (estimated, if random offsets).
+    """
+    rng = random.Random(seed)
+    size = os.path.getsize(fastq_file)
+    compression_type = compression.compression_type(fastq_file)
+    method = 'reservoir'
+
+    if compression_type == 'none' or (compression_type == 'gzip' and is_bgzf(fastq_file)):
+        with open(fastq_file, 'rb') as handle:
+            if compression_type == 'none':
+                record_size = _first_record_size(handle)
+                uncompressed = size
+                sampler = random_offsets
+            else:
+                (start, block_size, data) = (_bgzf_blocks(handle, 0, 1) or [(0, 1, b'')])[0]
+                record_size = _first_record_size(io.BytesIO(data))
+                uncompressed = size * len(data) / block_size
+                sampler = random_offsets_bgzf
+
+            if record_size and n * record_size < offsets_fraction * uncompressed:
+                method = 'random offsets'
+                (sample, total) = sampler(handle, size, n, rng)
+
+    if method == 'reservoir':
+        with compression.open_read(fastq_file, binary=True) as handle:
+            (sample, total) = reservoir(handle, n, rng)
+
+    with open(out_file, 'wb') as out_handle:
+        for record in sample:
+            out_handle.writelines(record)
+
+    return ({'file': os.path.basename(fastq_file), 'method': method, 'sampled': len(sample), 'total': total})
+
+##########################################################
+def write_summary(sampling, folder):
+    """Writes sampling details (as returned by :func:`subsample`) for each file within the folder given."""
+    with open(os.path.join(folder, summary_file), 'w') as out_handle:
+        out_handle.write('file\tsampled\ttotal\tfraction\tmethod\n')
+        for details in sampling:
+            fraction = details['sampled'] / details['total'] if details['total'] else 1
+            out_handle.write('%s\t%s\t%s\t%.6f\t%s\n' %(details['file'], details['sampled'], details['total'],
+                                                         fraction, details['method']))
+
+##########################################################
+def read_summary(folder):
+    """Returns sampling details for each file within the folder given (empty list if not sampled)."""
+    summary = os.path.join(folder, summary_file)
+    if not os.path.isfile(summary):
+        return ([])
+
+    with open(summary) as in_handle:
+        fields = in_handle.readline().rstrip('\n').split('\t')
+        return ([ dict(zip(fields, line.rstrip('\n').split('\t'))) for line in in_handle ])
+
+##########################################################
+def report_table(folders, out_file):
+    """
+    Writes sampling details for the folders given as a MultiQC custom content table.
+
+    Sample names are set as FastQC reports (see :func:`XICRA.scripts.fastq_qc.sample_name`).
+
+    :returns: Number of files sampled.
+    """
+    sampling = [ details for folder in sorted(folders) for details in read_summary(folder) ]
+    if not sampling:
+        return (0)
+
+    with open(out_file, 'w') as out_handle:
+        out_handle.write("# id: 'qc_sampling'\n")
+        out_handle.write("# section_name: 'Read sampling'\n")
+        out_handle.write("# description: 'Quality was checked for a uniform subsample of reads of each file. "
+                         "Total reads are estimated for files sampled using random offsets.'\n")
+        out_handle.write("# plot_type: 'table'\n")
+        out_handle.write('Sample\tSampled reads\tTotal reads\tFraction\tMethod\n')
+        for details in sampling:
+            out_handle.write('%s\t%s\t%s\t%s\t%s\n' %(fastq_qc.sample_name(details['file']), details['sampled'],
+                                                       details['total'], details['fraction'], details['method']))
+    return (len(sampling))
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) < 4:
+        print ("\nUsage:")
+        print ("python3 %s fastq_file reads out_file\n" %os.path.realpath(__file__))
+        exit()
+
+    print (subsample(os.path.abspath(sys.argv[1]), int(sys.argv[2]), os.path.abspath(sys.argv[3])))
+
+######
+if __name__== "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Sample scheduler shared by all modules.
+
+Replaces the static split of threads (``optimize_threads``) between samples:
+
+- Samples are sorted by expected work (input size or wall time recorded in a previous run), larger first.
+- Each sample receives threads proportionally to its expected work, using the threads available when it starts.
+  Threads freed by finished samples are assigned to the next samples sent.
+- Jobs that do not scale beyond a number of threads (e.g. single-threaded software) are capped and the threads left are given to the rest.
+- A global memory budget might be set (e.g. STAR sorting RAM per sample).
+- Wall time for each sample is recorded in the project so later runs schedule better.
+"""
+## useful imports
+import os
+import time
+import json
+import statistics
+import collections
+import multiprocessing
+import concurrent.futures
+from termcolor import colored
+
+## file to record wall time for each step and sample
+history_name = '.XICRA_jobs_time.json'
+
+## placeholder for the number of threads within job arguments
+THREADS = object()
+
+##########################################################
+class Job:
+    """
+    Job to be scheduled for a sample.
+
+    :param name: Sample name.
+    :param func: Function to call.
+    :param args: Arguments for the function. Use :data:`XICRA.scripts.scheduler.THREADS` for the
+        argument that receives the number of threads.
+    :param files: Input files used to estimate the work for the sample.
+    :param memory: Memory required (bytes), if any.
+    :param max_threads: Maximum number of threads the job is able to use, if any.
+    """
+    def __init__(self, name, func, *args, files=(), memory=0, max_threads=None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.files = files
+        self.memory = memory
+        self.max_threads = max_threads
+        self.work = 0
+        self.threads = 1
+
+    def run(self, threads):
+        """Calls the function with the threads given. Returns result and wall time."""
+        args = [ threads if arg is THREADS else arg for arg in self.args ]
+        start = time.time()
+        result = self.func(*args)
+        return (result, time.time() - start)
+
+##########################################################
+def _size(files):
+    size = 0
+    for file_given in files:
+        if os.path.isfile(file_given):
+            size += os.path.getsize(file_given)
+    return (size)
+
+##########################################################
+def history_file(folder):
+    """Returns file to record wall time for jobs in the folder given."""
+    return (os.path.join(folder, history_name))
+
+##########################################################
+def read_history(history, step):
+    """Returns dictionary with wall time and threads recorded for each sample in the step given."""
+    if not history or not os.path.isfile(history):
+        return ({})
+    try:
+        with open(history) as in_handle:
+            return (json.load(in_handle).get(step, {}))
+    except ValueError:
+        return ({})
+
+##########################################################
+def write_history(history, step, records):
+    """Updates wall time recorded for the step given."""
+    data = {}
+    if os.path.isfile(history):
+        try:
+            with open(history) as in_handle:
+                data = json.load(in_handle)
+        except ValueError:
+            data = {}
+
+    data.setdefault(step, {}).update(records)
+    with open(history + '.tmp', 'w') as out_handle:
+        json.dump(data, out_handle, indent=4)
+    os.replace(history + '.tmp', history)
+
+##########################################################
+def estimate_work(jobs, recorded):
+    """
+    Estimates work for each job.
+
+    Jobs recorded in a previous run use CPU time (wall time x threads). For the rest, input size
+    is converted using the median CPU time per byte of jobs recorded, or input size if none.
+    """
+    for job in jobs:
+        job.size = _size(job.files)
+
+    rates = [ recorded[job.name]['seconds'] * recorded[job.name]['threads'] / job.size
+              for job in jobs if job.name in recorded and job.size ]
+    rate = statistics.median(rates) if rates else 1
+
+    for job in jobs:
+        if job.name in recorded:
+            job.work = recorded[job.name]['seconds'] * recorded[job.name]['threads']
+        else:
+            job.work = job.size * rate
+
+        ## avoid zero work: e.g. empty or missing files
+        job.work = max(job.work, 0.001)
+
+##########################################################
+def available_memory():
+    """Returns physical memory available (bytes) or None if it could not be retrieved."""
+    try:
+        return (os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE'))
+    except (ValueError, OSError, AttributeError):
+        return (None)
+
+##########################################################
+def threads_for(job, pending, free_threads):
+    """
+    Threads for the job to start: threads available are split between the next jobs
+    that could start now proportionally to their work.
+
+    Jobs with a maximum number of threads lower than their share receive the maximum
+    and threads left are split between the rest.
+    """
+    jobs_left = [job] + pending[:free_threads - 1]
+    threads_left = free_threads
+    while True:
+        total_work = sum([ j.work for j in jobs_left ])
+        capped = [ j for j in jobs_left if j.max_threads and threads_left * j.work / total_work > j.max_threads ]
+        if not capped:
+            break
+        if job in capped:
+            return (max(1, min(job.max_threads, free_threads)))
+        for j in capped:
+            threads_left -= j.max_threads
+            jobs_left.remove(j)
+
+    threads = int(round(threads_left * job.work / total_work))
+    return (max(1, min(threads, free_threads)))
+
+##########################################################
+def run_jobs(jobs, total_threads, Debug, history=None, step=None, memory_budget=None):
+    """
+    Runs jobs for each sample using threads available.
+
+    :param jobs: List of :class:`XICRA.scripts.scheduler.Job`.
+    :param total_threads: Number of threads available.
+    :param Debug: True/False for debugging messages.
+    :param history: File to record wall time for each sample. See :func:`XICRA.scripts.scheduler.history_file`.
+    :param step: Step name to record wall time.
+    :param memory_budget: Memory (bytes) available for all jobs running at the same time, if any.
+
+    :returns: Dictionary containing sample names as keys and results returned as values.
+    """
+    total_threads = max(1, int(total_threads))
+    recorded = read_history(history, step)
+    estimate_work(jobs, recorded)
+    pending = sorted(jobs, key=lambda job: job.work, reverse=True)
+
+    ## debug message
+    if (Debug):
+        print (colored("**DEBUG: scheduler for step %s: %s jobs, %s threads **" %(step, len(jobs), total_threads), 'yellow'))
+        for job in pending:
+            print (colored("\t%s: work %s; memory %s" %(job.name, job.work, job.memory), 'yellow'))
+
+    results = {}
+    records = {}
+    running = {}
+    free_threads = total_threads
+    used_memory = 0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=total_threads) as executor:
+        while pending or running:
+            ## send jobs while threads and memory are available
+            waiting = []
+            while pending and free_threads > 0:
+                job = pending.pop(0)
+                if memory_budget and running and used_memory + job.memory > memory_budget:
+                    waiting.append(job)
+                    continue
+
+                job.threads = threads_for(job, pending, free_threads)
+                free_threads -= job.threads
+                used_memory += job.memory
+                running[executor.submit(job.run, job.threads)] = job
+
+                ## debug message
+                if (Debug):
+                    print (colored("**DEBUG: send %s using %s threads **" %(job.name, job.threads), 'yellow'))
+
+            pending = waiting + pending
+
+            ## wait for any job to finish
+            done, not_done = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for cmd2 in done:
+                job = running.pop(cmd2)
+                free_threads += job.threads
+                used_memory -= job.memory
+                try:
+                    (results[job.name], seconds) = cmd2.result()
+                    records[job.name] = {'seconds': round(seconds, 2), 'threads': job.threads, 'size': job.size}
+                except Exception as exc:
+                    print ('***ERROR:')
+                    print (cmd2)
+                    print('%r generated an exception: %s' % (job.name, exc))
+
+    ## record wall time
+    if history and step and records:
+        write_history(history, step, records)
+
+    return (results)
+
+##########################################################
+def process_map(func, items, processes, *args):
+    """
+    Calls the function for each item (e.g. batch of reads) using several processes and yields results in the same order.
+
+    Items are read as processes are free: a few items are kept for each process, so large inputs
+    are never loaded in memory at once. Additional arguments are passed to the function after each item.
+    """
+    processes = max(1, int(processes))
+    if processes == 1:
+        for item in items:
+            yield (func(item, *args))
+        return
+
+    context = multiprocessing.get_context('fork')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append(executor.submit(func, item, *args))
+            if len(pending) >= 2 * processes:
+                yield (pending.popleft().result())
+        while pending:
+            yield (pending.popleft().result())
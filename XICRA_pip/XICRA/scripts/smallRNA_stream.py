@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Streaming small RNA preprocessing for a sample: trimming, joining and collapsing.
+
+Reads flow through pipes between steps and only collapsed reads and logs
+(cutadapt and fastqjoin, for MultiQC) are written on disk:
+
+- cutadapt (and a second cutadapt command if extra options are provided, see
+  :func:`XICRA.modules.trimm.cutadapt`) writes trimmed reads (interleaved, if
+  paired-end) to stdout,
+- reads are joined within XICRA (see :func:`XICRA.scripts.join_reads.join_stream`) or split
+  into two named pipes read by fastqjoin. Unjoined reads are discarded,
+- joined reads (or trimmed reads, if single-end) are sent to a named pipe and collapsed
+  (see :func:`XICRA.scripts.collapse_reads.collapse`).
+"""
+## useful imports
+import os
+import sys
+import time
+import errno
+import fcntl
+import shlex
+import shutil
+import tempfile
+import threading
+import subprocess
+from termcolor import colored
+
+## import my modules
+from XICRA.scripts import collapse_reads
+from XICRA.scripts import join_reads
+
+## bytes sent to the pipes each time: lower than the pipe capacity (64 kb)
+batch_size = 16*1024
+
+##########################################################
+def _open_fifo_write(fifo, reader=None):
+    """
+    Opens a named pipe for writing once the reader is connected. Opening does not
+    block so pipes could be opened in any order by the reader.
+
+    :returns: File handle or None if the reader process finished before opening the pipe.
+    """
+    while True:
+        try:
+            fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as exc:
+            if exc.errno != errno.ENXIO:
+                raise
+            if reader and reader.poll() is not None:
+                return (None)
+            time.sleep(0.05)
+            continue
+
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_NONBLOCK)
+        return (os.fdopen(fd, 'wb'))
+
+##########################################################
+def split_reads(in_stream, fifos, reader, errors):
+    """
+    Sends fastq records from the stream to each named pipe in turn (de-interleaves paired-end reads).
+
+    :param in_stream: Binary stream containing fastq records.
+    :param fifos: List of named pipes: one (single-end) or two (paired-end).
+    :param reader: Process reading the pipes, if any.
+    :param errors: List to append errors.
+    """
+    handles = []
+    try:
+        for fifo in fifos:
+            handle = _open_fifo_write(fifo, reader)
+            if handle is None:
+                errors.append('reader finished before reading %s' %fifo)
+                return
+            handles.append(handle)
+
+        ## paired-end reads are read in turns: data is sent in small batches to
+        ## both pipes so the reader never waits for data kept in a buffer
+        finished = False
+        while not finished:
+            batches = [ [] for handle in handles ]
+            size = 0
+            while size < batch_size:
+                record = [ in_stream.readline() for i in range(4 * len(handles)) ]
+                if not record[0]:
+                    finished = True
+                    break
+                for count, batch in enumerate(batches):
+                    batch.extend(record[4*count:4*count + 4])
+                size += sum([ len(line) for line in record ])
+
+            for batch, handle in zip(batches, handles):
+                handle.writelines(batch)
+                handle.flush()
+
+    except (BrokenPipeError, OSError) as exc:
+        errors.append(str(exc))
+
+    finally:
+        for handle in handles:
+            try:
+                handle.close()
+            except OSError:
+                pass
+        in_stream.close()
+
+##########################################################
+def join_reads_stream(in_stream, fifo, perc_diff, threads, logfile, errors):
+    """
+    Joins interleaved reads from the stream and sends joined reads to the named pipe
+    (see :func:`XICRA.scripts.join_reads.join_stream`).
+
+    :param in_stream: Binary stream containing interleaved fastq records.
+    :param fifo: Named pipe for joined reads.
+    :param perc_diff: Percentage difference allowed within the overlap.
+    :param threads: Number of processes.
+    :param logfile: File to write report.
+    :param errors: List to append errors.
+    """
+    handle = None
+    try:
+        handle = _open_fifo_write(fifo)
+        report = join_reads.join_stream(in_stream, handle, perc_diff, threads)
+        with open(logfile, 'w') as log_handle:
+            log_handle.write(report)
+
+    except (OSError, ValueError) as exc:
+        errors.append(str(exc))
+
+    finally:
+        if handle:
+            try:
+                handle.close()
+            except OSError:
+                pass
+        in_stream.close()
+
+##########################################################
+def cutadapt_commands(cutadapt_exe, reads, threads, adapters, extra):
+    """Returns cutadapt commands writing trimmed reads to stdout (interleaved, if paired-end)."""
+    adapter_args = ['-a', adapters['adapter_a']]
+    if len(reads) == 2:
+        adapter_args = adapter_args + ['-A', adapters['adapter_A'], '--interleaved']
+
+    if not extra:
+        return ([[cutadapt_exe, '-j', str(threads)] + adapter_args + reads])
+
+    ## adapters are trimmed again together with extra options (as trimm module)
+    threads_pipe = str(max(1, int(threads) // 2))
+    return ([[cutadapt_exe, '-j', threads_pipe] + adapter_args + reads,
+             [cutadapt_exe] + shlex.split(extra) + ['-j', threads_pipe] + adapter_args + ['-']])
+
+##########################################################
+def preprocess(reads, out_folder, name, threads, adapters, extra, perc_diff, cutadapt_exe, fastqjoin_exe, Debug):
+    """
+    Trims, joins (if paired-end) and collapses reads for a sample streaming data between steps.
+
+    :param reads: List of raw fastq files (one or two).
+    :param out_folder: Folder to store collapsed reads and logs.
+    :param name: Sample name.
+    :param threads: Threads for cutadapt.
+    :param adapters: Dictionary containing adapter_a and adapter_A (if paired-end).
+    :param extra: Extra options for cutadapt, if any.
+    :param perc_diff: Percentage difference for fastqjoin.
+    :param fastqjoin_exe: fastqjoin executable or None to join reads within XICRA.
+    :param Debug: True/False for debugging messages.
+
+    :returns: Dictionary as returned by :func:`XICRA.scripts.collapse_reads.collapse` or False if any step failed.
+    """
+    cutadapt_log = os.path.join(out_folder, name + '.cutadapt.log')
+    fastqjoin_log = os.path.join(out_folder, name + '.fastqjoin.log')
+    pipes_folder = tempfile.mkdtemp(prefix='XICRA_pipes_')
+    processes = []
+    errors = []
+    result = {}
+
+    try:
+        ## trimming
+        log_handle = open(cutadapt_log, 'w')
+        stdin = None
+        for cmd in cutadapt_commands(cutadapt_exe, reads, threads, adapters, extra):
+            ## debugging messages
+            if Debug:
+                print (colored("** DEBUG: " + " ".join(cmd), 'yellow'))
+            processes.append(subprocess.Popen(cmd, stdin=stdin, stdout=subprocess.PIPE, stderr=log_handle))
+            if stdin:
+                stdin.close()
+            stdin = processes[-1].stdout
+        log_handle.close()
+
+        ## joining
+        collapse_fifo = os.path.join(pipes_folder, name + '_reads.fastq')
+        os.mkfifo(collapse_fifo)
+        joiner = None
+        splitter = None
+        if len(reads) == 2 and not fastqjoin_exe:
+            ## join reads within XICRA
+            splitter = threading.Thread(target=join_reads_stream, args=(stdin, collapse_fifo, perc_diff, 
+                                                                        max(1, int(threads) // 2), fastqjoin_log, errors))
+        elif len(reads) == 2:
+            fifos = [ os.path.join(pipes_folder, name + '_trim_R%s.fastq' %i) for i in (1, 2) ]
+            for fifo in fifos:
+                os.mkfifo(fifo)
+            cmd = '%s -p %s %s %s -o /dev/null -o /dev/null -o %s > %s' %(fastqjoin_exe, perc_diff, fifos[0], fifos[1],
+                                                                          collapse_fifo, fastqjoin_log)
+            if Debug:
+                print (colored("** DEBUG: " + cmd, 'yellow'))
+            joiner = subprocess.Popen(cmd, shell=True)
+            processes.append(joiner)
+        else:
+            fifos = [collapse_fifo]
+
+        if not splitter:
+            splitter = threading.Thread(target=split_reads, args=(stdin, fifos, joiner, errors))
+        splitter.start()
+
+        ## collapsing
+        def collapse():
+            try:
+                result.update(collapse_reads.collapse([collapse_fifo], out_folder, name, Debug))
+            except Exception as exc:
+                errors.append(str(exc))
+        collapser = threading.Thread(target=collapse)
+        collapser.start()
+
+        ## wait for all steps
+        codes = [ process.wait() for process in processes ]
+        splitter.join()
+        if joiner and collapser.is_alive():
+            ## joiner failed before opening the pipe
+            try:
+                os.close(os.open(collapse_fifo, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+        collapser.join()
+
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        shutil.rmtree(pipes_folder, ignore_errors=True)
+
+    if any(codes) or errors or not result:
+        print (colored("** ERROR: preprocessing failed for sample %s (exit codes: %s) %s" %(name, codes, "; ".join(errors)), 'red'))
+        print (colored("** See logs: %s, %s" %(cutadapt_log, fastqjoin_log), 'red'))
+        return (False)
+
+    return (result)
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) < 6:
+        print ("\nUsage:")
+        print ("python3 %s out_folder name adapter_a adapter_A reads_R1 [reads_R2]\n" %os.path.realpath(__file__))
+        exit()
+
+    reads = [ os.path.abspath(f) for f in sys.argv[5:] ]
+    print (preprocess(reads, os.path.abspath(sys.argv[1]), sys.argv[2], 2, {'adapter_a': sys.argv[3], 'adapter_A': sys.argv[4]},
+                      None, 0, 'cutadapt', None, True))
+
+######
+if __name__== "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Incremental cache for each step of the analysis.
+
+Each step records, next to its ``.success`` time stamp, a digest of:
+
+- input files (content) or folders (file names, sizes and modification times),
+- parameters that define the results of the step,
+- version of the tool employed.
+
+A step is only executed again if any of these changed. As input files for a
+step are output files of a previous step, changes are propagated to steps
+downstream. Results generated by previous versions (``.success`` stamp without
+cache information) are considered up to date.
+
+Number of threads is not included in parameters as it does not change results.
+"""
+## useful imports
+import os
+import json
+import hashlib
+import functools
+from termcolor import colored
+
+## import my modules
+from HCGB.functions import time_functions
+from XICRA.config import set_config
+
+##########################################################
+def _cache_file(filename_stamp):
+    return (filename_stamp + '_cache.json')
+
+##########################################################
+def _stat(path):
+    stat = os.stat(path)
+    return ([stat.st_size, stat.st_mtime_ns, stat.st_ino])
+
+##########################################################
+def _file_digest(file_given):
+    sha = hashlib.sha256()
+    with open(file_given, 'rb') as in_handle:
+        for chunk in iter(lambda: in_handle.read(1024*1024), b''):
+            sha.update(chunk)
+    return (sha.hexdigest())
+
+##########################################################
+def _folder_digest(folder):
+    """Digest for folder using file names, sizes and modification times."""
+    sha = hashlib.sha256()
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for file_name in sorted(files):
+            if file_name.startswith('.success'):
+                continue
+            file_path = os.path.join(root, file_name)
+            stat = os.stat(file_path)
+            sha.update(("%s\t%s\t%s\n" %(os.path.relpath(file_path, folder), stat.st_size, stat.st_mtime_ns)).encode())
+    return (sha.hexdigest())
+
+##########################################################
+def input_digests(inputs, previous={}):
+    """
+    Returns digest for each input.
+
+    Digests from a previous record are reused if size, modification time and inode did not change.
+
+    :param inputs: List of files or folders.
+    :param previous: Dictionary of inputs recorded previously.
+    :returns: Dictionary with absolute path as keys and [stat, digest] as values.
+    """
+    digests = {}
+    for input_given in inputs:
+        input_given = os.path.abspath(input_given)
+        if not os.path.exists(input_given):
+            digests[input_given] = [None, None]
+            continue
+
+        stat = _stat(input_given)
+        if input_given in previous and previous[input_given][0] == stat and not os.path.isdir(input_given):
+            digests[input_given] = previous[input_given]
+        elif os.path.isdir(input_given):
+            digests[input_given] = [stat, _folder_digest(input_given)]
+        else:
+            digests[input_given] = [stat, _file_digest(input_given)]
+
+    return (digests)
+
+##########################################################
+@functools.lru_cache(maxsize=None)
+def tool_version(prog, exe=None):
+    """
+    Returns version for software or python package (if no executable provided).
+
+    If version could not be retrieved, executable path is returned instead.
+    """
+    try:
+        if exe:
+            version = set_config.get_version(prog, exe)
+        else:
+            version = set_config.check_package_version(prog, False)
+    except Exception:
+        version = None
+
+    if not version or str(version).lower() in ('n.a.', 'na', 'nan'):
+        version = exe if exe else 'NA'
+
+    return (prog + ' ' + str(version))
+
+##########################################################
+def _read_record(filename_stamp):
+    try:
+        with open(_cache_file(filename_stamp)) as in_handle:
+            return (json.load(in_handle))
+    except (OSError, ValueError):
+        return (None)
+
+##########################################################
+def check_step(filename_stamp, name, step, inputs, params, version, Debug):
+    """
+    Checks whether results for the step are up to date.
+
+    :param filename_stamp: Absolute path for the .success time stamp of the step.
+    :param name: Sample name.
+    :param step: Step name (for messages).
+    :param inputs: List of input files or folders.
+    :param params: Dictionary of parameters that define results.
+    :param version: Tool version, see :func:`XICRA.scripts.step_cache.tool_version`.
+    :param Debug: True/False for debugging messages.
+
+    :returns: True/False if results are up to date and record to save once the step finishes (see :func:`XICRA.scripts.step_cache.save_step`).
+    """
+    previous = _read_record(filename_stamp)
+    record = {'inputs': input_digests(inputs, previous['inputs'] if previous else {}),
+              'params': json.loads(json.dumps(params, sort_keys=True, default=str)),
+              'version': version}
+
+    if not os.path.isfile(filename_stamp):
+        return (False, record)
+
+    stamp = time_functions.read_time_stamp(filename_stamp)
+    if not previous:
+        ## results from previous versions: keep them
+        _write_record(filename_stamp, record)
+        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, step), 'yellow'))
+        return (True, record)
+
+    ## check changes
+    changes = []
+    if [ d[1] for d in record['inputs'].values() ] != [ d[1] for d in previous['inputs'].values() ] or \
+            list(record['inputs'].keys()) != list(previous['inputs'].keys()):
+        changes.append('inputs')
+    if record['params'] != previous['params']:
+        changes.append('parameters')
+    if record['version'] != previous['version']:
+        changes.append('version')
+
+    ## debugging messages
+    if Debug:
+        print (colored("** DEBUG: cache for %s -- %s: %s" %(name, step, changes), 'yellow'))
+
+    if changes:
+        print (colored("\tResults generated on %s are outdated (%s changed) [%s -- %s]" %(stamp, ", ".join(changes), name, step), 'yellow'))
+        os.remove(filename_stamp)
+        return (False, record)
+
+    ## update stats if only time stamps changed
+    if record['inputs'] != previous['inputs']:
+        _write_record(filename_stamp, record)
+
+    print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, step), 'yellow'))
+    return (True, record)
+
+##########################################################
+def _write_record(filename_stamp, record):
+    with open(_cache_file(filename_stamp) + '.tmp', 'w') as out_handle:
+        json.dump(record, out_handle, indent=4)
+    os.replace(_cache_file(filename_stamp) + '.tmp', _cache_file(filename_stamp))
+
+##########################################################
+def save_step(filename_stamp, record):
+    """Prints time stamp and records digests for the step finished."""
+    time_functions.print_time_stamp(filename_stamp)
+    _write_record(filename_stamp, record)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Benchmarks detection of features sharing UID in the miRNA count matrix.
+
+A synthetic count matrix is created (index miRNA&variant&UID, some UIDs shared by several
+features) and split using :func:`XICRA.scripts.generate_DE.discard_UID_duplicated`, with
+UID codes retrieved from the index or given (as returned by ``generate_matrix``), and the
+previous implementation (``str.split(expand=True)`` and ``groupby``). All results must be equal.
+"""
+## useful imports
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from XICRA.scripts import generate_DE
+
+##########################################################
+def create_matrix(rows, samples, uids, seed=0):
+    """Returns count matrix and integer code of the UID for each row (UIDs drawn from uids x rows values)."""
+    rng = np.random.default_rng(seed)
+    uid_values = rng.integers(0, int(rows * uids), rows)
+    index = pd.Index([ 'hsa-mir-%d&iso_3p:-1,iso_5p:1&U%d' %(i % 500, uid) for i, uid in enumerate(uid_values.tolist()) ])
+    df_data = pd.DataFrame(rng.random((rows, samples)), index=index, columns=[ 'sample_%s' %i for i in range(samples) ])
+    return (df_data, pd.factorize(uid_values)[0])
+
+##########################################################
+def split_matrix(df_data):
+    """Previous implementation: UID retrieved using str.split and counted using groupby."""
+    ## get data index
+    df_data['ID'] = df_data.index
+    new_data = df_data.filter(['ID'], axis=1)
+
+    # split ID (hsa-let-7a-2-3p&NA&qNkjr6Ov2) into miRNA, variant and UID
+    tmp = new_data['ID'].str.split('&', expand = True)
+    new_data['miRNA']  = tmp[0]
+    new_data['variant']  = tmp[1]
+    new_data['UID']  = tmp[2]
+
+    ## count
+    count_groups = new_data.groupby('UID').count()
+
+    ## get duplicated
+    bigger1count = count_groups[ count_groups['ID'] > 1 ]
+
+    ## get list of UIDs duplicate
+    bigger1count_list = bigger1count.index.to_list()
+    duplicates = new_data[new_data['UID'].isin(bigger1count_list)]
+
+    ## get duplicated data
+    duplicates_indes_list = duplicates.index.to_list()
+    duplicates_expression = df_data[df_data.index.isin(duplicates_indes_list)]
+    duplicates_expression = duplicates_expression.drop(['ID'], axis=1)
+    duplicates_expression.index.name = "ID"
+
+    ## get clean data
+    clean_data_expression = df_data[~df_data.index.isin(duplicates_indes_list)]
+    clean_data_expression = clean_data_expression.drop(['ID'], axis=1)
+    clean_data_expression.index.name = "ID"
+
+    return (clean_data_expression, duplicates_expression)
+
+##########################################################
+def timed(function, *args):
+    """Returns seconds and result of the function."""
+    start = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - start, result)
+
+##########################################################
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks detection of features sharing UID in the miRNA count matrix.')
+    parser.add_argument('--rows', type=int, default=5000000, help='Number of features [Default: 5000000].')
+    parser.add_argument('--samples', type=int, default=3, help='Number of samples [Default: 3].')
+    parser.add_argument('--uids', type=float, default=0.9, help='Distinct UIDs drawn per feature [Default: 0.9].')
+    options = parser.parse_args()
+
+    (df_data, codes) = create_matrix(options.rows, options.samples, options.uids)
+
+    ## previous implementation modifies the matrix given
+    (previous_time, expected) = timed(split_matrix, df_data.copy())
+    print ('str.split(expand=True) version: %8.2f s' %previous_time)
+    print ('  (%s features with unique UID, %s sharing UID)' %(len(expected[0]), len(expected[1])))
+
+    for (label, args) in (('codes from index:', (df_data,)), ('codes from generate_matrix:', (df_data, codes))):
+        (seconds, result) = timed(generate_DE.discard_UID_duplicated, *args)
+        for (frame, expected_frame) in zip(result, expected):
+            pd.testing.assert_frame_equal(frame, expected_frame)
+        print ('%-31s %8.2f s  (x%.1f)' %(label, seconds, previous_time / seconds))
+
+######
+if __name__== "__main__":
+    main()
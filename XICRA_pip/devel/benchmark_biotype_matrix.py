@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Benchmarks generation of the RNA biotype summary matrix.
+
+Synthetic featureCount.out.tsv files are created (some RNA biotypes missing in each
+sample) and the matrix is generated using :func:`XICRA.scripts.RNAbiotype.generate_matrix`
+and the previous implementation (a ``pd.concat`` for each sample). Both results must be equal.
+"""
+## useful imports
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from XICRA.scripts import RNAbiotype
+
+##########################################################
+def create_files(folder, samples, biotypes, seed=1):
+    """Writes a featureCount.out.tsv file for each sample and returns dictionary of files."""
+    rng = random.Random(seed)
+    names = ['biotype_%03d' %i for i in range(biotypes)]
+    dict_files = {}
+    for i in range(samples):
+        sample = 'sample_%05d' %i
+        dict_files[sample] = os.path.join(folder, sample + '_featureCount.out.tsv')
+        with open(dict_files[sample], 'w') as out_handle:
+            for name in names:
+                if rng.random() < 0.9:
+                    out_handle.write('%s\t%s\n' %(name, rng.randrange(100000)))
+            out_handle.write('unmapped\t%s\n' %rng.randrange(100000))
+    return (dict_files)
+
+##########################################################
+def concat_matrix(dict_files):
+    """Previous implementation: a pd.concat of the matrix for each sample."""
+    all_data = pd.DataFrame()
+    for key, values in dict_files.items():
+        data = pd.read_csv(values, sep='\t', header=None, names=['RNAbiotypes', key])
+        if data.empty:
+            continue
+        data = data.set_index('RNAbiotypes')
+        all_data = pd.concat([all_data, data], axis=1, sort=True)
+    return (all_data)
+
+##########################################################
+def timed(function, *args):
+    """Returns seconds and result of the function (progress messages discarded)."""
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = function(*args)
+    return (time.perf_counter() - start, result)
+
+##########################################################
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks generation of the RNA biotype summary matrix.')
+    parser.add_argument('--samples', type=int, default=2000, help='Number of synthetic samples [Default: 2000].')
+    parser.add_argument('--biotypes', type=int, default=60, help='Number of RNA biotypes [Default: 60].')
+    parser.add_argument('--threads', type=int, default=4, help='Processes to read files [Default: 4].')
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        dict_files = create_files(folder, options.samples, options.biotypes)
+
+        (concat_time, expected) = timed(concat_matrix, dict_files)
+        print ('pd.concat for each sample:   %8.2f s' %concat_time)
+        for threads in sorted(set([1, options.threads])):
+            (seconds, result) = timed(RNAbiotype.generate_matrix, dict_files, threads)
+            pd.testing.assert_frame_equal(result, expected)
+            print ('generate_matrix (%2d threads): %8.2f s  (x%.1f)' %(threads, seconds, concat_time / seconds))
+
+######
+if __name__== "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Creates test data for counting reads for each biotype (``tests/data/biotype_counter``).
+
+A small GTF file (exons of four biotypes: overlapping on opposite strands, nested and on a
+second chromosome) and a BAM file with single-end reads, read pairs, unmapped reads and a
+multimapping read (NH:2, primary and secondary alignments). Expected counts for each
+featureCounts option used by XICRA are checked in ``tests/test_biotype_counter.py``.
+
+If featureCounts is available, expected results can also be created with it:
+
+python devel/biotype_counter_test_data.py --featureCounts /path/to/featureCounts
+"""
+## useful imports
+import os
+import sys
+import shutil
+import argparse
+import subprocess
+import pysam
+
+## exons: chromosome, start, end (1-based), strand, biotype
+exons = [('chr1', 100, 199, '+', 'protein_coding'),
+         ('chr1', 150, 249, '-', 'lncRNA'),
+         ('chr1', 400, 499, '+', 'miRNA'),
+         ('chr1', 450, 479, '+', 'snoRNA'),
+         ('chr2', 100, 199, '+', 'protein_coding')]
+
+## alignments: name, flag, chromosome, position (1-based), mate chromosome, mate position, tags
+## reads of 20 bases (20M); position 0 for unmapped reads
+alignments = [('single_A', 0, 'chr1', 110, None, 0, {}),
+              ('single_B', 16, 'chr1', 210, None, 0, {}),
+              ('single_A_B', 0, 'chr1', 170, None, 0, {}),
+              ('single_largest_B', 0, 'chr1', 190, None, 0, {}),
+              ('single_nested', 0, 'chr1', 455, None, 0, {}),
+              ('single_none', 0, 'chr1', 300, None, 0, {}),
+              ('single_unmapped', 4, None, 0, None, 0, {}),
+              ('multimapping', 0, 'chr1', 110, None, 0, {'NH': 2, 'HI': 1}),
+              ('multimapping', 256, 'chr2', 110, None, 0, {'NH': 2, 'HI': 2}),
+              ('pair_A_B', 99, 'chr1', 105, 'chr1', 180, {}),
+              ('pair_A_B', 147, 'chr1', 180, 'chr1', 105, {}),
+              ('pair_mate_unmapped', 73, 'chr1', 410, 'chr1', 410, {}),
+              ('pair_mate_unmapped', 133, 'chr1', 410, 'chr1', 410, {}),
+              ('pair_unmapped', 77, None, 0, None, 0, {}),
+              ('pair_unmapped', 141, None, 0, None, 0, {})]
+
+read_length = 20
+chrom_lengths = {'chr1': 1000, 'chr2': 1000}
+
+##########################################################
+def write_gtf(gtf_file):
+    with open(gtf_file, 'w') as out_handle:
+        for number, (chrom, start, end, strand, biotype) in enumerate(exons):
+            out_handle.write('\t'.join([chrom, 'test', 'exon', str(start), str(end), '.', strand, '.',
+                                        'gene_id "G%s"; transcript_id "T%s"; transcript_biotype "%s";' %(number, number, biotype)]) + '\n')
+
+##########################################################
+def write_bam(bam_file):
+    header = {'HD': {'VN': '1.6', 'SO': 'unsorted'},
+              'SQ': [ {'SN': chrom, 'LN': length} for chrom, length in chrom_lengths.items() ]}
+    chroms = list(chrom_lengths)
+    with pysam.AlignmentFile(bam_file, 'wb', header=header) as out_handle:
+        for (name, flag, chrom, position, mate_chrom, mate_position, tags) in alignments:
+            read = pysam.AlignedSegment(out_handle.header)
+            read.query_name = name
+            read.flag = flag
+            read.query_sequence = 'A' * read_length
+            read.query_qualities = pysam.qualitystring_to_array('I' * read_length)
+            if chrom:
+                ## unmapped reads might be placed at the position of their mate
+                read.reference_id = chroms.index(chrom)
+                read.reference_start = position - 1
+                if not read.is_unmapped:
+                    read.mapping_quality = 255
+                    read.cigarstring = '%sM' %read_length
+            else:
+                read.reference_id = -1
+                read.reference_start = -1
+            if mate_chrom:
+                read.next_reference_id = chroms.index(mate_chrom)
+                read.next_reference_start = mate_position - 1
+            else:
+                read.next_reference_id = -1
+                read.next_reference_start = -1
+            for tag, value in tags.items():
+                read.set_tag(tag, value)
+            out_handle.write(read)
+
+##########################################################
+def main():
+    parser = argparse.ArgumentParser(description='Creates test data for counting reads for each biotype.')
+    parser.add_argument('--featureCounts', help='featureCounts executable to create expected results, if available.')
+    parser.add_argument('--outdir', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'data', 'biotype_counter'),
+                        help='Output folder [Default: tests/data/biotype_counter].')
+    options = parser.parse_args()
+
+    os.makedirs(options.outdir, exist_ok=True)
+    gtf_file = os.path.join(options.outdir, 'annotation.gtf')
+    bam_file = os.path.join(options.outdir, 'reads.bam')
+    write_gtf(gtf_file)
+    write_bam(bam_file)
+    print ('+ GTF and BAM files written in %s' %options.outdir)
+
+    if not options.featureCounts:
+        return
+    featureCounts_exe = shutil.which(options.featureCounts)
+    if not featureCounts_exe:
+        print ('** featureCounts is not available (%s): expected results not generated' %options.featureCounts)
+        sys.exit(1)
+
+    ## same options as XICRA (see XICRA.scripts.RNAbiotype.biotype_all)
+    for stranded in (0, 1, 2):
+        for (label, multimapping) in (('multimapping', ['-M', '-O']), ('largestOverlap', ['--largestOverlap'])):
+            out_file = os.path.join(options.outdir, 'featureCounts_s%s_%s.out' %(stranded, label))
+            subprocess.run([featureCounts_exe, '-s', str(stranded)] + multimapping + ['-p', '-t', 'exon', '-g', 'transcript_biotype',
+                            '-a', gtf_file, '-o', out_file, bam_file], check=True, stderr=subprocess.DEVNULL)
+    print ('+ Expected results created with featureCounts')
+
+######
+if __name__== "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Checks results of a java software (sRNAbench, miraligner) within a batch (``--java_batch``)
+are the same as for individual runs.
+
+The software is executed for each sample in a new process (``java -jar``) and for all
+samples within a single process (see :func:`XICRA.scripts.java_batch.run_batch`). Files
+generated for each sample are compared (log files are excluded).
+
+Arguments for the software are given as a template: ``{input}`` and ``{output}`` are
+replaced by the reads and output folder for each sample, e.g. for miraligner:
+
+python devel/check_java_batch.py --jar miraligner.jar --outdir check \\
+    --args "-db DB -sub 1 -add 3 -trim 3 -s hsa -i {input} -o {output}/sample" reads_1.tsv reads_2.tsv
+
+Exits with code 1 if results differ for any sample.
+"""
+## useful imports
+import os
+import sys
+import shlex
+import filecmp
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from XICRA.scripts import java_batch
+
+##########################################################
+def sample_args(template, reads, folder):
+    """Returns arguments for the sample given."""
+    return ([ arg.replace('{input}', reads).replace('{output}', folder) for arg in shlex.split(template) ])
+
+##########################################################
+def list_files(folder):
+    """Returns files generated within folder (relative paths), excluding log files."""
+    files = []
+    for root, dirs, filenames in os.walk(folder):
+        files += [ os.path.relpath(os.path.join(root, filename), folder) for filename in filenames if not filename.endswith('.log') ]
+    return (sorted(files))
+
+##########################################################
+def main():
+    parser = argparse.ArgumentParser(description='Checks results of a java software within a batch are the same as for individual runs.')
+    parser.add_argument('reads', nargs='+', help='Reads for each sample (at least 2).')
+    parser.add_argument('--jar', required=True, help='Software jar file.')
+    parser.add_argument('--args', required=True, help='Arguments template containing {input} and {output}.')
+    parser.add_argument('--outdir', required=True, help='Folder to write results.')
+    parser.add_argument('--java', default='java', help='Java executable [Default: java].')
+    options = parser.parse_args()
+
+    if len(options.reads) < 2:
+        parser.error('At least 2 samples are required.')
+    if not java_batch.batch_available(options.java):
+        print ('** Java 11 to 23 is required (found: %s)' %java_batch.java_version(options.java))
+        sys.exit(1)
+
+    samples = { 'sample_%s' %(i + 1): os.path.abspath(reads) for i, reads in enumerate(options.reads) }
+    outdir = os.path.abspath(options.outdir)
+
+    ## individual runs
+    for name, reads in samples.items():
+        folder = os.path.join(outdir, 'individual', name)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, 'run.log'), 'w') as log_handle:
+            code = subprocess.call([options.java, '-jar', options.jar] + sample_args(options.args, reads, folder),
+                                   stdout=log_handle, stderr=subprocess.STDOUT)
+        print ('%-12s individual run: exit code %s' %(name, code))
+
+    ## batch
+    batch = {}
+    for name, reads in samples.items():
+        folder = os.path.join(outdir, 'batch', name)
+        os.makedirs(folder, exist_ok=True)
+        batch[name] = (sample_args(options.args, reads, folder), os.path.join(folder, 'run.log'))
+    codes = java_batch.run_batch(options.java, options.jar, batch, os.path.join(outdir, 'batch'), False)
+
+    ## compare
+    failed = False
+    for name in samples:
+        individual = os.path.join(outdir, 'individual', name)
+        batch_folder = os.path.join(outdir, 'batch', name)
+        files = list_files(individual)
+        differ = [ f for f in files if not os.path.isfile(os.path.join(batch_folder, f)) or
+                   not filecmp.cmp(os.path.join(individual, f), os.path.join(batch_folder, f), shallow=False) ]
+        differ += [ f for f in list_files(batch_folder) if f not in files ]
+        status = 'OK' if codes.get(name) == 0 and files and not differ else 'FAILED'
+        failed = failed or status == 'FAILED'
+        print ('%-12s batch: exit code %s, %s files compared: %s %s' %(name, codes.get(name), len(files), status,
+                                                                      ('(differ: %s)' %', '.join(differ)) if differ else ''))
+
+    if failed:
+        sys.exit(1)
+
+######
+if __name__== "__main__":
+    main()
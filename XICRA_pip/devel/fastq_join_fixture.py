@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Creates test data for joining paired-end reads (``tests/data/fastq_join``) using fastq-join.
+
+A subset of read pairs of the BMC simulation example (rep_1) is written and joined with
+fastq-join as XICRA did (``fastq-join -p perc_diff R1 R2 -o unjoin_R1 -o unjoin_R2 -o joined``)
+for each percentage difference given. Joined and unjoined reads are saved as expected results
+for :func:`XICRA.scripts.join_reads.join` in ``tests/test_join_reads.py``.
+
+python devel/fastq_join_fixture.py --fastq_join /path/to/fastq-join
+"""
+## useful imports
+import os
+import sys
+import gzip
+import shutil
+import argparse
+import subprocess
+
+## example folder of the BMC simulation
+bmc_example = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                           'BMC_bioinformatics_paper', 'simulation', 'example')
+
+## percentage difference tested
+perc_diffs = (0, 8)
+
+##########################################################
+def expected_files(folder, perc_diff):
+    """Returns joined, unjoined R1 and unjoined R2 files generated by fastq-join for the percentage difference given."""
+    return ([ os.path.join(folder, 'fastqjoin_p%s_%s.fastq' %(perc_diff, name)) for name in ('joined', 'unjoin_R1', 'unjoin_R2') ])
+
+##########################################################
+def fastq_join(fastq_join_exe, reads, outputs, perc_diff, logfile):
+    """Calls fastq-join as XICRA did (see :func:`XICRA.modules.join.fastqjoin`)."""
+    with open(logfile, 'w') as log_handle:
+        subprocess.run([fastq_join_exe, '-p', str(perc_diff), reads[0], reads[1],
+                        '-o', outputs[1], '-o', outputs[2], '-o', outputs[0]], check=True, stdout=log_handle)
+
+##########################################################
+def subset(fastq_file, outfile, pairs, step):
+    """Writes a read every step reads (up to the number of pairs given)."""
+    written = 0
+    with gzip.open(fastq_file, 'rt') as in_handle, open(outfile, 'w') as out_handle:
+        for count, header in enumerate(in_handle):
+            record = [header] + [ next(in_handle) for i in range(3) ]
+            if count % step == 0:
+                out_handle.writelines(record)
+                written += 1
+                if written == pairs:
+                    break
+    return (written)
+
+##########################################################
+def main():
+    parser = argparse.ArgumentParser(description='Creates test data for joining paired-end reads using fastq-join.')
+    parser.add_argument('--fastq_join', default='fastq-join', help='fastq-join executable [Default: fastq-join].')
+    parser.add_argument('--pairs', type=int, default=1000, help='Number of read pairs [Default: 1000].')
+    parser.add_argument('--step', type=int, default=40, help='Keep a read pair every step pairs [Default: 40].')
+    parser.add_argument('--outdir', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'data', 'fastq_join'),
+                        help='Output folder [Default: tests/data/fastq_join].')
+    options = parser.parse_args()
+
+    os.makedirs(options.outdir, exist_ok=True)
+    reads = [ os.path.join(options.outdir, 'reads_R%s.fastq' %i) for i in (1, 2) ]
+    for i, read_file in enumerate(reads):
+        pairs = subset(os.path.join(bmc_example, 'reads', 'rep_1_R%s.fq.gz' %(i + 1)), read_file, options.pairs, options.step)
+    print ('+ %s read pairs written in %s' %(pairs, options.outdir))
+
+    fastq_join_exe = shutil.which(options.fastq_join)
+    if not fastq_join_exe:
+        print ('** fastq-join is not available (%s): expected results not generated' %options.fastq_join)
+        sys.exit(1)
+
+    for perc_diff in perc_diffs:
+        outputs = expected_files(options.outdir, perc_diff)
+        fastq_join(fastq_join_exe, reads, outputs, perc_diff, os.path.join(options.outdir, 'fastqjoin_p%s.log' %perc_diff))
+
+    print ('+ Reads joined with fastq-join (perc_diff: %s)' %', '.join(map(str, perc_diffs)))
+
+######
+if __name__== "__main__":
+    main()
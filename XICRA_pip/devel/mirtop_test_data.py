@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Creates test data for isomiR annotation (``tests/data/mirtop``) from the BMC simulation example.
+
+Simulated isomiRs (``rep_1.freqs.isomiRs.fasta``) are used to create a hairpin and miRBase GFF
+entry for each miRNA selected: the canonical sequence (majority for each position) is extended
+with the templated 5' (FA) and 3' (TA) additions simulated. Reads simulated (R1) for these miRNAs
+are collapsed and aligned to their hairpin to create a miraligner (seqbuster) results file.
+
+Results for this file using the mirtop command line and XICRA are compared in
+``tests/test_isomiR_annotation.py``.
+"""
+## useful imports
+import os
+import gzip
+import random
+import argparse
+from collections import Counter, defaultdict
+
+## example folder of the BMC simulation
+bmc_example = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                           'BMC_bioinformatics_paper', 'simulation', 'example')
+
+## maximum number of non-templated bases at 3' and mismatches to align reads
+max_add = 3
+max_mismatches = 1
+
+##########################################################
+def read_isomiRs(fasta_file):
+    """Returns dictionary containing for each miRNA variant type and sequence simulated."""
+    isomiRs = defaultdict(dict)
+    with open(fasta_file) as in_handle:
+        for line in in_handle:
+            line = line.strip()
+            if line.startswith('>'):
+                (mir, variant) = line[1:].split('::')
+                variant = variant.split('_')[0].split('-')[0]
+            elif line:
+                isomiRs[mir][variant] = line
+    return (isomiRs)
+
+##########################################################
+def create_hairpin(variants, rng):
+    """
+    Returns hairpin sequence and mature start (0-based) and length for the variants simulated of a miRNA.
+    """
+    ## canonical length: most common length for canonical and substitution variants
+    lengths = Counter([ len(seq) for variant, seq in variants.items() if variant in ('CN', 'SS', 'SR') ])
+    if not lengths:
+        return (None)
+    length = lengths.most_common(1)[0][0]
+
+    ## aligned variants: same length, 3' variants (first bases), 5' variants (last bases)
+    aligned = []
+    for variant, seq in variants.items():
+        if variant in ('CN', 'SS', 'SR') and len(seq) == length:
+            aligned.append(seq)
+        elif variant in ('TA', 'NT', 'TS'):
+            aligned.append(seq[:length])
+        elif variant in ('FA', 'FS'):
+            aligned.append(seq[-length:].rjust(length, '.'))
+    canonical = ''.join([ Counter([ seq[i] for seq in aligned if i < len(seq) and seq[i] != '.' ]).most_common(1)[0][0]
+                          for i in range(length) ])
+
+    ## templated additions
+    prefix = variants['FA'][:-length] if 'FA' in variants and len(variants['FA']) > length else ''
+    suffix = variants['TA'][length:] if 'TA' in variants and len(variants['TA']) > length else ''
+    flank5 = ''.join([ rng.choice('ACGT') for i in range(10) ]) + prefix
+    flank3 = suffix + ''.join([ rng.choice('ACGT') for i in range(30) ])
+    return (flank5 + canonical + flank3, len(flank5), length)
+
+##########################################################
+def align(seq, hairpin):
+    """Returns start (0-based) for the best alignment of the read within the hairpin or None."""
+    best = None
+    for add in range(max_add + 1):
+        templated = seq[:len(seq) - add]
+        for start in range(len(hairpin) - len(templated) + 1):
+            mismatches = sum([ 1 for a, b in zip(templated, hairpin[start:]) if a != b ])
+            if mismatches <= max_mismatches and (best is None or mismatches < best[0]):
+                best = (mismatches, start)
+        if best is not None:
+            return (best[1])
+    return (None)
+
+##########################################################
+def main():
+    parser = argparse.ArgumentParser(description='Creates test data for isomiR annotation from the BMC simulation example.')
+    parser.add_argument('--miRNAs', type=int, default=20, help='Number of miRNAs [Default: 20].')
+    parser.add_argument('--outdir', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'data', 'mirtop'),
+                        help='Output folder [Default: tests/data/mirtop].')
+    options = parser.parse_args()
+
+    rng = random.Random(1)
+    isomiRs = read_isomiRs(os.path.join(bmc_example, 'isomiR_simulations', 'rep_1.freqs.isomiRs.fasta'))
+
+    ## hairpins for the first miRNAs (sorted)
+    hairpins = {}
+    for mir in sorted(isomiRs):
+        hairpin = create_hairpin(isomiRs[mir], rng)
+        if hairpin:
+            hairpins[mir] = hairpin
+        if len(hairpins) == options.miRNAs:
+            break
+
+    ## collapse reads (R1) simulated for these miRNAs
+    reads = defaultdict(Counter)
+    with gzip.open(os.path.join(bmc_example, 'reads', 'rep_1_R1.fq.gz'), 'rt') as in_handle:
+        for header in in_handle:
+            seq = next(in_handle).strip()
+            next(in_handle)
+            next(in_handle)
+            mir = header[1:].split('::')[0]
+            if mir in hairpins and 'N' not in seq:
+                reads[mir][seq] += 1
+
+    os.makedirs(options.outdir, exist_ok=True)
+    with open(os.path.join(options.outdir, 'hairpin.fa'), 'w') as fasta_handle, \
+         open(os.path.join(options.outdir, 'hsa.gff3'), 'w') as gff_handle, \
+         open(os.path.join(options.outdir, 'rep_1.mirna'), 'w') as mirna_handle:
+        gff_handle.write('# miRBase miRNA\n##gff-version 3\n# genome-build-id: BMC simulation\n')
+        mirna_handle.write('\t'.join(['seq', 'name', 'freq', 'mir', 'start', 'end', 'mism', 'add', 't5', 't3',
+                                      's5', 's3', 'DB', 'precursor', 'ambiguity']) + '\n')
+        offset = 1000
+        number = 0
+        for position, (mir, (hairpin, start, length)) in enumerate(hairpins.items()):
+            mature = mir.replace('-mir-', '-miR-')
+            fasta_handle.write('>%s MI%07d Homo sapiens %s stem-loop\n%s\n' %(mir, position + 1, mir, hairpin.replace('T', 'U')))
+            gff_handle.write('chr1\t.\tmiRNA_primary_transcript\t%s\t%s\t.\t+\t.\tID=MI%07d;Alias=MI%07d;Name=%s\n' %(
+                offset + 1, offset + len(hairpin), position + 1, position + 1, mir))
+            gff_handle.write('chr1\t.\tmiRNA\t%s\t%s\t.\t+\t.\tID=MIMAT%07d;Alias=MIMAT%07d;Name=%s;Derives_from=MI%07d\n' %(
+                offset + start + 1, offset + start + length, position + 1, position + 1, mature, position + 1))
+            offset += len(hairpin) + 1000
+
+            for seq, count in sorted(reads[mir].items()):
+                read_start = align(seq, hairpin)
+                if read_start is None:
+                    continue
+                number += 1
+                mirna_handle.write('\t'.join([seq, 'seq_%s_x%s' %(number, count), str(count), mature, str(read_start + 1),
+                                              str(read_start + len(seq)), '0', '0', '0', '0', 'NA', 'NA', 'miRNA', mir, '0']) + '\n')
+
+    print ('+ %s miRNAs and %s sequences written in %s' %(len(hairpins), number, options.outdir))
+
+######
+if __name__== "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2020 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Checks start-up time of the XICRA command line.
+
+Each command is executed using ``python -X importtime``. The time spent importing modules
+must be lower than the budget given and heavy libraries must not be imported: subcommand
+modules (and their dependencies) are only imported when dispatched.
+
+Exits with code 1 if any command exceeds the budget.
+"""
+## useful imports
+import os
+import sys
+import argparse
+import subprocess
+
+## commands checked and libraries not expected to be imported
+commands = [['--help'], ['citation', 'only'], ['config', '--help'], ['QC', '--help'],
+            ['miRNA', '--help'], ['smallRNA', '--help'], ['biotype', '--help']]
+heavy_libraries = ['pandas', 'numpy', 'matplotlib', 'HCGB', 'mirtop', 'pysam']
+
+##########################################################
+def import_time(xicra_script, command, repeats):
+    """
+    Returns minimum import time (seconds) for the command and modules imported.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(xicra_script)), env.get('PYTHONPATH', '')])
+
+    best = None
+    modules = set()
+    for i in range(repeats):
+        process = subprocess.run([sys.executable, '-X', 'importtime', xicra_script] + command, env=env,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        total = 0
+        for line in process.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            (self_time, cumulative, name) = line[len('import time:'):].split('|')
+            modules.add(name.strip())
+            ## top level imports include the time of nested imports
+            if not name.startswith('  '):
+                total += int(cumulative)
+        best = total if best is None else min(best, total)
+    return (best / 1e6, modules)
+
+##########################################################
+def main():
+    parser = argparse.ArgumentParser(description='Checks start-up time of the XICRA command line.')
+    parser.add_argument('--budget', type=float, default=0.3, help='Seconds allowed to import modules for each command [Default: 0.3].')
+    parser.add_argument('--repeats', type=int, default=3, help='Executions for each command: minimum time is reported [Default: 3].')
+    options = parser.parse_args()
+
+    xicra_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main', 'XICRA')
+
+    failed = False
+    for command in commands:
+        (seconds, modules) = import_time(xicra_script, command, options.repeats)
+        loaded = [ lib for lib in heavy_libraries if lib in modules ]
+        status = 'OK' if seconds <= options.budget and not loaded else 'FAILED'
+        failed = failed or status == 'FAILED'
+        print ('%-22s %6.3f s  %s %s' %(' '.join(command), seconds, status,
+                                        ('(imports: %s)' %', '.join(loaded)) if loaded else ''))
+
+    if failed:
+        print ('\n** Start-up budget (%s s) exceeded or heavy libraries imported.' %options.budget)
+        sys.exit(1)
+
+######
+if __name__== "__main__":
+    main()
@@ -30,6 +30,6 @@ setuptools.setup(
 
     install_requires=[
         'pandas', 'patool', 'termcolor', 'cutadapt', 'mirtop',
-        'pysam', 'pybedtools', 'biopython', 'multiqc', 'HCGB'
+        'pysam', 'pybedtools', 'biopython', 'multiqc', 'HCGB', 'xopen', 'scipy'
     ],
 )
@@ -0,0 +1,5 @@
+## tests use XICRA from this folder (not an installed version)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,80 @@
+"""
+Reads counted for each biotype within XICRA (:mod:`XICRA.scripts.biotype_counter`) must follow
+featureCounts rules for the options used by XICRA (``-p -t exon -g transcript_biotype``, ``-s 0/1/2``
+and ``-M -O`` or ``--largestOverlap``).
+
+Test data are created using ``devel/biotype_counter_test_data.py``: expected counts below are
+derived from featureCounts rules for each read. If results generated by featureCounts are
+available (same folder), counts and summary are also compared with them.
+"""
+import os
+
+import pytest
+
+pytest.importorskip('pysam')
+from XICRA.scripts import biotype_counter
+
+data = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'biotype_counter')
+gtf_file = os.path.join(data, 'annotation.gtf')
+bam_file = os.path.join(data, 'reads.bam')
+
+## (stranded, multimapping): counts for each biotype and summary counts (0 for other status)
+##  -M -O: each alignment (multimapping read on chr1 and chr2) and each biotype overlapping (A_B, nested, pair)
+##  --largestOverlap: multimapping alignments discarded, ties (A_B, nested) ambiguous
+##  -s 1 / -s 2: features on the strand of the first read / opposite strand
+expected = {
+    (0, True): ({'protein_coding': 6, 'lncRNA': 4, 'miRNA': 2, 'snoRNA': 1},
+                {'Assigned': 9, 'Unassigned_Unmapped': 2, 'Unassigned_NoFeatures': 1}),
+    (0, False): ({'protein_coding': 2, 'lncRNA': 2, 'miRNA': 1, 'snoRNA': 0},
+                 {'Assigned': 5, 'Unassigned_Unmapped': 2, 'Unassigned_MultiMapping': 2,
+                  'Unassigned_NoFeatures': 1, 'Unassigned_Ambiguity': 2}),
+    (1, True): ({'protein_coding': 6, 'lncRNA': 1, 'miRNA': 2, 'snoRNA': 1},
+                {'Assigned': 9, 'Unassigned_Unmapped': 2, 'Unassigned_NoFeatures': 1}),
+    (1, False): ({'protein_coding': 4, 'lncRNA': 1, 'miRNA': 1, 'snoRNA': 0},
+                 {'Assigned': 6, 'Unassigned_Unmapped': 2, 'Unassigned_MultiMapping': 2,
+                  'Unassigned_NoFeatures': 1, 'Unassigned_Ambiguity': 1}),
+    (2, True): ({'protein_coding': 0, 'lncRNA': 3, 'miRNA': 0, 'snoRNA': 0},
+                {'Assigned': 3, 'Unassigned_Unmapped': 2, 'Unassigned_NoFeatures': 7}),
+    (2, False): ({'protein_coding': 0, 'lncRNA': 3, 'miRNA': 0, 'snoRNA': 0},
+                 {'Assigned': 3, 'Unassigned_Unmapped': 2, 'Unassigned_MultiMapping': 2,
+                  'Unassigned_NoFeatures': 5}),
+}
+
+def read_table(file_given, column):
+    """Returns dictionary with first column as keys and column given (int) as values, skipping comments and header."""
+    values = {}
+    with open(file_given) as in_handle:
+        lines = [ line.rstrip('\n').split('\t') for line in in_handle if not line.startswith('#') ]
+    for fields in lines[1:]:
+        values[fields[0]] = int(fields[column])
+    return (values)
+
+@pytest.fixture(scope='module')
+def index():
+    return (biotype_counter.build_index(gtf_file, False))
+
+def test_index(index):
+    assert index['names'] == ['protein_coding', 'lncRNA', 'miRNA', 'snoRNA']
+    ## protein_coding exons in chr1 and chr2: 100 bases each
+    assert index['info'][0]['chr'] == ['chr1', 'chr2']
+    assert index['info'][0]['length'] == 200
+
+@pytest.mark.parametrize('stranded,multimapping', sorted(expected))
+def test_counts(tmp_path, index, stranded, multimapping):
+    (counts, summary) = biotype_counter.count_bam(bam_file, index, stranded, multimapping)
+    (expected_counts, expected_summary) = expected[(stranded, multimapping)]
+    assert dict(zip(index['names'], counts)) == expected_counts
+    assert dict(summary) == { status: expected_summary.get(status, 0) for status in biotype_counter.summary_status }
+
+    ## featureCounts layout
+    out_file = str(tmp_path / 'featureCount.out')
+    biotype_counter.write_results(out_file, bam_file, index, counts, summary)
+    assert read_table(out_file, 6) == expected_counts
+    assert read_table(out_file + '.summary', 1) == dict(summary)
+
+    ## results generated by featureCounts, if available
+    featureCounts_file = os.path.join(data, 'featureCounts_s%s_%s.out' %(stranded, 'multimapping' if multimapping else 'largestOverlap'))
+    if os.path.isfile(featureCounts_file):
+        assert read_table(featureCounts_file, 6) == expected_counts
+        featureCounts_summary = read_table(featureCounts_file + '.summary', 1)
+        assert { status: featureCounts_summary.get(status, 0) for status in summary } == dict(summary)
@@ -0,0 +1,63 @@
+"""
+Expression matrices generated using the cohort store (:func:`XICRA.scripts.generate_DE.generate_DE`)
+must be the same as matrices generated reading all samples (``store=False``) when samples are
+added, analyzed again or removed between runs.
+"""
+import os
+import random
+
+import pandas as pd
+
+from XICRA.scripts import generate_DE
+
+header = ['UID', 'Read', 'miRNA', 'Variant', 'iso_5p', 'iso_3p', 'iso_add3p', 'iso_snp']
+
+def write_mirtop(tsv_file, sample, seed, features=40):
+    """Writes a mirtop.tsv file (miraligner): some UIDs (sequences) shared by several miRNAs and samples."""
+    rng = random.Random(seed)
+    with open(tsv_file, 'w') as out_handle:
+        out_handle.write('\t'.join(header + [sample]) + '\n')
+        for i in range(features):
+            number = rng.randrange(60)
+            uid = 'UID%s' %(number // 2)
+            ## backslash within names is escaped in the store
+            miRNA = 'hsa-miR-%s' %number if number % 7 else 'hsa-miR-%s\\b' %number
+            variant = rng.choice(['', 'iso_3p:-1', 'iso_5p:+1,iso_snp'])
+            out_handle.write('\t'.join([uid, 'ACGT' * (number // 2 % 5 + 4), miRNA, variant, '0', '0', '0', '0',
+                                        str(rng.randrange(1, 500))]) + '\n')
+
+def results(files):
+    return (pd.DataFrame({'name': list(files), 'soft': 'miraligner', 'filename': list(files.values())}))
+
+def generate(files, outfolder, store):
+    os.makedirs(outfolder, exist_ok=True)
+    generate_DE.generate_DE(results(files), False, outfolder, store=store)
+    outputs = {}
+    for suffix in ('', '_dup', '_seq'):
+        with open(os.path.join(outfolder, 'miRNA_expression-miraligner%s.csv' %suffix)) as in_handle:
+            outputs[suffix] = in_handle.read()
+    return (outputs)
+
+def test_cohort_store(tmp_path):
+    files = {}
+    for i in range(3):
+        files['sample_%s' %i] = str(tmp_path / ('sample_%s.tsv' %i))
+        write_mirtop(files['sample_%s' %i], 'sample_%s' %i, i)
+
+    store_folder = str(tmp_path / 'store')
+    assert generate(files, store_folder, True) == generate(files, str(tmp_path / 'fresh_1'), False)
+
+    ## feature not recorded in cohort.json (e.g. interrupted run)
+    with open(os.path.join(store_folder, generate_DE.cohort_folder, 'miraligner', 'features.tsv'), 'a') as out_handle:
+        out_handle.write('hsa-miR-interrupted&NA&UIDx\tUIDx\tACGT\n')
+
+    ## add a sample, analyze a sample again (different results) and remove a sample
+    files['sample_3'] = str(tmp_path / 'sample_3.tsv')
+    write_mirtop(files['sample_3'], 'sample_3', 3)
+    write_mirtop(files['sample_1'], 'sample_1', 10, features=50)
+    del files['sample_0']
+
+    stored = generate(files, store_folder, True)
+    assert stored == generate(files, str(tmp_path / 'fresh_2'), False)
+    assert 'sample_0' not in stored[''] and 'sample_3' in stored['']
+    assert 'interrupted' not in stored[''] + stored['_dup']
@@ -0,0 +1,55 @@
+"""
+In-process isomiR annotation (:mod:`XICRA.scripts.isomiR_annotation`) must generate the same
+gff, counts and export files as the mirtop command line (mirtop gff, counts and export).
+
+Test data are created from the BMC simulation example using ``devel/mirtop_test_data.py``:
+miraligner (seqbuster) results for simulated reads of 20 miRNAs.
+"""
+import os
+import shutil
+import subprocess
+
+import pytest
+
+pytest.importorskip('mirtop')
+mirtop_exe = shutil.which('mirtop')
+pytestmark = pytest.mark.skipif(mirtop_exe is None, reason='mirtop command line is not installed')
+
+from XICRA.scripts import isomiR_annotation
+
+data = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'mirtop')
+hairpin = os.path.join(data, 'hairpin.fa')
+gff = os.path.join(data, 'hsa.gff3')
+mirna_file = os.path.join(data, 'rep_1.mirna')
+
+def mirtop_cli(outdir):
+    """Runs mirtop gff, counts and export as XICRA did before (see XICRA.modules.miRNA.miRTop)."""
+    reference = ['--hairpin', hairpin, '--gtf', gff, '--sps', 'hsa']
+    os.makedirs(outdir)
+    gff_file = os.path.join(outdir, 'gff', 'mirtop.gff')
+    subprocess.run([mirtop_exe, 'gff', '--format', 'seqbuster', '-o', os.path.join(outdir, 'gff'), mirna_file] + reference,
+                   check=True, stderr=subprocess.DEVNULL)
+    subprocess.run([mirtop_exe, 'counts', '-o', os.path.join(outdir, 'counts'), '--gff', gff_file] + reference,
+                   check=True, stderr=subprocess.DEVNULL)
+    subprocess.run([mirtop_exe, 'export', '-o', os.path.join(outdir, 'export'), '--format', 'isomir', gff_file] + reference,
+                   check=True, stderr=subprocess.DEVNULL)
+
+def read(file_given):
+    with open(file_given) as in_handle:
+        return (in_handle.read())
+
+def test_same_as_mirtop_cli(tmp_path):
+    cli = str(tmp_path / 'cli')
+    mirtop_cli(cli)
+
+    xicra = str(tmp_path / 'xicra')
+    for subfolder in ('gff', 'counts', 'export'):
+        os.makedirs(os.path.join(xicra, subfolder))
+    reference = isomiR_annotation.load_reference(hairpin, gff, 'hsa', False)
+    isomiR_annotation.isomiR_annotation(mirna_file, 'seqbuster', reference, xicra)
+
+    for output in ('gff/mirtop.gff', 'counts/mirtop.tsv', 'export/mirtop_rawData.tsv'):
+        assert read(os.path.join(xicra, output)) == read(os.path.join(cli, output)), output
+
+    ## isomiRs annotated for all miRNAs
+    assert len(read(os.path.join(xicra, 'counts/mirtop.tsv')).splitlines()) > 20
@@ -0,0 +1,47 @@
+"""
+Read pairs joined within XICRA (:func:`XICRA.scripts.join_reads.join`) must be the same
+as joined by fastq-join.
+
+Read pairs are a subset of the BMC simulation example. Expected results are generated by
+fastq-join using ``devel/fastq_join_fixture.py``. If they are not available, fastq-join is
+called if installed; otherwise, the test is skipped.
+"""
+import os
+import shutil
+import sys
+
+import pytest
+
+from XICRA.scripts import join_reads
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'devel'))
+import fastq_join_fixture
+
+data = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'fastq_join')
+reads = [ os.path.join(data, 'reads_R%s.fastq' %i) for i in (1, 2) ]
+
+def expected(perc_diff, folder):
+    """Returns files generated by fastq-join: test data, if available, or a new fastq-join call."""
+    files = fastq_join_fixture.expected_files(data, perc_diff)
+    if all([ os.path.isfile(f) for f in files ]):
+        return (files)
+    fastq_join_exe = shutil.which('fastq-join')
+    if not fastq_join_exe:
+        pytest.skip('fastq-join results are not available and fastq-join is not installed')
+    files = fastq_join_fixture.expected_files(folder, perc_diff)
+    fastq_join_fixture.fastq_join(fastq_join_exe, reads, files, perc_diff, os.path.join(folder, 'fastqjoin.log'))
+    return (files)
+
+def read(fastq_file):
+    with open(fastq_file) as in_handle:
+        return (in_handle.read())
+
+@pytest.mark.parametrize('perc_diff', fastq_join_fixture.perc_diffs)
+def test_same_as_fastq_join(tmp_path, perc_diff):
+    expected_outputs = expected(perc_diff, str(tmp_path))
+
+    outputs = [ str(tmp_path / ('xicra_%s.fastq' %name)) for name in ('joined', 'unjoin_R1', 'unjoin_R2') ]
+    assert join_reads.join(reads, outputs[0], outputs[1:], str(tmp_path / 'xicra.log'), perc_diff, 2, False)
+
+    for output, expected_output in zip(outputs, expected_outputs):
+        assert read(output) == read(expected_output), os.path.basename(expected_output)
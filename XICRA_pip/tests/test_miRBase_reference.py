@@ -0,0 +1,58 @@
+"""
+miRBase reference store (:mod:`XICRA.scripts.miRBase_reference`): pre-parsed precursors
+must be the same as parsed by mirtop and files are only checksummed again if their size
+or modification time changed.
+"""
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip('mirtop')
+from mirtop.mirna import fasta
+
+from XICRA.scripts import miRBase_reference
+
+data = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'mirtop')
+
+@pytest.fixture
+def store(tmp_path):
+    raw_files = {'miRNA_gff': os.path.join(data, 'hsa.gff3'), 'hairpinFasta': os.path.join(data, 'hairpin.fa')}
+    for tag in ('matureFasta', 'miRBase_str'):
+        raw_files[tag] = str(tmp_path / tag)
+        shutil.copy(raw_files['hairpinFasta'], raw_files[tag])
+    store_folder = str(tmp_path / 'miRBase' / '22' / 'hsa')
+    miRBase_reference.create_store(store_folder, raw_files, '22', 'hsa', False)
+    return (store_folder)
+
+def test_precursors(store):
+    (database, precursors, matures) = miRBase_reference.load_index(store)
+    expected = fasta.read_precursor(os.path.join(data, 'hairpin.fa'), 'hsa')
+    assert len(precursors) == len(expected) == 20
+    assert dict(precursors) == dict(expected)
+    assert 'hsa-mir-missing' not in precursors
+    assert precursors['hsa-mir-missing'] == ''
+
+def test_checksums(store, monkeypatch):
+    calls = []
+    checksum = miRBase_reference._checksum
+    monkeypatch.setattr(miRBase_reference, '_checksum', lambda f: calls.append(f) or checksum(f))
+
+    ## not changed
+    assert miRBase_reference.check_store(store, False)
+    assert not calls
+
+    ## modification time changed: checksummed once
+    index_file = os.path.join(store, miRBase_reference.index_name)
+    os.utime(index_file, ns=(0, 0))
+    assert miRBase_reference.check_store(store, False)
+    assert calls == [index_file]
+    assert miRBase_reference.check_store(store, False)
+    assert calls == [index_file]
+
+    ## content changed (same size)
+    with open(index_file, 'r+b') as handle:
+        first = handle.read(1)
+        handle.seek(0)
+        handle.write(b' ' if first != b' ' else b'\t')
+    assert miRBase_reference.check_store(store, False) is None
@@ -0,0 +1,72 @@
+"""
+Trimming with extra options: reads streamed between both cutadapt commands
+(:func:`XICRA.modules.trimm.cutadapt_pipe`) must be the same as running both
+commands using intermediate files.
+"""
+import os
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from XICRA.modules import trimm
+
+cutadapt_exe = shutil.which('cutadapt')
+pytestmark = pytest.mark.skipif(cutadapt_exe is None, reason='cutadapt is not installed')
+
+adapter_a = 'TGGAATTCTCGGGTGCCAAGG'
+adapter_A = 'GATCGTCGGACTGTAGAACTCTGAAC'
+extra = '-m 12 -q 20 --max-n 0'
+
+def write_reads(fastq_file, adapter, reads, seed):
+    """Writes reads containing an insert, adapter, low quality tails and N bases."""
+    rng = random.Random(seed)
+    with open(fastq_file, 'w') as out_handle:
+        for i in range(reads):
+            insert = ''.join([ rng.choice('ACGT') for j in range(rng.randrange(8, 40)) ])
+            seq = (insert + adapter + ''.join([ rng.choice('ACGT') for j in range(50) ]))[:60]
+            if rng.random() < 0.1:
+                position = rng.randrange(len(seq))
+                seq = seq[:position] + 'N' + seq[position + 1:]
+            qual = [ rng.randrange(25, 41) for j in seq ]
+            if rng.random() < 0.3:
+                tail = rng.randrange(1, 20)
+                qual[-tail:] = [ rng.randrange(2, 15) for j in range(tail) ]
+            out_handle.write('@read_%s\n%s\n+\n%s\n' %(i, seq, ''.join([ chr(33 + q) for q in qual ])))
+
+def two_pass(reads, adapter_args, outputs, folder):
+    """Previous implementation: adapters trimmed first, then adapters and extra options using intermediate files."""
+    temp = [ os.path.join(folder, 'temp1_trim_R%s.fastq' %(i + 1)) for i in range(len(reads)) ]
+    temp_args = ['-o', temp[0]] + (['-p', temp[1]] if len(reads) == 2 else [])
+    output_args = ['-o', outputs[0]] + (['-p', outputs[1]] if len(reads) == 2 else [])
+    subprocess.run([cutadapt_exe, '-j', '1'] + adapter_args + temp_args + reads, check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([cutadapt_exe] + extra.split() + ['-j', '1'] + adapter_args + output_args + temp,
+                   check=True, stdout=subprocess.DEVNULL)
+
+def read(fastq_file):
+    with open(fastq_file) as in_handle:
+        return (in_handle.read())
+
+@pytest.mark.parametrize('paired', [True, False])
+def test_pipe_same_as_two_pass(tmp_path, paired):
+    reads = [ str(tmp_path / 'reads_R1.fastq') ]
+    write_reads(reads[0], adapter_a, 2000, 1)
+    adapter_args = ['-a', adapter_a]
+    if paired:
+        reads.append(str(tmp_path / 'reads_R2.fastq'))
+        write_reads(reads[1], adapter_A, 2000, 2)
+        adapter_args += ['-A', adapter_A]
+
+    expected = [ str(tmp_path / ('expected_R%s.fastq' %(i + 1))) for i in range(len(reads)) ]
+    two_pass(reads, adapter_args, expected, str(tmp_path))
+
+    outputs = [ str(tmp_path / ('trim_R%s.fastq' %(i + 1))) for i in range(len(reads)) ]
+    output_args = ['-o', outputs[0]] + (['-p', outputs[1]] if paired else [])
+    assert trimm.cutadapt_pipe(cutadapt_exe, reads, 2, adapter_args, output_args, extra,
+                               str(tmp_path / 'cutadapt.log'), False)
+
+    for output, expected_output in zip(outputs, expected):
+        assert read(output) == read(expected_output)
+    ## reads discarded by the extra options
+    assert len(read(outputs[0]).splitlines()) < 4 * 2000